@@ -0,0 +1,153 @@
+import base64
+import random
+from datetime import datetime, timedelta
+
+MERCHANTS = [
+    "STARBUCKS STORE 1234", "WHOLEFDS SFO 10234", "SAFEWAY #1711", "TRADER JOE'S #236", "CHEVRON 0209843",
+    "SHELL OIL 57442196", "UBER *TRIP", "LYFT *RIDE SUN 8PM", "AMAZON MKTPL*2K4TY7", "TARGET 00023451",
+    "COSTCO WHSE #0144", "CVS/PHARMACY #09871", "WALGREENS #3380", "NETFLIX.COM", "SPOTIFY USA",
+    "DOORDASH*CHIPOTLE", "UBER EATS", "BAY CLUB SAN FRANCISCO", "SAKS FIFTH AVENUE", "DELTA AIR LINES",
+    "UNITED AIRLINES", "MARRIOTT SF UNION SQ", "LOWE'S #1029", "HOME DEPOT #0633", "PG&E WEB ONLINE",
+    "COMCAST CALIFORNIA", "APPLE.COM/BILL", "CLEAR CLEARME.COM", "RESY NEW YORK", "BLUE BOTTLE COFFEE",
+]
+
+# Sender, subject and HTML body for each supported bank, written so the bank's parser matches
+FORMATS = {
+    "us_bank": (
+        "U.S. Bank <usbank@notifications.usbank.com>",
+        "New Transaction",
+        "<p>Your U.S. Bank Altitude card was used.</p>"
+        "<p>A charge of ${amount} at {merchant} was approved on your card ending in 4421.</p>",
+    ),
+    "amex": (
+        "American Express <AmericanExpress@welcome.americanexpress.com>",
+        "Large Purchase Approved",
+        "<table><tr><td>Large Purchase Approved:</td><td>{merchant}</td><td>${amount}*</td>"
+        "<td>{weekday}, {month} {day}, {year}</td></tr></table><p>*Amount may change.</p>",
+    ),
+    "bank_of_america": (
+        "Bank of America <onlinebanking@ealerts.bankofamerica.com>",
+        "Credit card transaction exceeds alert limit you set",
+        "<p>Credit card: Customized Cash Rewards ending in 0912</p><p>Amount: ${amount}</p>"
+        "<p>Date: {month} {day}, {year}</p><p>Where: {merchant}</p><p>View details</p>",
+    ),
+    "capital_one": (
+        "Capital One <capitalone@notification.capitalone.com>",
+        "A new transaction was charged to your account",
+        "<p>As requested, we're notifying you that on {month} {day}, {year}, at {merchant}, a pending "
+        "authorization or purchase in the amount of ${amount} was placed or charged on your Venture X card.</p>",
+    ),
+    # Formats no regex understands; in a live run these go to Gemini
+    "unknown": (
+        "Member Alerts <alerts@examplecreditunion.org>",
+        "Card activity notice",
+        "<p>Card activity</p><p>Merchant name - {merchant}</p><p>Amount (USD) - {amount}</p>",
+    ),
+    # Not alerts at all, but the search query matches them; no transaction should come of these
+    "promo": (
+        "Capital One <offers@email.capitalone.com>",
+        "Your October rewards roundup",
+        "<p>Earn 5% back at {merchant} this month.</p><p>Every new transaction counts, and nothing extra "
+        "is charged to your account when you activate the offer.</p>",
+    ),
+}
+# Formats that never produce a ledger row
+NON_TRANSACTION_KINDS = {"unknown", "promo"}
+
+# Default share of each format in a generated corpus
+FORMAT_WEIGHTS = {"us_bank": 0.35, "amex": 0.25, "bank_of_america": 0.15, "capital_one": 0.2, "unknown": 0.05, "promo": 0.1}
+
+# Real alerts are mostly layout: inline styles, tracking pixels and legal footers
+BOILERPLATE_HEAD = "<html><head><style>" + "td{font-family:Helvetica,Arial,sans-serif;color:#333;padding:4px}" * 40 + "</style></head><body>"
+BOILERPLATE_FOOT = (
+    "<table>" + "<tr><td>Please do not reply to this automatically generated email.</td></tr>" * 25 + "</table>"
+    + "<p>" + "This alert is provided for your convenience and does not replace your statement. " * 20 + "</p>"
+    + "<img src=\"https://example.invalid/pixel.gif\" width=\"1\" height=\"1\"></body></html>"
+)
+
+def make_alert(kind, merchant, amount, when):
+    """Returns (sender, subject, html) for one alert of the given format."""
+    sender, subject, template = FORMATS[kind]
+    body = template.format(
+        merchant=merchant, amount=f"{amount:,.2f}", weekday=when.strftime("%a"),
+        month=when.strftime("%b"), day=when.day, year=when.year,
+    )
+    return sender, subject, BOILERPLATE_HEAD + body + BOILERPLATE_FOOT
+
+def make_message(msg_id, sender, subject, html, when):
+    """Builds a Gmail API message resource (format="full") around an HTML body."""
+    def encode(text): return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+    domain = sender.rsplit("@", 1)[-1].rstrip(">")
+    return {
+        "id": msg_id,
+        "threadId": msg_id,
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": "View this alert in an HTML capable client.",
+        "sizeEstimate": len(html) * 4 // 3 + 4096,
+        "payload": {
+            "mimeType": "multipart/alternative",
+            # The transport headers a real alert carries, which dwarf the three the tracker reads
+            "headers": [
+                {"name": "Delivered-To", "value": "bench@example.com"},
+                {"name": "Received", "value": f"by 2002:a05:6a10:{msg_id[-4:]} with SMTP id {msg_id}; {when:%a, %d %b %Y %H:%M:%S} -0700"},
+                {"name": "Received", "value": f"from mta.{domain} (mta.{domain} [192.0.2.25]) by mx.google.com with ESMTPS id {msg_id}"},
+                {"name": "DKIM-Signature", "value": f"v=1; a=rsa-sha256; c=relaxed/relaxed; d={domain}; s=s1; bh={'A' * 44}; b={'B' * 344}"},
+                {"name": "ARC-Authentication-Results", "value": f"i=1; mx.google.com; dkim=pass header.i=@{domain}; spf=pass; dmarc=pass"},
+                {"name": "List-Unsubscribe", "value": f"<https://{domain}/unsubscribe?id={msg_id}>"},
+                {"name": "Message-ID", "value": f"<{msg_id}@{domain}>"},
+                {"name": "MIME-Version", "value": "1.0"},
+                {"name": "To", "value": "bench@example.com"},
+                {"name": "From", "value": sender},
+                {"name": "Subject", "value": subject},
+                {"name": "Date", "value": when.strftime("%a, %d %b %Y %H:%M:%S -0700")},
+            ],
+            "parts": [
+                {"mimeType": "text/plain", "body": {"data": encode("View this alert in an HTML capable client.")}},
+                {"mimeType": "text/html", "body": {"data": encode(html)}},
+            ],
+        },
+    }
+
+class AlertCorpus:
+    """
+    Deterministic synthetic mailbox of bank alerts. Message i always has the same ID,
+    format, merchant, amount and date for a given seed, spread evenly over `years`
+    ending at `end`, so message resources are only built when a benchmark asks for them.
+    """
+
+    def __init__(self, count, seed=1, weights=None, years=3, end=None):
+        self.count = count
+        self.seed = seed
+        self.end = end or datetime(2026, 10, 1, 12, 0)
+        self.span_seconds = int(years * 365 * 86400)
+        weights = weights or FORMAT_WEIGHTS
+        rng = random.Random(seed)
+        self.kinds = rng.choices(list(weights), weights=list(weights.values()), k=count)
+        self.ids = [f"{0x18f0000000000000 + i * 7919:016x}" for i in range(count)]
+
+    def __len__(self):
+        return self.count
+
+    def describe(self, index):
+        """Returns (kind, merchant, amount, datetime) of message index."""
+        rng = random.Random(self.seed * 1000003 + index)
+        merchant = rng.choice(MERCHANTS)
+        amount = round(rng.lognormvariate(3.3, 1.0), 2)
+        when = self.end - timedelta(seconds=self.span_seconds * (self.count - index) // max(self.count, 1))
+        return self.kinds[index], merchant, amount, when
+
+    def sender(self, index):
+        """The From header of message index, without building the message."""
+        return FORMATS[self.kinds[index]][0]
+
+    def message(self, index):
+        kind, merchant, amount, when = self.describe(index)
+        sender, subject, html = make_alert(kind, merchant, amount, when)
+        return make_message(self.ids[index], sender, subject, html, when)
+
+    def ledger_rows(self):
+        """Yields the rows a perfect parse of the parseable messages would put in the ledger."""
+        for index in range(self.count):
+            kind, merchant, amount, when = self.describe(index)
+            if kind in NON_TRANSACTION_KINDS: continue
+            yield {"date": when.strftime("%Y-%m-%d"), "amount": f"{amount:.2f}", "merchant": merchant, "category": "Other"}
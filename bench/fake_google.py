@@ -0,0 +1,274 @@
+import bisect
+import json
+import re
+import threading
+import time
+from datetime import datetime
+
+from googleapiclient.errors import HttpError
+
+class _Response(dict):
+    """Stands in for the httplib2 response HttpError expects."""
+
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "Not Found" if status == 404 else "Error"
+
+def parse_fields(fields):
+    """Parses a partial-response mask ("id,payload(mimeType,body/data)") into {name: submask or None}."""
+    def parse(pos):
+        mask, name = {}, ""
+        while pos < len(fields):
+            c = fields[pos]
+            if c == "(":
+                sub, pos = parse(pos + 1)
+                _merge(mask, name, sub)
+                name = ""
+            elif c == ")":
+                break
+            elif c == ",":
+                if name: _merge(mask, name, None)
+                name = ""
+            else:
+                name += c
+            pos += 1
+        if name: _merge(mask, name, None)
+        return mask, pos
+    return parse(0)[0]
+
+def _merge(mask, path, sub):
+    head, _, rest = path.strip().partition("/")
+    if rest:
+        _merge(mask.setdefault(head, {}), rest, sub)
+    else:
+        mask[head] = sub
+
+def apply_fields(value, mask):
+    """Keeps only the parts of a response a fields mask selects, like the API's partial responses."""
+    if mask is None: return value
+    if isinstance(value, list): return [apply_fields(v, mask) for v in value]
+    if not isinstance(value, dict): return value
+    return {k: apply_fields(v, mask[k]) for k, v in value.items() if k in mask}
+
+class FakeRequest:
+    """A prepared API call. execute() pays one round trip of latency, like googleapiclient."""
+
+    def __init__(self, api, fn):
+        self.api = api
+        self.fn = fn
+
+    def execute(self):
+        self.api.round_trip()
+        return self.fn()
+
+class FakeBatch:
+    """Gmail batch request: one round trip for the whole batch, then a small cost per item."""
+
+    def __init__(self, api, callback):
+        self.api = api
+        self.callback = callback
+        self.items = []
+
+    def add(self, request, request_id=None):
+        self.items.append((request_id, request))
+
+    def execute(self):
+        self.api.round_trip(items=len(self.items))
+        for request_id, request in self.items:
+            try:
+                self.callback(request_id, request.fn(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+class FakeApi:
+    """Latency and call accounting shared by the Gmail and Sheets stand-ins."""
+
+    def __init__(self, latency_ms=0, per_item_ms=0):
+        self.latency = latency_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + n
+
+    def round_trip(self, items=0):
+        self.count("http_requests")
+        delay = self.latency + items * self.per_item
+        if delay: time.sleep(delay)
+
+class FakeGmail(FakeApi):
+    """
+    In-process stand-in for the parts of the Gmail v1 API the tracker uses:
+    users.getProfile, users.messages.list/get, users.history.list and batch requests.
+    Messages come from an AlertCorpus (or anything with ids, message(index) and
+    describe(index)). Of the search operators, list() understands after:, before: and
+    from:(a OR b), which matches the From header case-insensitively.
+    get() honours format="metadata" with metadataHeaders and the fields mask, and counts
+    the JSON bytes it returns as response_bytes.
+
+    With delivered=n only the first n messages are in the mailbox; deliver() adds more.
+    Every delivery is one history record, so history.list from an earlier historyId
+    reports exactly the messages delivered since.
+    """
+
+    def __init__(self, corpus, latency_ms=0, per_item_ms=0, history_id=1000, delivered=None):
+        super().__init__(latency_ms, per_item_ms)
+        self.corpus = corpus
+        self.delivered = len(corpus.ids) if delivered is None else delivered
+        self.index = {msg_id: i for i, msg_id in enumerate(corpus.ids[:self.delivered])}
+        # Message i arrived with historyId first_history_id + i
+        self.first_history_id = history_id - self.delivered + 1
+        self.history_id = history_id
+        self._times = None
+
+    def deliver(self, count):
+        """Moves the next count messages of the corpus into the mailbox."""
+        count = min(count, len(self.corpus.ids) - self.delivered)
+        for i in range(self.delivered, self.delivered + count):
+            self.index[self.corpus.ids[i]] = i
+        self.delivered += count
+        self.history_id += count
+
+    # googleapiclient resource chain: service.users().messages().get(...)
+    def users(self): return self
+    def messages(self): return self
+    def history(self): return _FakeHistory(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def getProfile(self, userId="me"):
+        self.count("users.getProfile")
+        return FakeRequest(self, lambda: {"emailAddress": "bench@example.com", "historyId": str(self.history_id)})
+
+    def _date_range(self, q):
+        """Index range of the messages matching the after:/before: terms of a query (dates or epoch seconds)."""
+        if self._times is None:
+            self._times = [self.corpus.describe(i)[3].timestamp() for i in range(len(self.corpus.ids))]
+        lo, hi = 0, self.delivered
+        for op, value in re.findall(r"\b(after|before):(\S+)", q or ""):
+            if value.isdigit():
+                bound = float(value)
+            else:
+                bound = datetime.strptime(value.replace("/", "-"), "%Y-%m-%d").timestamp()
+            if op == "after": lo = max(lo, bisect.bisect_left(self._times, bound))
+            else: hi = min(hi, bisect.bisect_left(self._times, bound))
+        return lo, max(lo, hi)
+
+    def list(self, userId="me", q=None, pageToken=None, maxResults=100, **kwargs):
+        self.count("messages.list")
+        lo, hi = self._date_range(q)
+        # Newest first, as Gmail returns them
+        indexes = range(hi - 1, lo - 1, -1)
+        senders = re.search(r"\bfrom:\(([^)]*)\)", q or "")
+        if senders:
+            wanted = [t.lower() for t in senders.group(1).split(" OR ")]
+            indexes = [i for i in indexes if any(t in self._sender(i).lower() for t in wanted)]
+        matching = [self.corpus.ids[i] for i in indexes]
+        start = int(pageToken or 0)
+        end = min(start + min(maxResults, 500), len(matching))
+
+        def page():
+            ids = matching[start:end]
+            result = {"messages": [{"id": i, "threadId": i} for i in ids], "resultSizeEstimate": len(ids)}
+            if end < len(matching): result["nextPageToken"] = str(end)
+            return result
+        return FakeRequest(self, page)
+
+    def _sender(self, index):
+        if hasattr(self.corpus, "sender"): return self.corpus.sender(index)
+        headers = self.corpus.message(index)["payload"]["headers"]
+        return next((h["value"] for h in headers if h["name"] == "From"), "")
+
+    def get(self, userId="me", id=None, format="full", **kwargs):
+        self.count("messages.get")
+
+        def message():
+            if id not in self.index:
+                raise HttpError(_Response(404), b'{"error": {"code": 404, "message": "Not Found"}}')
+            msg = self.corpus.message(self.index[id])
+            if format == "metadata":
+                wanted = set(kwargs.get("metadataHeaders") or [])
+                headers = [h for h in msg["payload"]["headers"] if not wanted or h["name"] in wanted]
+                msg = {"id": msg["id"], "threadId": msg["threadId"], "labelIds": msg["labelIds"], "payload": {"headers": headers}}
+            if kwargs.get("fields"): msg = apply_fields(msg, parse_fields(kwargs["fields"]))
+            self.count("response_bytes", len(json.dumps(msg)))
+            return msg
+        return FakeRequest(self, message)
+
+class _FakeHistory:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId="me", startHistoryId=None, pageToken=None, maxResults=100, **kwargs):
+        gmail = self.gmail
+        gmail.count("history.list")
+
+        def page():
+            since = int(startHistoryId)
+            if since < gmail.first_history_id - 1:
+                raise HttpError(_Response(404), b'{"error": {"code": 404, "message": "Requested entity was not found."}}')
+            start = int(pageToken or 0) or since - gmail.first_history_id + 1
+            end = min(start + maxResults, gmail.delivered)
+            result = {
+                "history": [
+                    {"id": str(gmail.first_history_id + i), "messagesAdded": [{"message": {"id": gmail.corpus.ids[i], "labelIds": ["INBOX"]}}]}
+                    for i in range(start, end)
+                ],
+                "historyId": str(gmail.history_id),
+            }
+            if end < gmail.delivered: result["nextPageToken"] = str(end)
+            return result
+        return FakeRequest(gmail, page)
+
+class FakeSheets(FakeApi):
+    """
+    In-process stand-in for spreadsheets.values clear/update/append/batchUpdate/get.
+    The grid is a list of rows for one sheet; cells_written counts what the uploads sent.
+    """
+
+    def __init__(self, latency_ms=0, per_item_ms=0):
+        super().__init__(latency_ms, per_item_ms)
+        self.rows = []
+
+    def spreadsheets(self): return self
+    def values(self): return self
+
+    def _start_row(self, range):
+        cell = range.split("!")[-1].split(":")[0]
+        digits = "".join(c for c in cell if c.isdigit())
+        return int(digits) - 1 if digits else 0
+
+    def _write(self, start, values):
+        if len(self.rows) < start: self.rows.extend([] for _ in range(start - len(self.rows)))
+        self.rows[start:start + len(values)] = [list(v) for v in values]
+        cells = sum(len(v) for v in values)
+        self.count("cells_written", cells)
+        return cells
+
+    def clear(self, spreadsheetId=None, range=None, **kwargs):
+        self.count("values.clear")
+
+        def run():
+            del self.rows[self._start_row(range):]
+            return {}
+        return FakeRequest(self, run)
+
+    def update(self, spreadsheetId=None, range=None, body=None, **kwargs):
+        self.count("values.update")
+        return FakeRequest(self, lambda: {"updatedCells": self._write(self._start_row(range), body["values"])})
+
+    def append(self, spreadsheetId=None, range=None, body=None, **kwargs):
+        self.count("values.append")
+        return FakeRequest(self, lambda: {"updates": {"updatedCells": self._write(len(self.rows), body["values"])}})
+
+    def batchUpdate(self, spreadsheetId=None, body=None, **kwargs):
+        self.count("values.batchUpdate")
+        return FakeRequest(self, lambda: {"totalUpdatedCells": sum(self._write(self._start_row(d["range"]), d["values"]) for d in body["data"])})
+
+    def get(self, spreadsheetId=None, range=None, **kwargs):
+        self.count("values.get")
+        return FakeRequest(self, lambda: {"values": [list(r) for r in self.rows[self._start_row(range):]]})
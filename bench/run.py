@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the tracker. Everything runs against the synthetic corpus in
+bench/corpus.py and the Gmail/Sheets stand-ins in bench/fake_google.py, inside a
+throwaway directory, so the numbers are reproducible without network access.
+
+    python bench/run.py                                  # all benchmarks, 1k and 10k messages
+    python bench/run.py --only sync --sizes 1000 10000 100000 --latency-ms 40
+    python bench/run.py --json bench_results.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+import main
+from bench.corpus import AlertCorpus
+from bench.fake_google import FakeGmail, FakeSheets
+from pkg import aggregate, report, upload_to_sheets
+from pkg.history_sync import get_retry_ids, load_sync_state
+from pkg.store import LEDGER_FIELDS
+
+BENCHMARKS = ("parse", "sync", "backfill", "report", "history", "upload")
+CONFIG_FILES = ("benefits.json", "categories.json", "category_overrides.json")
+
+@contextmanager
+def workdir(args):
+    """Yields (directory, config) for a scratch copy of the tracker's state with absolute paths."""
+    path = tempfile.mkdtemp(prefix="spend_bench_")
+    try:
+        os.makedirs(os.path.join(path, "config"))
+        for name in CONFIG_FILES:
+            shutil.copy(os.path.join(root_dir, "config", name), os.path.join(path, "config", name))
+        with open(os.path.join(root_dir, main.CONFIG_PATH), "r") as f:
+            config = json.load(f)
+        config["paths"] = {key: os.path.join(path, value) for key, value in config["paths"].items()}
+        config.setdefault("pipeline", {}).update({"fetch_workers": args.fetch_workers, "parse_workers": args.parse_workers})
+        config.setdefault("storage", {})["backend"] = args.backend
+        config.setdefault("gmail", {})["metadata_first"] = not args.full_fetch
+        yield path, config
+    finally:
+        if not args.keep: shutil.rmtree(path, ignore_errors=True)
+
+def write_ledger(config, corpus):
+    with open(config["paths"]["transactions_csv"], "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=LEDGER_FIELDS)
+        writer.writeheader()
+        total = 0.0
+        for row in corpus.ledger_rows():
+            total += float(row["amount"])
+            row["cumulative_amount"] = round(total, 2)
+            writer.writerow(row)
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+def bench_parse(size, args):
+    """Regex parse throughput, including base64 decoding and HTML-to-text, on one core."""
+    corpus = AlertCorpus(size, seed=args.seed)
+    messages = [corpus.message(i) for i in range(size)]
+    hits = {}
+    started = time.perf_counter()
+    for i, msg in enumerate(messages):
+        parsed = main.parse_message(msg)
+        kind, merchant, amount, _ = corpus.describe(i)
+        txn = parsed["transaction"]
+        correct = bool(txn) and txn["merchant"] == merchant and float(txn["amount"]) == amount
+        if kind == "promo": correct = not txn
+        entry = hits.setdefault(kind, [0, 0])
+        entry[0] += correct
+        entry[1] += 1
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": round(seconds, 3),
+        "messages_per_second": round(size / seconds),
+        "correct": {kind: f"{ok}/{total}" for kind, (ok, total) in sorted(hits.items())},
+    }
+
+def bench_sync(size, args):
+    """
+    Wall time of a first sync over a mailbox of `size` alerts, then of a sync with no new mail,
+    then of a history sync after the newest alerts arrive. The mailbox spans the last 30 days so
+    the late arrivals fall inside the history sync's one-day query window.
+    """
+    with workdir(args) as (path, config):
+        corpus = AlertCorpus(size, seed=args.seed, years=30 / 365, end=datetime.now())
+        late = max(1, size // 40)
+        gmail = FakeGmail(corpus, args.latency_ms, args.per_item_ms, delivered=size - late)
+        cwd = os.getcwd()
+        os.chdir(path)
+        try:
+            ctx = main.SyncContext(config, build_service=lambda: gmail)
+            try:
+                first, _ = timed(main.run_sync, ctx)
+                calls = dict(gmail.calls)
+                again, _ = timed(main.run_sync, ctx)
+                gmail.deliver(late)
+                history, _ = timed(main.run_sync, ctx)
+            finally:
+                ctx.close()
+        finally:
+            os.chdir(cwd)
+        return {
+            "first_sync_seconds": round(first, 3),
+            "messages_per_second": round((size - late) / first),
+            "no_new_mail_seconds": round(again, 3),
+            "history_sync_seconds": round(history, 3),
+            "history_new_alerts": late,
+            "retry_pending": len(get_retry_ids(load_sync_state(config))),
+            "api_calls": calls,
+        }
+
+def bench_backfill(size, args):
+    """A sharded backfill over the corpus's three years, then the same command again, which finds nothing left."""
+    with workdir(args) as (path, config):
+        corpus = AlertCorpus(size, seed=args.seed)
+        gmail = FakeGmail(corpus, args.latency_ms, args.per_item_ms)
+        cwd = os.getcwd()
+        os.chdir(path)
+        try:
+            ctx = main.SyncContext(config, build_service=lambda: gmail)
+            try:
+                since, until = "2023-09-01", "2026-10-02"
+                first, _ = timed(main.run_backfill, ctx, since, until, workers=args.backfill_workers)
+                calls = dict(gmail.calls)
+                again, _ = timed(main.run_backfill, ctx, since, until, workers=args.backfill_workers)
+            finally:
+                ctx.close()
+        finally:
+            os.chdir(cwd)
+        return {
+            "backfill_seconds": round(first, 3),
+            "messages_per_second": round(size / first),
+            "resume_seconds": round(again, 4),
+            "api_calls": calls,
+        }
+
+def bench_report(size, args):
+    """report.calculate_spending() over a ledger of `size` rows: rollups rebuilt, then up to date."""
+    with workdir(args) as (path, config):
+        config["storage"]["backend"] = "csv"
+        write_ledger(config, AlertCorpus(size, seed=args.seed, weights={"us_bank": 1}))
+        cold, _ = timed(report.calculate_spending, config)
+        warm, _ = timed(report.calculate_spending, config)
+        return {"rebuild_seconds": round(cold, 4), "cached_seconds": round(warm, 4)}
+
+@contextmanager
+def without_numpy():
+    """Makes pkg/aggregate.py take its pure Python path even when NumPy is installed."""
+    saved = aggregate.get_numpy
+    aggregate.get_numpy = lambda: None
+    try:
+        yield
+    finally:
+        aggregate.get_numpy = saved
+
+def bench_history(size, args):
+    """
+    report.calculate_history() over a ledger of `size` rows in pure Python and, when NumPy is
+    installed, vectorized. Exits non-zero if the two paths disagree.
+    """
+    with workdir(args) as (path, config):
+        config["storage"]["backend"] = "csv"
+        write_ledger(config, AlertCorpus(size, seed=args.seed))
+        with without_numpy():
+            python_seconds, expected = timed(report.calculate_history, config)
+        result = {"python_seconds": round(python_seconds, 4)}
+        if aggregate.get_numpy() is None:
+            result["numpy_seconds"] = None
+            return result
+        numpy_seconds, actual = timed(report.calculate_history, config)
+        if actual != expected:
+            raise SystemExit(f"calculate_history() differs with and without NumPy over {size} rows")
+        result.update(numpy_seconds=round(numpy_seconds, 4), identical=True)
+        return result
+
+def bench_upload(size, args):
+    """Sheets upload of a `size` row ledger, then the delta upload after 10 new rows."""
+    with workdir(args) as (path, config):
+        config["storage"]["backend"] = "csv"
+        corpus = AlertCorpus(size + 10, seed=args.seed, weights={"us_bank": 1})
+        rows = list(corpus.ledger_rows())
+        write_ledger(config, AlertCorpus(size, seed=args.seed, weights={"us_bank": 1}))
+        sheets = FakeSheets(args.latency_ms, args.per_item_ms)
+        full, _ = timed(upload_to_sheets.sync_sheet, sheets, config)
+        full_cells = sheets.calls.get("cells_written", 0)
+        with open(config["paths"]["transactions_csv"], "a", newline="") as csvfile:
+            csv.DictWriter(csvfile, fieldnames=LEDGER_FIELDS).writerows(rows[size:])
+        delta, _ = timed(upload_to_sheets.sync_sheet, sheets, config)
+        return {
+            "full_seconds": round(full, 3),
+            "full_cells": full_cells,
+            "delta_seconds": round(delta, 3),
+            "delta_cells": sheets.calls.get("cells_written", 0) - full_cells,
+        }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the spending tracker")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000], help="messages / ledger rows per run")
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated round trip per API request")
+    parser.add_argument("--per-item-ms", type=float, default=0, help="extra simulated time per item in a batch")
+    parser.add_argument("--fetch-workers", type=int, default=2)
+    parser.add_argument("--backfill-workers", type=int, default=4, help="shards processed at once by the backfill benchmark")
+    parser.add_argument("--parse-workers", type=int, default=0, help="0 = one per CPU core")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--full-fetch", action="store_true", help="download every listed message in full instead of metadata first")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directories")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only:
+        bench = globals()[f"bench_{name}"]
+        for size in args.sizes:
+            result = bench(size, args)
+            results.setdefault(name, {})[size] = result
+            print(f"{name:>7} {size:>8}: " + ", ".join(f"{k}={v}" for k, v in result.items()), flush=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the tracker's entry points. Each one is imported in a fresh
+interpreter under `python -X importtime`, and the report shows the wall time of the
+import and the direct imports that cost the most. It fails (exit status 1) when an
+entry point goes over the budget or loads a module that is meant to be imported lazily.
+
+    python bench/startup.py                      # every entry point, 300 ms budget
+    python bench/startup.py --budget-ms 1500     # a Raspberry Pi budget
+    python bench/startup.py --only main --top 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ("main", "pkg.report", "pkg.report_server", "pkg.manual_transaction", "pkg.upload_to_sheets")
+# Imported on first use only; loading one at import time is a regression
+LAZY_MODULES = (
+    "google.genai",
+    "googleapiclient.discovery",
+    "google.auth.transport.requests",
+    "google_auth_oauthlib",
+    "google.oauth2.credentials",
+    "numpy",
+    "bs4",
+)
+MARKER = "-- startup.py import --"
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+sys.stderr.write({marker!r} + "\\n")
+sys.stderr.flush()
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+def parse_importtime(stderr):
+    """Returns [(depth, self_us, cumulative_us, module)] for the imports after the marker."""
+    entries = []
+    lines = stderr.splitlines()
+    if MARKER in lines: lines = lines[lines.index(MARKER) + 1:]
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line: continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # the header line
+        name = parts[2].rstrip()[1:]
+        module = name.lstrip()
+        entries.append(((len(name) - len(module)) // 2, self_us, cumulative_us, module))
+    return entries
+
+def measure(module, top):
+    code = CHILD.format(root=root_dir, marker=MARKER, module=module, lazy=LAZY_MODULES)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=root_dir, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    entries = parse_importtime(proc.stderr)
+    # The entry point's own line closes the list; the lines one level below it are its direct imports
+    direct = sorted((e for e in entries if e[0] == 1), key=lambda e: -e[2])
+    return {
+        "ms": round(result["seconds"] * 1000, 1),
+        "modules": len(entries),
+        "slowest": [(module, round(cumulative / 1000, 1)) for _, _, cumulative, module in direct[:top]],
+        "eager": result["loaded"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the tracker's entry points")
+    parser.add_argument("--only", nargs="+", choices=ENTRY_POINTS, default=list(ENTRY_POINTS))
+    parser.add_argument("--budget-ms", type=float, default=300, help="maximum import time per entry point")
+    parser.add_argument("--top", type=int, default=5, help="direct imports to list per entry point")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per entry point; the fastest counts")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for module in args.only:
+        runs = [measure(module, args.top) for _ in range(max(1, args.repeat))]
+        if "error" in runs[0]:
+            results[module] = runs[0]
+            print(f"{module:>24}: import failed: {runs[0]['error']}", flush=True)
+            failed = True
+            continue
+        result = min(runs, key=lambda r: r["ms"])
+        result["over_budget"] = result["ms"] > args.budget_ms
+        results[module] = result
+        failed = failed or result["over_budget"] or bool(result["eager"])
+        status = "OVER BUDGET" if result["over_budget"] else "ok"
+        print(f"{module:>24}: {result['ms']:>7.1f} ms, {result['modules']} modules, {status}", flush=True)
+        for name, ms in result["slowest"]:
+            print(f"{'':>26}{ms:>7.1f} ms  {name}")
+        if result["eager"]:
+            print(f"{'':>26}imported eagerly: {', '.join(result['eager'])}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
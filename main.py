@@ -1,72 +1,71 @@
 import os.path
+import argparse
 import base64
 import re
 import csv
 import json
+import queue
+import random
+import signal
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from bs4 import BeautifulSoup
-from google import genai
-from google.genai import types
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from functools import partial
+from itertools import zip_longest
+
 from googleapiclient.errors import HttpError
 
+from pkg.accounts import alert_key, drop_cross_account_duplicates, get_account_configs, load_seen_alerts, save_seen_alerts
+from pkg.backfill import BackfillCheckpoint, get_backfill_settings, get_default_until, make_shards, parse_day, shard_query
+from pkg.category_cache import DEFAULT_MAX_ENTRIES, CategoryCache, normalize_merchant
+from pkg.discovery import build_service as build_google_service
+from pkg.gemini import GeminiClient, GeminiParseScheduler
+from pkg.gmail_batch import fetch_alert_messages, fetch_messages, get_batch_size, get_quota_limiter
+from pkg.history_sync import load_sync_state, save_sync_state, get_current_history_id, get_retry_ids, list_added_message_ids, update_retry_ids
+from pkg.keyword_matcher import build_matcher
+from pkg.ledger import CompactLedger, format_cents, parse_cents
+from pkg.metrics import METRICS, StageTimer, write_snapshot
+from pkg.parsers import build_default_registry
+from pkg.pipeline import get_pipeline_settings, run_pipeline
+from pkg.processed_journal import ProcessedJournal
+from pkg.raw_archive import RawArchive, get_archive_path, open_archive
+from pkg.rollups import get_ledger_fingerprint, get_rollups, rebuild_rollups, save_rollups, update_rollups
+from pkg.rules import load_transaction_rules, needs_history_pass, record_history_pass
+from pkg.state import temp_path
+from pkg.store import get_backend, open_store
+from pkg.upload_signal import notify_upload_service
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
-def load_config():
-    with open("config/spend_tracker.json", "r") as f:
-        return json.load(f)
+PARSER_REGISTRY = build_default_registry()
 
-def get_gemini_usage_count(config):
-    today = datetime.now().strftime('%Y-%m-%d')
-    if os.path.exists(config["paths"]["gemini_usage"]):
-        with open(config["paths"]["gemini_usage"], 'r') as f:
-            try:
-                data = json.load(f)
-                if data.get("date") == today:
-                    return data.get("count", 0)
-            except: pass
-    return 0
-
-def increment_gemini_usage(config):
-    today = datetime.now().strftime('%Y-%m-%d')
-    count = get_gemini_usage_count(config) + 1
-    with open(config["paths"]["gemini_usage"], 'w') as f:
-        json.dump({"date": today, "count": count}, f)
+CONFIG_PATH = "config/spend_tracker.json"
 
-def load_category_cache(config):
-    path = config["paths"]["category_cache"]
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            try: return json.load(f)
-            except: return {}
-    return {}
-
-def save_category_cache(config, cache):
-    with open(config["paths"]["category_cache"], "w") as f:
-        json.dump(cache, f, indent=2)
+ALERT_QUERY = (
+    '("Large Purchase" OR "Transaction Alert" OR "new transaction" OR '
+    '"exceeds alert" OR "transaction was charged" OR "transaction charged" OR '
+    '"Single Transaction Alert" OR "charged to your card" OR "charged to your account")'
+)
+# Subjects alerts use across banks; with metadata-first fetching, query hits whose subject
+# matches neither this nor a known bank's alert subject are not downloaded
+ALERT_SUBJECT_PATTERN = r"transaction|purchase|charge|alert|card activity|spent|withdrawal|payment"
+# Mail from a known bank sender is downloaded unless its subject is clearly marketing
+MARKETING_SUBJECT_PATTERN = r"\boffers?\b|rewards|% off|\bsave\b|\bdeals?\b|newsletter|webinar|introducing|pre-?approved|apply now|roundup|survey"
 
-def load_category_overrides(config):
-    path = config["paths"]["category_overrides"]
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            try: return json.load(f)
-            except: return {}
-    return {}
+def load_config():
+    with open(CONFIG_PATH, "r") as f:
+        return json.load(f)
 
-def clean_merchant_name(name):
-    """Cleans up common formatting patterns in merchant names (e.g. 'on [date] at [merchant]')."""
-    if " at " in name:
-        name = name.split(" at ")[-1]
-    name = name.strip(" '\".,")
-    return name
+def load_category_cache(config):
+    max_entries = config.get("category_cache", {}).get("max_entries", DEFAULT_MAX_ENTRIES)
+    return CategoryCache(config["paths"]["category_cache"], max_entries).load()
 
 def load_categories(config):
     """Loads configured categories from categories.json."""
@@ -77,161 +76,185 @@ def load_categories(config):
             except: return {}
     return {}
 
-def get_batch_ai_categories(config, merchants, cache, overrides):
+def get_batch_ai_categories(config, merchants, cache, matcher, gemini):
     """Categorizes multiple merchants in one Gemini call."""
     results = {}
-    to_ask = []
+    to_ask = {}
     for merchant in merchants:
-        merchant_upper = merchant.upper()
-        found = False
-        for pattern, cat in overrides.items():
-            if pattern.upper() in merchant_upper:
-                results[merchant] = cat
-                found = True
-                break
-        if not found:
-            if merchant in cache: results[merchant] = cache[merchant]
-            else: to_ask.append(merchant)
+        # Overrides win, then earlier AI answers, then the categories.json keywords as whole words
+        match = matcher.match(merchant)
+        cached = None if match.override else cache.get(merchant)
+        if match.override: results[merchant] = match.override
+        elif cached: results[merchant] = cached
+        elif match.category: results[merchant] = match.category
+        # Spellings of one merchant ("AMAZON.COM", "Amazon") are asked about once
+        else: to_ask.setdefault(normalize_merchant(merchant), []).append(merchant)
+        source = "override" if match.override else "cache" if cached else "keyword" if match.category else "miss"
+        METRICS.inc("category_lookups", source=source)
     if not to_ask: return results
-    usage = get_gemini_usage_count(config)
-    if usage >= config["daily_limit"]:
-        for m in to_ask: results[m] = "Other"
+    if not gemini or not gemini.get_api_key(): return results
+    if not gemini.available():
+        for spellings in to_ask.values():
+            for m in spellings: results[m] = "Other"
         return results
-    if not os.path.exists(config["paths"]["gemini_key"]): return results
-    with open(config["paths"]["gemini_key"], 'r') as f: api_key = f.read().strip()
     try:
-        client = genai.Client(api_key=api_key)
-        merchant_list = "\n".join([f"- {m}" for m in to_ask])
+        asked = {spellings[0]: spellings for spellings in to_ask.values()}
+        merchant_list = "\n".join([f"- {m}" for m in asked])
         categories = load_categories(config)
         categories_str = ", ".join(list(categories.keys()) + ["Other"])
         prompt = f"Categorize these merchants into one of these exact categories: {categories_str}. Return ONLY a JSON object mapping each merchant to its category.\nMerchants:\n{merchant_list}"
-        response = client.models.generate_content(model='gemini-2.5-flash-lite', contents=prompt, config=types.GenerateContentConfig(response_mime_type='application/json'))
-        increment_gemini_usage(config)
-        if response.text:
-            batch_results = json.loads(response.text.strip())
+        batch_results = gemini.generate_json(prompt)
+        if batch_results:
             for m, cat in batch_results.items():
-                results[m] = cat
-                cache[m] = cat
-            save_category_cache(config, cache)
+                for spelling in asked.get(m, [m]): results[spelling] = cat
+                cache.set(m, cat)
     except:
-        for m in to_ask: results[m] = "Other"
+        for spellings in to_ask.values():
+            for m in spellings: results[m] = "Other"
     return results
 
-def process_transaction_rules(transaction):
-    """Applies custom rules to modify transaction data (e.g., fixed amounts)."""
-    merchant_upper = transaction['merchant'].upper()
-    if "BAY CLUB" in merchant_upper:
-        if transaction['amount'] != "160.00":
-            print(f"  -> Applied rule: Adjusted {transaction['merchant']} amount from ${transaction['amount']} to $160.00")
-            transaction['amount'] = "160.00"
-    return transaction
-
-def parse_with_gemini(config, body):
-    if not os.path.exists(config["paths"]["gemini_key"]): return None
-    usage = get_gemini_usage_count(config)
-    if usage >= config["daily_limit"]: return None
-    with open(config["paths"]["gemini_key"], 'r') as f: api_key = f.read().strip()
-    try:
-        client = genai.Client(api_key=api_key)
-        soup_text = BeautifulSoup(body, 'html.parser').get_text(separator=' ')
-        clean_text = ' '.join(soup_text.split())[:4000] 
-        
-        categories = load_categories(config)
-        categories_str = ", ".join(list(categories.keys()) + ["Other"])
-        
-        prompt = (
-            f"Analyze the following email from a credit card company or bank. "
-            f"Extract the transaction details and return ONLY a JSON object with these keys:\n"
-            f"- 'amount': the transaction amount (string, e.g., '230.42')\n"
-            f"- 'merchant': the clean, friendly name of the merchant (string, e.g., 'Walmart' instead of 'on May. 14, 2026, at Walmart', 'Lowe's' instead of 'on May. 16, 2026, at Lowe's', 'Google' instead of 'Google *fi')\n"
-            f"- 'date': the date of the transaction in YYYY-MM-DD format (extract from email context)\n"
-            f"- 'category': classify the transaction into one of these exact categories: {categories_str}. Choose 'Other' if it doesn't fit any.\n\n"
-            f"Email body:\n{clean_text}"
-        )
-        
-        response = client.models.generate_content(
-            model='gemini-2.5-flash-lite',
-            contents=prompt,
-            config=types.GenerateContentConfig(response_mime_type='application/json')
-        )
-        increment_gemini_usage(config)
-        if response.text:
-            data = json.loads(response.text.strip())
-            if data and all(k in data for k in ['amount', 'merchant', 'date']):
-                data['amount'] = str(data['amount']).replace('$', '').replace(',', '')
-                data['merchant'] = clean_merchant_name(data['merchant'])
-                return data
-    except Exception as e:
-        print(f"Gemini parsing failed: {e}")
-    return None
-
-def parse_email_body(config, body):
-    # 1. Try regex parsing first (fast, free, and no rate limits)
+def parse_email_regex(body, sender="", subject=""):
+    """Tries the known bank formats with regex (fast, free, and no rate limits)."""
     try:
-        soup_text = BeautifulSoup(body, 'html.parser').get_text(separator=' ')
-        clean_soup_text = ' '.join(soup_text.split())
-        
-        # Pattern A: "Amount: $X ... Where: Y" (Bank of America format)
-        match = re.search(r"Amount:\s+\$(?P<amount>[\d,.]+).*?Where:\s+(?P<merchant>[^.\n]+?)(?:\s+View|\s+Date|\.)", clean_soup_text, re.IGNORECASE)
-
-        # Pattern B: Amex Large Purchase format ("Merchant $Amount* Day, Month Date, Year")
-        if not match:
-            match = re.search(r"(?P<merchant>[A-Za-z0-9\s#&-]{2,30}?)\s+\$(?P<amount>[\d,.]+)\*\s+[A-Za-z]{3},\s+[A-Za-z]{3}\s+\d", clean_soup_text, re.IGNORECASE)
-
-        # Pattern C: "Amount: $X ... Merchant: Y" (Amex/forwarded formats)
-        if not match:
-            match = re.search(r"Amount:\s+\$(?P<amount>[\d,.]+).*?Merchant:\s+(?P<merchant>[^.\n]+)", clean_soup_text, re.DOTALL | re.IGNORECASE)
-            
-        # Pattern D: "at Y, a pending ... amount of $X" (Capital One)
-        if not match:
-            match = re.search(r"at\s+(?P<merchant>.+?),\s+a\s+pending.*?amount\s+of\s+\$(?P<amount>[\d,.]+)", clean_soup_text, re.IGNORECASE)
-
-        # Pattern E: Generic Fallback (Matches "$10.00 at Starbucks", "charged $88.18 at Lowe's")
-        if not match:
-            match = re.search(r"\$(?P<amount>[\d,.]+)\s+at\s+(?P<merchant>[^.]{2,40}?)(?:\s+on|\.|\s+at|\s+ending|\s+card|\s+for|\s+date|\s+was|\s+approved)", clean_soup_text, re.IGNORECASE)
-            
-        if not match:
-            match = re.search(r"\$(?P<amount>[\d,.]+).*?at\s+(?P<merchant>[^.]{2,40}?)(?:\s+on|\.|\s+at|\s+ending|\s+card|\s+for|\s+date|\s+was|\s+approved)", clean_soup_text, re.IGNORECASE)
-
-        if match:
-            res = match.groupdict()
-            res['amount'] = res['amount'].replace(',', '')
-            res['merchant'] = clean_merchant_name(' '.join(res['merchant'].split()))
-            return res
+        return PARSER_REGISTRY.parse(body, sender, subject)
     except Exception as e:
         print(f"Regex parsing failed: {e}")
-        pass
-
-    # 2. Fall back to Gemini only if regex fails
-    # Since the free tier is limited to 15 Requests Per Minute (RPM), we introduce a 4.1s delay
-    import time
-    time.sleep(4.1)
-    return parse_with_gemini(config, body)
+        return None, None
+
+def get_html_body(p):
+    if p.get("mimeType") == "text/html" and p.get("body", {}).get("data"):
+        return base64.urlsafe_b64decode(p["body"]["data"]).decode("utf-8")
+    if "parts" in p:
+        for part in p["parts"]:
+            b = get_html_body(part)
+            if b: return b
+    return ""
 
-def get_email_date(headers):
+def get_header(headers, name):
     for h in headers:
-        if h["name"] == "Date": return h["value"]
+        if h["name"] == name: return h["value"]
     return ""
 
+def get_alert_senders(config):
+    """The bank parsers' sender domains plus gmail.alert_senders."""
+    senders = [s for p in PARSER_REGISTRY.parsers for s in p.senders]
+    return list(dict.fromkeys(senders + [s.lower() for s in config.get("gmail", {}).get("alert_senders", [])]))
+
+def get_alert_classifier(config, prefix=""):
+    """
+    Returns is_candidate(headers) for metadata-first fetching, or None when gmail.metadata_first
+    is off. A message is downloaded when its subject matches a bank parser's alert subject or
+    gmail.alert_subject_pattern, its sender contains one of gmail.alert_senders, or it comes
+    from a bank parser's sender and its subject is not gmail.marketing_subject_pattern.
+    Anything else the broad query matched (newsletters and offers quoting "new transaction")
+    is not, and its subject is printed so a missed alert format shows up in the log.
+    """
+    settings = config.get("gmail", {})
+    if not settings.get("metadata_first", True): return None
+    subject_re = re.compile(settings.get("alert_subject_pattern", ALERT_SUBJECT_PATTERN), re.IGNORECASE)
+    marketing_re = re.compile(settings.get("marketing_subject_pattern", MARKETING_SUBJECT_PATTERN), re.IGNORECASE)
+    senders = tuple(s.lower() for s in settings.get("alert_senders", []))
+
+    def is_candidate(headers):
+        subject = get_header(headers, "Subject")
+        if subject_re.search(subject) or any(p.matches_subject(subject) for p in PARSER_REGISTRY.parsers): return True
+        sender = get_header(headers, "From").lower()
+        if any(s in sender for s in senders): return True
+        if any(p.matches_sender(sender) for p in PARSER_REGISTRY.parsers) and not marketing_re.search(subject): return True
+        print(f"{prefix}  -> Skipped non-alert from {get_header(headers, 'From')}: '{subject}'")
+        return False
+    return is_candidate
+
+def list_known_sender_ids(service, query, config, limiter=None):
+    """IDs matching query that come from a bank sender; they are fetched without the metadata request."""
+    return set(list_query_message_ids(service, f"{query} from:({' OR '.join(get_alert_senders(config))})", limiter))
+
+def parse_message(msg, keep_body=False):
+    """Decodes a fetched message and runs the regex parsers. Runs in the parse worker pool."""
+    payload = msg["payload"]
+    body = get_html_body(payload)
+    if not body and "body" in payload and payload["body"].get("data"):
+        body = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
+    headers = payload.get("headers", [])
+    transaction, parse_info = parse_email_regex(body, get_header(headers, "From"), get_header(headers, "Subject"))
+    return {
+        "headers": headers,
+        "transaction": transaction,
+        "parse_info": parse_info,
+        # Only ship the body back to the committer when Gemini or the archive needs it
+        "body": None if transaction and not keep_body else body,
+    }
+
+def get_email_date(headers):
+    return get_header(headers, "Date")
+
+def finalize_transaction(transaction, headers, msg_id, rules):
+    """
+    Falls back to the email date and applies the merchant cleanup and transaction rules.
+    Returns the transaction's ledger rows: none if a rule ignores it, several if one splits it.
+    """
+    if "date" not in transaction:
+        try:
+            raw_date = get_email_date(headers)
+            clean_date = re.sub(r'\s*\([^)]*\)', '', raw_date).strip()
+            date_obj = datetime.strptime(clean_date, '%a, %d %b %Y %H:%M:%S %z')
+            transaction["date"] = date_obj.strftime('%Y-%m-%d')
+        except: transaction["date"] = datetime.now().strftime('%Y-%m-%d')
+    transaction['msg_id'] = msg_id
+    return rules.apply(transaction)
+
+def get_ledger_row(transactions):
+    """What the archive records for a message: its ledger row, the rows it was split into, or None."""
+    rows = [{k: t[k] for k in ("date", "amount", "merchant")} for t in transactions]
+    if not rows: return None
+    return rows[0] if len(rows) == 1 else rows
+
 def load_benefits(config):
     with open(config["paths"]["benefits"], "r") as f: return json.load(f)
 
-def check_benefits(transaction, benefits):
-    for card, card_benefits in benefits.items():
-        for benefit, details in card_benefits.items():
-            for keyword in details["keywords"]:
-                if keyword.lower() in transaction["merchant"].lower():
-                    print(f"  -> Found transaction for '{benefit}' credit on your {card} card.")
-                    return
-
-def load_processed_messages(config):
-    if os.path.exists(config["paths"]["processed_messages"]):
-        with open(config["paths"]["processed_messages"], "r") as f: return set(f.read().splitlines())
-    return set()
+def check_benefits(transaction, matcher):
+    hits = matcher.match(transaction["merchant"]).benefits
+    if hits:
+        card, benefit = hits[0]
+        print(f"  -> Found transaction for '{benefit}' credit on your {card} card.")
+
+def get_after_date_filter(config):
+    """Builds an 'after:' filter from the latest transaction date in the ledger."""
+    if get_backend(config) == "sqlite":
+        store = open_store(config)
+        latest = store.get_latest_date()
+        store.close()
+        return f" after:{latest}" if latest else ""
+    csv_path = config["paths"]["transactions_csv"]
+    if os.path.exists(csv_path):
+        with open(csv_path, "r", newline="") as csvfile:
+            reader = csv.DictReader(csvfile)
+            dates = [r["date"] for r in reader if r.get("date")]
+            if dates:
+                try:
+                    latest_date = max(datetime.strptime(d, "%Y-%m-%d") for d in dates)
+                    return f" after:{latest_date.strftime('%Y-%m-%d')}"
+                except Exception as e:
+                    print(f"Failed to parse dates from CSV: {e}")
+    return ""
 
-def save_processed_messages(config, processed_ids):
-    with open(config["paths"]["processed_messages"], "w") as f:
-        for msg_id in processed_ids: f.write(f"{msg_id}\n")
+def list_query_message_ids(service, query, limiter=None):
+    message_ids = []
+    next_page_token = None
+    while True:
+        # A list page costs the same quota as one messages.get
+        if limiter: limiter.acquire()
+        with METRICS.time("gmail_list_seconds", call="messages"):
+            results = service.users().messages().list(
+                userId="me",
+                q=query,
+                pageToken=next_page_token
+            ).execute()
+        message_ids.extend(m["id"] for m in results.get("messages", []))
+        next_page_token = results.get("nextPageToken")
+        if not next_page_token:
+            break
+    return message_ids
 
 def process_recurring_expenses(config, processed_ids, benefits):
     """Checks for recurring expenses that should be logged today."""
@@ -265,158 +288,694 @@ def process_recurring_expenses(config, processed_ids, benefits):
 
     return to_log
 
-def main():
-    config = load_config()
+def save_transactions_csv(config, temp_list, cache, matcher, gemini):
+    """
+    Adds new rows to transactions.csv, then cleans, dedups, categorizes and sorts the whole
+    ledger. The pass runs over a CompactLedger, so merchant cleanup, rules, categorization
+    and benefit matching cost one call per distinct merchant rather than one per row.
+    The history only goes through the rules again when they changed since the last pass,
+    or the ledger was edited by something else; otherwise only the new rows do.
+    """
+    previous_fingerprint = get_ledger_fingerprint(config)
+    csv_path = config["paths"]["transactions_csv"]
+    if not os.path.exists(csv_path) and not temp_list: return
+    ledger = CompactLedger.load_csv(csv_path) if os.path.exists(csv_path) else CompactLedger()
+    first_new = len(ledger)
+    for t in temp_list:
+        ledger.append(t['date'], t['amount'], t['merchant'], t.get('category', ''))
+    if not len(ledger): return
+
+    rules = load_transaction_rules(config)
+    start = 0 if needs_history_pass(config, rules, previous_fingerprint) else first_new
+    if start == 0 and first_new: print("Applying the transaction rules to the whole ledger...")
+    history_changed, adjusted, ignored = ledger.normalize(rules.history_fix, first_new, start)
+    for merchant, old_cents, new_cents in adjusted:
+        print(f"  -> Applied rule: Adjusted {merchant} amount from ${format_cents(old_cents)} to ${format_cents(new_cents)}")
+    if ignored: print(f"  -> Applied rule: Ignored {len(ignored)} rows")
+    kept, duplicates = ledger.dedup_sorted(ignored)
+    if any(i < first_new for i in duplicates): history_changed = True
+
+    # Now get the unique set of merchants that need categorization
+    blank = {ledger.category_index[c] for c in ("", "Other") if c in ledger.category_index}
+    codes = ledger.merchant_codes
+    to_cat = {codes[i] for i in kept if ledger.category_codes[i] in blank}
+    batch_cats = get_batch_ai_categories(config, [ledger.merchants[c] for c in to_cat], cache, matcher, gemini)
+    assigned = {c: ledger.intern_category(batch_cats.get(ledger.merchants[c], 'Other')) for c in to_cat}
+    for i in kept:
+        if ledger.category_codes[i] in blank:
+            ledger.category_codes[i] = assigned[codes[i]]
+
+    benefit_notes = {}
+    for i in kept:
+        code = codes[i]
+        if code not in benefit_notes:
+            hits = matcher.match(ledger.merchants[code]).benefits
+            benefit_notes[code] = f"  -> Found transaction for '{hits[0][1]}' credit on your {hits[0][0]} card." if hits else None
+        if benefit_notes[code]: print(benefit_notes[code])
+    with METRICS.time("ledger_write_seconds", backend="csv"):
+        ledger.write_csv(csv_path, kept)
+    dropped = set(duplicates) | ignored
+    new_rows = [ledger.row(i) for i in range(first_new, len(ledger)) if i not in dropped]
+    update_rollups(config, new_rows, previous_fingerprint, history_changed)
+    record_history_pass(config, rules, get_ledger_fingerprint(config))
+
+def remove_csv_rows(config, rows):
+    """
+    Drops one occurrence of each (date, amount, merchant) in rows from transactions.csv.
+    Amounts are compared in cents ("12.5" was written as "12.50") and merchants after the
+    transaction rules, which may have renamed or re-priced the row since it was recorded.
+    """
+    csv_path = config["paths"]["transactions_csv"]
+    if not rows or not os.path.exists(csv_path): return
+    rules = load_transaction_rules(config)
+
+    def row_key(row):
+        merchant, cents, _, _ = rules.history_fix(row['merchant'])
+        if cents is None:
+            try: cents = parse_cents(row['amount'])
+            except (ValueError, TypeError): cents = row['amount']
+        return (row['date'], cents, merchant)
+    to_remove = Counter(row_key(r) for r in rows)
+    with open(csv_path, "r", newline="") as csvfile:
+        reader = csv.DictReader(csvfile)
+        fieldnames = reader.fieldnames
+        kept = []
+        for row in reader:
+            key = row_key(row)
+            if to_remove[key]: to_remove[key] -= 1
+            else: kept.append(row)
+    tmp_path = temp_path(csv_path)
+    with open(tmp_path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(kept)
+    os.replace(tmp_path, csv_path)
+
+def save_transactions_sqlite(config, temp_list, cache, matcher, gemini, replace_ids=None):
+    """
+    Inserts new rows into the SQLite store and categorizes what is still uncategorized.
+    With replace_ids, the stored rows of those messages are replaced by temp_list instead.
+    When the transaction rules changed since the last pass, the stored rows are brought in
+    line with them, one statement per merchant.
+    """
+    store = open_store(config)
+    rules = load_transaction_rules(config)
+    history_fixed = 0
+    try:
+        with METRICS.time("ledger_write_seconds", backend="sqlite"):
+            if replace_ids is None:
+                inserted = store.add_transactions(temp_list)
+            else:
+                inserted = store.replace_transactions(replace_ids, temp_list)
+            if needs_history_pass(config, rules):
+                def fix(merchant):
+                    merchant, cents, category, ignore = rules.history_fix(merchant)
+                    return merchant, None if cents is None else format_cents(cents), category, ignore
+                history_fixed = store.apply_fixes(fix)
+                if history_fixed: print(f"Applied the transaction rules to {history_fixed} stored rows.")
+                record_history_pass(config, rules)
+        for row in inserted:
+            check_benefits(row, matcher)
+        merchants_to_cat = store.get_uncategorized_merchants()
+        batch_cats = get_batch_ai_categories(config, merchants_to_cat, cache, matcher, gemini) if merchants_to_cat else {}
+        recategorized = store.set_categories({m: batch_cats.get(m, 'Other') for m in merchants_to_cat})
+        # Keep transactions.csv around for the uploader, Home Assistant and older tools
+        if config.get("storage", {}).get("export_csv", True) and (inserted or recategorized or history_fixed or replace_ids is not None or not os.path.exists(config["paths"]["transactions_csv"])):
+            with METRICS.time("ledger_write_seconds", backend="csv_export"):
+                store.export_csv(config["paths"]["transactions_csv"])
+    finally:
+        store.close()
+    # Fold the inserted rows into the report rollups. Replaced rows can reuse their old ids,
+    # and rows changed by the rules keep theirs, so the ledger fingerprint may not change;
+    # rebuild the rollups outright then.
+    if replace_ids is None and not history_fixed:
+        get_rollups(config)
+    else:
+        save_rollups(config, rebuild_rollups(config))
+
+def save_transactions(config, temp_list, cache, matcher, gemini):
+    if get_backend(config) == "sqlite":
+        save_transactions_sqlite(config, temp_list, cache, matcher, gemini)
+    else:
+        save_transactions_csv(config, temp_list, cache, matcher, gemini)
+
+def get_credentials(config):
+    # Only the parts of the OAuth stack a run needs are imported: refreshing a token pulls in
+    # requests and the first sign-in pulls in oauthlib, neither of which an hourly run needs
+    from google.oauth2.credentials import Credentials
     creds = None
     if os.path.exists(config["paths"]["token"]): creds = Credentials.from_authorized_user_file(config["paths"]["token"], SCOPES)
     if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token: creds.refresh(Request())
+        if creds and creds.expired and creds.refresh_token:
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
         else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
             flow = InstalledAppFlow.from_client_secrets_file(config["paths"]["credentials"], SCOPES)
             creds = flow.run_local_server(port=8080)
         with open(config["paths"]["token"], "w") as token: token.write(creds.to_json())
-
-    service = build("gmail", "v1", credentials=creds)
-    benefits = load_benefits(config)
-    cache = load_category_cache(config)
-    overrides = load_category_overrides(config)
-    processed_message_ids = load_processed_messages(config)
-    new_found = False
+    return creds
+
+class Account:
+    """
+    One Gmail mailbox: its authorized clients, its processed-message journal and, through
+    the paths in its config view, its token and sync checkpoint.
+    """
+
+    def __init__(self, name, config, build_service=None):
+        self.name = name
+        self.config = config
+        if not build_service and not os.path.exists(config["paths"]["token"]) and name != "default":
+            print(f"Sign in to the Gmail account for '{name}'.")
+        self.creds = None if build_service else get_credentials(config)
+        self.build_service = build_service or (lambda: build_google_service("gmail", "v1", self.creds, config))
+        self.service = self.build_service()
+        self.worker_services = []
+        self.processed = ProcessedJournal(config)
+
+    @property
+    def prefix(self):
+        return "" if self.name == "default" else f"[{self.name}] "
+
+    def refresh_credentials(self):
+        if self.creds and not self.creds.valid and self.creds.expired and self.creds.refresh_token:
+            from google.auth.transport.requests import Request
+            self.creds.refresh(Request())
+            with open(self.config["paths"]["token"], "w") as token: token.write(self.creds.to_json())
+
+    def get_service_factory(self, count):
+        """Returns a factory handing each fetch worker its own long-lived Gmail client."""
+        while len(self.worker_services) < count:
+            self.worker_services.append(self.build_service())
+        services = iter(self.worker_services[:count])
+        return lambda: next(services)
+
+    def close(self):
+        self.processed.wait()
+
+class SyncContext:
+    """
+    Everything a sync run needs that is expensive to set up: the Gmail accounts, the rule
+    files, the category cache, the Gemini client and the parse worker pool. The accounts
+    share everything except their credentials, checkpoints and processed-message journals.
+    A one-shot run builds it once; the daemon keeps it across cycles and only reloads
+    config files whose mtime changed. build_service replaces the authorized Gmail client
+    builder, e.g. with the local stand-in in bench/.
+    """
+
+    def __init__(self, config=None, build_service=None):
+        self.config = config or load_config()
+        self.build_service = build_service
+        self.accounts = self.load_accounts()
+        self.parse_pool = None
+        self.mtimes = {}
+        self.load_rules()
+        self.cache = load_category_cache(self.config)
+        self.gemini = GeminiClient(self.config)
+
+    def load_accounts(self):
+        return [Account(name, config, self.build_service) for name, config in get_account_configs(self.config)]
+
+    def watched_files(self):
+        paths = self.config["paths"]
+        return [
+            CONFIG_PATH, paths["benefits"], paths.get("categories", "config/categories.json"), paths["category_overrides"],
+            paths.get("transaction_rules", "config/transaction_rules.json"),
+        ]
+
+    def get_mtime(self, path):
+        try: return os.stat(path).st_mtime_ns
+        except OSError: return None
+
+    def load_rules(self):
+        self.benefits = load_benefits(self.config)
+        self.categories = load_categories(self.config)
+        self.matcher = build_matcher(self.config)
+        self.transaction_rules = load_transaction_rules(self.config)
+        self.mtimes = {path: self.get_mtime(path) for path in self.watched_files()}
+
+    def reload_if_changed(self):
+        changed = [path for path, mtime in self.mtimes.items() if self.get_mtime(path) != mtime]
+        if not changed: return
+        print(f"Reloading changed config files: {', '.join(changed)}")
+        if CONFIG_PATH in changed:
+            self.config = load_config()
+            self.gemini = GeminiClient(self.config)
+            self.close()
+            self.accounts = self.load_accounts()
+        self.load_rules()
+
+    def get_parse_pool(self):
+        _, parse_workers, _ = get_pipeline_settings(self.config)
+        if parse_workers > 1 and self.parse_pool is None:
+            self.parse_pool = ProcessPoolExecutor(max_workers=parse_workers)
+        return self.parse_pool
+
+    def close(self):
+        for account in self.accounts:
+            account.close()
+        if self.parse_pool:
+            self.parse_pool.shutdown(cancel_futures=True)
+            self.parse_pool = None
+
+def sync_account(ctx, account, parse_fn):
+    """
+    Lists one mailbox's new alerts and fetches and parses them. Accounts run on their own
+    threads and share the parse pool; everything after parsing happens in run_sync.
+    Alerts an earlier run could not parse are fetched again along with the new ones.
+    Returns {"committed": [(msg_id, parsed)], "fetch_failed": [...], "to_fetch": [...], "history_id": ...}.
+    """
+    config = account.config
+    service = account.service
+    prefix = account.prefix
+    account.refresh_credentials()
+    sync_state = load_sync_state(config)
+    message_ids = None
+    new_history_id = None
+    query = ALERT_QUERY
+    if config.get("sync", {}).get("mode", "history") == "history" and sync_state.get("history_id"):
+        added = list_added_message_ids(service, sync_state["history_id"])
+        if added is None:
+            print(f"{prefix}History checkpoint expired. Falling back to a full query sync.")
+        else:
+            added_ids, new_history_id = added
+            message_ids = []
+            if added_ids:
+                # History covers all mail, so keep only the new messages that match the alert query
+                added_set = set(added_ids)
+                since = max(0, sync_state.get("synced_at", 0) - 86400)
+                query = f"{ALERT_QUERY} after:{since}"
+                message_ids = [m for m in list_query_message_ids(service, query) if m in added_set]
+            print(f"{prefix}History sync: {len(added_ids)} new messages, {len(message_ids)} matching alerts.")
+
+    if message_ids is None:
+        # Take the checkpoint before listing so nothing that arrives meanwhile is missed
+        new_history_id = get_current_history_id(service)
+        after_date_str = get_after_date_filter(config)
+        if after_date_str:
+            query += after_date_str
+            print(f"{prefix}Restricting search query with date: {after_date_str}")
+        message_ids = list_query_message_ids(service, query)
+
+    to_fetch = [m for m in message_ids if m not in account.processed.ids]
+    listed = set(to_fetch)
+    retry = [m for m in get_retry_ids(sync_state) if m not in listed and m not in account.processed.ids]
+    if retry:
+        print(f"{prefix}Retrying {len(retry)} alerts that could not be parsed before.")
+        to_fetch = retry + to_fetch
+    METRICS.inc("messages_listed", len(message_ids))
+    METRICS.inc("messages_to_fetch", len(to_fetch))
+    fetch_failed = []
+    committed = []
+    if to_fetch:
+        print(f"{prefix}Fetching {len(to_fetch)} new messages in batches of {get_batch_size(config)}...")
+
+    def commit(msg_id, parsed):
+        if not parsed:
+            fetch_failed.append(msg_id)
+            return
+        print(f"DEBUG: {prefix}Processing email with subject: '{get_header(parsed['headers'], 'Subject')}' (ID: {msg_id})")
+        committed.append((msg_id, parsed))
+
+    is_candidate = get_alert_classifier(config, prefix)
+    known = list_known_sender_ids(service, query, config) if is_candidate and to_fetch else set()
+    fetch_workers, _, _ = get_pipeline_settings(config)
+    run_pipeline(config, account.get_service_factory(fetch_workers), to_fetch, parse_fn, commit, ctx.get_parse_pool(), is_candidate, known)
+    skipped = len(to_fetch) - len(committed) - len(fetch_failed)
+    if skipped: print(f"{prefix}Skipped {skipped} messages whose headers are not a transaction alert.")
+    return {"committed": committed, "fetch_failed": fetch_failed, "to_fetch": to_fetch, "history_id": new_history_id}
+
+def run_account_syncs(ctx, parse_fn):
+    """Runs sync_account for every account at once. Accounts whose listing fails are left out."""
+    def run(account):
+        try:
+            return sync_account(ctx, account, parse_fn)
+        except HttpError as e:
+            print(f"{account.prefix}Error: {e}")
+            METRICS.inc("run_errors")
+            return None
+    if len(ctx.accounts) == 1:
+        results = [run(ctx.accounts[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(ctx.accounts)) as executor:
+            results = list(executor.map(run, ctx.accounts))
+    return [(account, result) for account, result in zip(ctx.accounts, results) if result is not None]
+
+def run_sync(ctx):
+    """
+    Runs one sync: recurring expenses, new Gmail alerts from every account, categorization
+    and one ledger update for all of them.
+    """
+    config = ctx.config
+    cache = ctx.cache
+    matcher = ctx.matcher
+    gemini = ctx.gemini
+    # Recurring expenses are journaled with the first account, so they are logged once
+    primary = ctx.accounts[0]
+    archive = open_archive(config)
+    METRICS.reset()
+    stages = StageTimer(METRICS)
 
     try:
         temp_list = []
+        journal = {account.name: [] for account in ctx.accounts}
 
         # --- Handle Recurring Expenses ---
-        recurring_to_log = process_recurring_expenses(config, processed_message_ids, benefits)
+        recurring_to_log = process_recurring_expenses(config, primary.processed.ids, ctx.benefits)
         for transaction in recurring_to_log:
             temp_list.append(transaction)
-            new_found = True
-
-        after_date_str = ""
-        csv_path = config["paths"]["transactions_csv"]
-        if os.path.exists(csv_path):
-            with open(csv_path, "r", newline="") as csvfile:
-                reader = csv.DictReader(csvfile)
-                dates = [r["date"] for r in reader if r.get("date")]
-                if dates:
-                    try:
-                        latest_date = max(datetime.strptime(d, "%Y-%m-%d") for d in dates)
-                        after_date_str = f" after:{latest_date.strftime('%Y-%m-%d')}"
-                    except Exception as e:
-                        print(f"Failed to parse dates from CSV: {e}")
-
-        query = (
-            '("Large Purchase" OR "Transaction Alert" OR "new transaction" OR '
-            '"exceeds alert" OR "transaction was charged" OR "transaction charged" OR '
-            '"Single Transaction Alert" OR "charged to your card" OR "charged to your account")'
-        )
-        if after_date_str:
-            query += after_date_str
-            print(f"Restricting search query with date: {after_date_str}")
-        
-        messages = []
-        next_page_token = None
-        while True:
-            results = service.users().messages().list(
-                userId="me", 
-                q=query, 
-                pageToken=next_page_token
-            ).execute()
-            messages.extend(results.get("messages", []))
-            next_page_token = results.get("nextPageToken")
-            if not next_page_token:
-                break
-
-        for message in messages:
-            if message["id"] in processed_message_ids: continue
-            msg = service.users().messages().get(userId="me", id=message["id"], format="full").execute()
-            payload = msg["payload"]
-            
-            subject = ""
-            for h in payload.get("headers", []):
-                if h["name"] == "Subject":
-                    subject = h["value"]
-                    break
-            print(f"DEBUG: Processing email with subject: '{subject}' (ID: {message['id']})")
-            
-            def get_html_body(p):
-                if p.get("mimeType") == "text/html" and p.get("body", {}).get("data"):
-                    return base64.urlsafe_b64decode(p["body"]["data"]).decode("utf-8")
-                if "parts" in p:
-                    for part in p["parts"]:
-                        b = get_html_body(part)
-                        if b: return b
-                return ""
-            
-            body = get_html_body(payload)
-            if not body and "body" in payload and payload["body"].get("data"):
-                body = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
-            transaction = parse_email_body(config, body)
-            if transaction:
-                transaction = process_transaction_rules(transaction)
-                transaction['merchant'] = clean_merchant_name(transaction['merchant'])
-                if "date" not in transaction:
-                    try:
-                        raw_date = get_email_date(payload["headers"])
-                        clean_date = re.sub(r'\s*\([^)]*\)', '', raw_date).strip()
-                        date_obj = datetime.strptime(clean_date, '%a, %d %b %Y %H:%M:%S %z')
-                        transaction["date"] = date_obj.strftime('%Y-%m-%d')
-                    except: transaction["date"] = datetime.now().strftime('%Y-%m-%d')
-                transaction['msg_id'] = message["id"]
-                temp_list.append(transaction)
-                new_found = True
-
+            journal[primary.name].append(transaction['msg_id'])
+        stages.lap("recurring")
+
+        parse_fn = partial(parse_message, keep_body=True) if archive else parse_message
+        runs = run_account_syncs(ctx, parse_fn)
+        stages.lap("fetch_parse")
+
+        # Emails no regex understood are parsed together in as few Gemini requests as possible
+        ai_parser = GeminiParseScheduler(gemini, ctx.categories)
+        for account, run in runs:
+            for msg_id, parsed in run["committed"]:
+                if parsed["parse_info"]: PARSER_REGISTRY.record(parsed["parse_info"])
+                if not parsed["transaction"]: ai_parser.submit(msg_id, parsed["body"])
+        ai_results, ai_unparsed = ai_parser.flush() if ai_parser.queue else ({}, [])
+        # Alerts booked by earlier runs count too: a forwarded copy can arrive a run later
+        shared = len(ctx.accounts) > 1
+        seen = load_seen_alerts(config) if shared else {}
+        for account, run in runs:
+            found = []
+            parsed_ids = []  # includes alerts a rule ignored, so they are not fetched again
+            for msg_id, parsed in run["committed"]:
+                transaction = parsed["transaction"]
+                gemini_result = None
+                if not transaction and ai_results.get(msg_id):
+                    transaction = ai_results[msg_id]
+                    gemini_result = dict(transaction)
+                rows = finalize_transaction(transaction, parsed["headers"], msg_id, ctx.transaction_rules) if transaction else []
+                found.extend(rows)
+                if transaction: parsed_ids.append(msg_id)
+                if archive:
+                    archive.add(msg_id, parsed["headers"], parsed["body"])
+                    archive.set_result(msg_id, get_ledger_row(rows), gemini_result)
+            # The same alert forwarded to several inboxes is only booked for the first account
+            kept, duplicates = drop_cross_account_duplicates(seen, account.name, found)
+            for transaction in duplicates:
+                print(f"  -> {account.prefix}Skipped {transaction['merchant']} ${transaction['amount']} on {transaction['date']}, already seen in another account.")
+                if archive: archive.mark_duplicate(transaction['msg_id'], seen[alert_key(transaction)])
+            METRICS.inc("duplicate_alerts_skipped", len(duplicates))
+            temp_list.extend(kept)
+            journal[account.name].extend(parsed_ids)
+        if archive: archive.commit()
+        stages.lap("gemini_parse")
+        METRICS.inc("transactions_found", len(temp_list))
+        save_transactions(config, temp_list, cache, matcher, gemini)
+        if shared: save_seen_alerts(config, seen)
+        # New AI categories are written once per run rather than after every Gemini batch
+        cache.flush()
+        stages.lap("ledger")
+        # Journal the IDs right after their rows are committed; a crash in between only
+        # means the messages are fetched again, and the ledger drops the duplicate rows
+        for account in ctx.accounts:
+            account.processed.append(journal[account.name])
         if temp_list:
-            file_exists = os.path.exists(config["paths"]["transactions_csv"])
-            with open(config["paths"]["transactions_csv"], "a", newline="") as csvfile:
-                fieldnames = ["date", "amount", "merchant", "category", "cumulative_amount"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                if not file_exists: writer.writeheader()
-                for t in temp_list:
-                    msg_id = t.pop('msg_id')
-                    writer.writerow(t)
-                    processed_message_ids.add(msg_id)
-
-        if os.path.exists(config["paths"]["transactions_csv"]):
-            all_rows = []
-            with open(config["paths"]["transactions_csv"], "r", newline="") as csvfile:
-                reader = csv.DictReader(csvfile)
-                all_rows = list(reader)
-            if all_rows:
-                # Clean up all merchant names in the history first
-                for row in all_rows:
-                    row['merchant'] = clean_merchant_name(row['merchant'])
-                    row = process_transaction_rules(row)
-
-                # Now get the unique set of merchants that need categorization
-                merchants_to_cat = list(set(r['merchant'] for r in all_rows if not r.get('category') or r['category'] in ['Other', '']))
-                batch_cats = get_batch_ai_categories(config, merchants_to_cat, cache, overrides)
-                unique_rows = []
-                seen = set()
-                for row in all_rows:
-                    row_key = (row['date'], row['amount'], row['merchant'])
-                    if row_key not in seen:
-                        if not row.get('category') or row['category'] in ['Other', '']:
-                            row['category'] = batch_cats.get(row['merchant'], 'Other')
-                        unique_rows.append(row)
-                        seen.add(row_key)
-                unique_rows.sort(key=lambda x: x['date'])
-                total = 0.0
-                for row in unique_rows:
-                    total += float(row['amount'])
-                    row['cumulative_amount'] = round(total, 2)
-                    check_benefits(row, benefits)
-                with open(config["paths"]["transactions_csv"], "w", newline="") as csvfile:
-                    fieldnames = ["date", "amount", "merchant", "category", "cumulative_amount"]
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(unique_rows)
-
-    except HttpError as e: print(f"Error: {e}")
-    finally:
-        if new_found: 
-            save_processed_messages(config, processed_message_ids)
             print("Updates complete.")
+            notify_upload_service(config, f"{len(temp_list)} new transactions")
+
+        if PARSER_REGISTRY.stats:
+            print("Parser stats:\n" + PARSER_REGISTRY.summary())
+        if cache.hits or cache.misses:
+            print(cache.summary())
+
+        # Alerts nothing could parse (Gemini failed or was unavailable) are fetched again by the
+        # next runs; they are recorded before the checkpoint moves past them
+        ai_unparsed = set(ai_unparsed)
+        for account, run in runs:
+            unparsed = [msg_id for msg_id, _ in run["committed"] if msg_id in ai_unparsed]
+            failed = set(run["fetch_failed"]) | ai_unparsed
+            update_retry_ids(account.config, [m for m in run["to_fetch"] if m not in failed], unparsed)
+            if unparsed: print(f"{account.prefix}{len(unparsed)} alerts could not be parsed; the next run retries them.")
+
+        # Only move an account's checkpoint forward once every new message has been fetched
+        for account, run in runs:
+            fetch_failed = run["fetch_failed"]
+            METRICS.inc("messages_fetch_failed", len(fetch_failed))
+            if fetch_failed:
+                print(f"{account.prefix}{len(fetch_failed)} messages could not be fetched; keeping the previous sync checkpoint.")
+            elif run["history_id"]:
+                save_sync_state(account.config, run["history_id"])
+        stages.lap("finish")
+
+    except HttpError as e:
+        print(f"Error: {e}")
+        METRICS.inc("run_errors")
+    finally:
+        if archive: archive.close()
+        write_snapshot(config)
+
+def run_reparse(config):
+    """Re-runs parsing, rules and categorization over the raw archive and rebuilds those ledger rows offline."""
+    archive_path = get_archive_path(config)
+    if not os.path.exists(archive_path):
+        print(f"No raw archive at {archive_path}. Set archive.enabled in {CONFIG_PATH} and sync first.")
+        return
+    archive = RawArchive(archive_path)
+    matcher = build_matcher(config)
+    cache = load_category_cache(config)
+    rules = load_transaction_rules(config)
+    try:
+        results = []
+        old_rows = []
+        new_rows = []
+        for msg_id, headers, body, gemini_result, old_row in archive.iter_messages():
+            # Copies of an alert already booked from another mailbox stay out of the ledger
+            if isinstance(old_row, dict) and "duplicate_of" in old_row: continue
+            transaction, parse_info = parse_email_regex(body, get_header(headers, "From"), get_header(headers, "Subject"))
+            if parse_info: PARSER_REGISTRY.record(parse_info)
+            # Reparsing never calls Gemini; emails only it could read keep its earlier answer
+            if not transaction and gemini_result: transaction = dict(gemini_result)
+            rows = finalize_transaction(transaction, headers, msg_id, rules) if transaction else []
+            new_rows.extend(rows)
+            # Messages a split rule turned into several rows recorded all of them
+            if old_row: old_rows.extend(old_row if isinstance(old_row, list) else [old_row])
+            results.append((msg_id, get_ledger_row(rows)))
+
+        if get_backend(config) == "sqlite":
+            save_transactions_sqlite(config, new_rows, cache, matcher, None, replace_ids=[msg_id for msg_id, _ in results])
+        else:
+            remove_csv_rows(config, old_rows)
+            save_transactions_csv(config, new_rows, cache, matcher, None)
+        cache.flush()
+        for msg_id, row in results:
+            archive.set_result(msg_id, row)
+        archive.commit()
+    finally:
+        archive.close()
+    print(f"Reparsed {len(results)} archived messages: {len(new_rows)} transactions (previously {len(old_rows)}).")
+    if PARSER_REGISTRY.stats:
+        print("Parser stats:\n" + PARSER_REGISTRY.summary())
+    notify_upload_service(config, "ledger reparsed")
+
+def backfill_shard(ctx, job, shard, save_lock, seen):
+    """
+    Lists, fetches and parses one date window of one account, then saves its transactions
+    and message IDs and marks the shard done. Network and parsing run in parallel with
+    other shards; only the save step holds save_lock. Returns (transactions, messages
+    that failed to fetch).
+    """
+    account = job["account"]
+    config = account.config
+    limiter = job["limiter"]
+    started = time.perf_counter()
+    service = job["services"].get()
+    try:
+        message_ids = list_query_message_ids(service, shard_query(ALERT_QUERY, shard), limiter)
+        with save_lock:
+            to_fetch = [m for m in dict.fromkeys(message_ids) if m not in account.processed.ids]
+        fetched, skipped = {}, []
+        # A metadata get costs the same quota as a full one and the backfill is quota bound,
+        # so it only pays off here when most of the history is not alerts
+        is_candidate = get_alert_classifier(config, account.prefix) if config.get("backfill", {}).get("metadata_first", False) else None
+        if to_fetch and is_candidate:
+            known = list_known_sender_ids(service, shard_query(ALERT_QUERY, shard), config, limiter)
+            fetched, skipped = fetch_alert_messages(service, to_fetch, config, is_candidate, limiter=limiter, known=known)
+        elif to_fetch:
+            fetched = fetch_messages(service, to_fetch, config, limiter=limiter)
+    finally:
+        job["services"].put(service)
+
+    keep_body = config.get("archive", {}).get("enabled", False)
+    parse_fn = partial(parse_message, keep_body=True) if keep_body else parse_message
+    msg_ids = [m for m in to_fetch if m in fetched]
+    messages = [fetched.pop(m) for m in msg_ids]
+    if ctx.parse_pool and messages:
+        parsed = list(ctx.parse_pool.map(parse_fn, messages, chunksize=16))
+    else:
+        parsed = [parse_fn(msg) for msg in messages]
+    ai_parser = GeminiParseScheduler(ctx.gemini, ctx.categories)
+    for msg_id, result in zip(msg_ids, parsed):
+        if not result["transaction"]: ai_parser.submit(msg_id, result["body"])
+    ai_results, ai_unparsed = ai_parser.flush() if ai_parser.queue else ({}, [])
+
+    with save_lock:
+        # SQLite connections belong to the thread that opened them, so each shard opens its own
+        archive = open_archive(config)
+        try:
+            found = []
+            parsed_ids = []
+            for msg_id, result in zip(msg_ids, parsed):
+                headers = result["headers"]
+                if result["parse_info"]: PARSER_REGISTRY.record(result["parse_info"])
+                if archive: archive.add(msg_id, headers, result["body"])
+                transaction = result["transaction"]
+                gemini_result = None
+                if not transaction and ai_results.get(msg_id):
+                    transaction = ai_results[msg_id]
+                    gemini_result = dict(transaction)
+                rows = finalize_transaction(transaction, headers, msg_id, ctx.transaction_rules) if transaction else []
+                found.extend(rows)
+                if transaction: parsed_ids.append(msg_id)
+                if archive: archive.set_result(msg_id, get_ledger_row(rows), gemini_result)
+            temp_list, duplicates = drop_cross_account_duplicates(seen, account.name, found)
+            for transaction in duplicates:
+                if archive: archive.mark_duplicate(transaction['msg_id'], seen[alert_key(transaction)])
+            if archive: archive.commit()
+        finally:
+            if archive: archive.close()
+        save_transactions(config, temp_list, ctx.cache, ctx.matcher, ctx.gemini)
+        if len(ctx.accounts) > 1: save_seen_alerts(ctx.config, seen)
+        account.processed.append(parsed_ids)
+        # Gemini could not be asked about these; the next sync fetches them again
+        if ai_unparsed: update_retry_ids(config, failed=ai_unparsed)
+        failed = len(to_fetch) - len(msg_ids) - len(skipped)
+        # Shards with unfetchable messages stay incomplete so the next run retries them
+        job["checkpoint"].record(shard, "incomplete" if failed else "done", listed=len(message_ids), fetched=len(msg_ids), skipped=len(skipped), transactions=len(temp_list), failed=failed)
+    METRICS.observe("backfill_shard_seconds", time.perf_counter() - started)
+    METRICS.inc("backfill_shards", status="incomplete" if failed else "done")
+    METRICS.inc("duplicate_alerts_skipped", len(duplicates))
+    METRICS.inc("transactions_found", len(temp_list))
+    return len(temp_list), failed
+
+def run_backfill(ctx, since, until=None, shard_days=None, workers=None, restart=False):
+    """
+    Imports historical alerts from since up to until (exclusive, default: through today).
+    The range is split into date shards that are listed and processed by parallel workers.
+    Each account gets `workers` workers sharing one Gmail quota bucket, and its finished
+    shards are checkpointed in its paths.backfill_state, so running the same command again
+    resumes where a killed backfill stopped.
+    """
+    config = ctx.config
+    default_days, default_workers = get_backfill_settings(config)
+    shard_days = shard_days or default_days
+    workers = workers or default_workers
+    shards = make_shards(parse_day(since), parse_day(until) if until else get_default_until(), shard_days)
+    jobs = []
+    for account in ctx.accounts:
+        backfill_state = account.config["paths"].get("backfill_state", "backfill_state.json")
+        checkpoint = BackfillCheckpoint(backfill_state, since, until, shard_days, restart)
+        pending = checkpoint.pending(shards)
+        print(f"{account.prefix}Backfill from {since}: {len(shards)} shards of {shard_days} days, {len(pending)} left, {workers} workers.")
+        if pending: jobs.append({"account": account, "checkpoint": checkpoint, "pending": pending})
+    if not jobs: return
+
+    METRICS.reset()
+    for job in jobs:
+        account = job["account"]
+        account.refresh_credentials()
+        # Gmail's quota is per user, so every account gets its own bucket
+        job["limiter"] = get_quota_limiter(account.config)
+        job["services"] = queue.Queue()
+        service_factory = account.get_service_factory(workers)
+        for _ in range(workers):
+            job["services"].put(service_factory())
+    ctx.get_parse_pool()
+    save_lock = threading.Lock()
+    seen = load_seen_alerts(config) if len(ctx.accounts) > 1 else {}
+    found = 0
+    # Interleave the accounts' shards so every account makes progress from the start
+    tasks = [task for batch in zip_longest(*([(job, shard) for shard in job["pending"]] for job in jobs)) for task in batch if task]
+    executor = ThreadPoolExecutor(max_workers=workers * len(jobs))
+    try:
+        futures = {executor.submit(backfill_shard, ctx, job, shard, save_lock, seen): (job, shard) for job, shard in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            job, (after, before) = futures[future]
+            prefix = job["account"].prefix
+            try:
+                transactions, failed = future.result()
+            except Exception as e:
+                print(f"[{done}/{len(tasks)}] {prefix}{after} to {before}: failed ({e}); it will be retried on the next run.")
+                METRICS.inc("backfill_shards", status="error")
+                continue
+            found += transactions
+            note = f", {failed} messages not fetched" if failed else ""
+            print(f"[{done}/{len(tasks)}] {prefix}{after} to {before}: {transactions} transactions{note}", flush=True)
+    finally:
+        # On Ctrl-C the shards already running finish and are checkpointed; the rest are dropped
+        executor.shutdown(wait=True, cancel_futures=True)
+        ctx.cache.flush()
+        write_snapshot(config)
+    for job in jobs:
+        print(f"{job['account'].prefix}Backfill finished: {job['checkpoint'].summary()}.")
+    if PARSER_REGISTRY.stats:
+        print("Parser stats:\n" + PARSER_REGISTRY.summary())
+    if found:
+        notify_upload_service(config, f"{found} backfilled transactions")
+
+def run_daemon():
+    """Keeps one SyncContext alive and runs sync cycles on the configured schedule until signalled."""
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}; stopping after the current cycle.")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    ctx = SyncContext()
+    try:
+        while not stop.is_set():
+            ctx.reload_if_changed()
+            print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: Running sync cycle...")
+            try:
+                run_sync(ctx)
+            except Exception:
+                traceback.print_exc()
+            settings = ctx.config.get("daemon", {})
+            interval = settings.get("interval_seconds", 3600)
+            jitter = settings.get("jitter_seconds", 300)
+            delay = max(1, interval + random.uniform(-jitter, jitter))
+            print(f"Next sync in {int(delay)}s.", flush=True)
+            stop.wait(delay)
+    finally:
+        ctx.close()
+        print("Daemon stopped.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Gmail spending tracker")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("sync", help="run a single sync (default)")
+    subparsers.add_parser("daemon", help="keep running and sync on the schedule in spend_tracker.json")
+    subparsers.add_parser("reparse", help="rebuild archived transactions from the local raw archive without Gmail")
+    backfill_parser = subparsers.add_parser("backfill", help="import past alerts in resumable, parallel date shards")
+    backfill_parser.add_argument("--since", required=True, help="first day to import (YYYY-MM-DD)")
+    backfill_parser.add_argument("--until", help="stop before this day (YYYY-MM-DD, default: include today)")
+    backfill_parser.add_argument("--shard-days", type=int, help="days per shard (default: backfill.shard_days)")
+    backfill_parser.add_argument("--workers", type=int, help="shards processed at once (default: backfill.workers)")
+    backfill_parser.add_argument("--restart", action="store_true", help="forget earlier progress for this range")
+    args = parser.parse_args()
+
+    if args.command == "reparse":
+        run_reparse(load_config())
+        return
+    if args.command == "daemon":
+        run_daemon()
+        return
+    ctx = SyncContext()
+    try:
+        if args.command == "backfill":
+            run_backfill(ctx, args.since, args.until, args.shard_days, args.workers, args.restart)
+        else:
+            run_sync(ctx)
+    finally:
+        ctx.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+"""
+Multiple Gmail accounts. Each one has its own token, sync checkpoint, processed journal and
+backfill state, while the parse pool, parsers, category cache, Gemini client and quota, and the
+ledger are shared. Recurring expenses are logged with the first account, and the Sheets
+uploader keeps using paths.token. An alert forwarded to several inboxes is booked once: a
+transaction with the same date, amount in cents and merchant as one another account already
+produced is skipped, though its message ID is still journaled. Booked keys stay in
+seen_alerts.json for SEEN_ALERTS_DAYS, so a copy that reaches another inbox a run later is
+skipped too; the raw archive marks such copies as duplicates and reparse leaves them out.
+"""
+
+import os
+from datetime import date
+
+from pkg.ledger import parse_cents
+from pkg.state import get_state
+
+# State that belongs to one mailbox; everything else in config["paths"] is shared
+ACCOUNT_PATHS = ("token", "sync_state", "processed_messages", "processed_snapshot", "backfill_state")
+# How long a booked alert's key is remembered; forwarded copies arrive well within this
+SEEN_ALERTS_DAYS = 90
+
+def _suffixed(path, name):
+    base, ext = os.path.splitext(path)
+    return f"{base}_{name}{ext}"
+
+def get_account_configs(config):
+    """
+    Returns [(name, config)] with one config view per Gmail account in config["accounts"].
+    Each view is the shared config with that account's token, sync checkpoint, processed
+    journal and backfill state swapped into "paths", so the single-account code reads
+    its per-mailbox files without knowing about accounts. An account may name its files
+    explicitly; otherwise the shared file name gets an _<name> suffix. Without an
+    "accounts" list the tracker has one account using the paths as configured.
+    """
+    accounts = config.get("accounts") or []
+    if not accounts:
+        return [("default", config)]
+    views = []
+    names = set()
+    for account in accounts:
+        name = account["name"]
+        if name in names:
+            raise ValueError(f"Duplicate account name in config: {name}")
+        names.add(name)
+        paths = dict(config["paths"])
+        for key in ACCOUNT_PATHS:
+            default = paths.get(key, f"{key}.json")
+            paths[key] = account.get(key) or (default if account.get("primary") else _suffixed(default, name))
+        views.append((name, dict(config, paths=paths)))
+    return views
+
+def drop_cross_account_duplicates(seen, account, transactions):
+    """
+    Splits transactions into (kept, duplicates). A transaction is a duplicate when another
+    account already produced the same (date, amount, merchant), which is what an alert
+    forwarded to several inboxes looks like. seen maps those keys to the account that
+    produced them first and is updated in place.
+    """
+    kept, duplicates = [], []
+    for transaction in transactions:
+        owner = seen.setdefault(alert_key(transaction), account)
+        (kept if owner == account else duplicates).append(transaction)
+    return kept, duplicates
+
+def alert_key(transaction):
+    """"date|cents|merchant", so "12.5" from Gemini and "12.50" from a regex are the same alert."""
+    try: amount = parse_cents(transaction["amount"])
+    except (ValueError, TypeError): amount = transaction["amount"]
+    return f"{transaction['date']}|{amount}|{transaction['merchant']}"
+
+def get_seen_alerts_state(config):
+    return get_state(config["paths"].get("seen_alerts", "seen_alerts.json"), {})
+
+def load_seen_alerts(config):
+    """
+    The seen map for drop_cross_account_duplicates, pre-filled with the alerts booked by
+    earlier runs, so a forwarded copy that arrives a run later is still a duplicate.
+    """
+    return {key: owner for key, (owner, _) in get_seen_alerts_state(config).get().items()}
+
+def save_seen_alerts(config, seen):
+    """Adds this run's keys to seen_alerts.json and forgets those older than SEEN_ALERTS_DAYS."""
+    today = date.today().toordinal()
+
+    def merge(data):
+        added = {key: [owner, today] for key, owner in seen.items() if key not in data}
+        expired = [key for key, (_, day) in data.items() if day < today - SEEN_ALERTS_DAYS]
+        if not added and not expired: return False
+        data.update(added)
+        for key in expired: del data[key]
+    get_seen_alerts_state(config).update(merge)
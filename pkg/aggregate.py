@@ -0,0 +1,204 @@
+"""
+The engine behind `report.py --history` and full rollup rebuilds. The ledger is loaded as
+typed columns (month index, cents, merchant and category codes) and grouped with integer
+arithmetic, matching keywords once per merchant. With NumPy the grouping is vectorized;
+without it the same columns are summed in plain Python, and `python bench/run.py --only
+history` checks that both give the same results.
+"""
+
+from array import array
+from datetime import datetime
+from functools import lru_cache
+
+from pkg.keyword_matcher import MerchantMatcher
+from pkg.ledger import parse_cents
+
+PERIODIC_CYCLES = ("monthly", "annual", "biannual_jan_jun")
+
+@lru_cache(maxsize=None)
+def get_numpy():
+    """
+    NumPy if it is installed, else None. It is optional: with it every grouping is a handful
+    of array operations, without it the same integer bucketing runs as plain loops over the
+    same columns. Imported on first use, since report.py must start fast for sensor polls.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def month_key(month):
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+def period_key(reset_cycle, month):
+    """get_period_key() for a month index (year * 12 + month - 1)."""
+    if reset_cycle == "monthly": return month_key(month)
+    if reset_cycle == "annual": return f"{month // 12:04d}"
+    return f"{month // 12:04d}-P{month % 12 // 6 + 1}"
+
+def _bucket(reset_cycle, months):
+    """Maps month indexes to the bucket of a reset cycle with integer arithmetic only."""
+    if reset_cycle == "monthly": return months
+    if reset_cycle == "annual": return months // 12
+    return months // 6  # year * 2 + half: months 0-5 are P1, 6-11 are P2
+
+def _bucket_month(reset_cycle, bucket):
+    """The first month index of a bucket, for naming it with period_key()."""
+    if reset_cycle == "monthly": return bucket
+    if reset_cycle == "annual": return bucket * 12
+    return bucket * 6
+
+class LedgerColumns:
+    """
+    The ledger as typed columns: month index (year * 12 + month - 1), amount in cents, and
+    merchant and category codes into string tables. Rows without a valid date or amount
+    are left out, as Rollups.add_row() leaves them out.
+    """
+
+    def __init__(self):
+        self.months = array("i")
+        self.cents = array("q")
+        self.merchant_codes = array("I")
+        self.category_codes = array("I")
+        self.merchants = []
+        self.categories = []
+
+    @classmethod
+    def from_rows(cls, rows):
+        columns = cls()
+        month_of, cents_of, merchant_index, category_index = {}, {}, {}, {}
+        for row in rows:
+            text, amount = row.get("date"), row.get("amount")
+            month = month_of.get(text)
+            if month is None:
+                try:
+                    day = datetime.strptime(text, "%Y-%m-%d")
+                    month = day.year * 12 + day.month - 1
+                except (TypeError, ValueError):
+                    month = -1
+                month_of[text] = month
+            cents = cents_of.get(amount)
+            if cents is None:
+                try: cents = parse_cents(amount)
+                except (TypeError, ValueError): cents = False
+                cents_of[amount] = cents
+            if month < 0 or cents is False: continue
+            merchant = row.get("merchant") or ""
+            code = merchant_index.get(merchant)
+            if code is None:
+                code = merchant_index[merchant] = len(columns.merchants)
+                columns.merchants.append(merchant)
+            category = row.get("category") or ""
+            category_code = category_index.get(category)
+            if category_code is None:
+                category_code = category_index[category] = len(columns.categories)
+                columns.categories.append(category)
+            columns.months.append(month)
+            columns.cents.append(cents)
+            columns.merchant_codes.append(code)
+            columns.category_codes.append(category_code)
+        return columns
+
+    def __len__(self):
+        return len(self.months)
+
+def _group_sum(keys, cents, select=None):
+    """Sums cents per distinct key (optionally over the rows where select is true). Returns {key: cents}."""
+    np = get_numpy()
+    if np is not None:
+        if select is not None:
+            keys, cents = keys[select], cents[select]
+        if not len(keys): return {}
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = np.zeros(len(unique), dtype=np.int64)
+        np.add.at(sums, inverse, cents)
+        return dict(zip(unique.tolist(), sums.tolist()))
+    sums = {}
+    for i, key in enumerate(keys):
+        if select is None or select[i]:
+            sums[key] = sums.get(key, 0) + cents[i]
+    return sums
+
+class SpendingAggregates:
+    """
+    Grouped totals over every period in the ledger at once: spending per month and year,
+    spending per category per month, trailing 12-month totals and benefit spend per
+    card, benefit and period. Keyword matching runs once per distinct merchant, and all
+    amounts stay integer cents, so any single period reproduces the rollups exactly.
+    """
+
+    def __init__(self, columns, benefits):
+        self.columns = columns
+        self.benefits = benefits
+        self.np = np = get_numpy()
+        if np is not None:
+            self.months = np.frombuffer(columns.months, dtype=np.int32).astype(np.int64)
+            self.cents = np.frombuffer(columns.cents, dtype=np.int64)
+            self.merchant_codes = np.frombuffer(columns.merchant_codes, dtype=np.uint32)
+            self.category_codes = np.frombuffer(columns.category_codes, dtype=np.uint32)
+        else:
+            self.months, self.cents = columns.months, columns.cents
+            self.merchant_codes, self.category_codes = columns.merchant_codes, columns.category_codes
+        matcher = MerchantMatcher(benefits=benefits)
+        self.merchant_benefits = [matcher.match(m).benefits for m in columns.merchants]
+
+    @classmethod
+    def from_rows(cls, rows, benefits):
+        return cls(LedgerColumns.from_rows(rows), benefits)
+
+    def _buckets(self, reset_cycle):
+        if self.np is not None: return _bucket(reset_cycle, self.months)
+        return [_bucket(reset_cycle, m) for m in self.months]
+
+    def monthly_totals(self):
+        return {month_key(m): c for m, c in sorted(_group_sum(self.months, self.cents).items())}
+
+    def yearly_totals(self):
+        return {f"{y:04d}": c for y, c in sorted(_group_sum(self._buckets("annual"), self.cents).items())}
+
+    def category_by_month(self):
+        """{"YYYY-MM": {category: cents}} from one grouping on month and category together."""
+        width = max(len(self.columns.categories), 1)
+        if self.np is not None:
+            keys = self.months * width + self.category_codes
+        else:
+            keys = [m * width + c for m, c in zip(self.months, self.category_codes)]
+        result = {}
+        for key, cents in sorted(_group_sum(keys, self.cents).items()):
+            month, code = divmod(key, width)
+            result.setdefault(month_key(month), {})[self.columns.categories[code] or "Uncategorized"] = cents
+        return result
+
+    def trailing_12_months(self):
+        """{"YYYY-MM": cents spent in the 12 months ending with that month}, for every month in the ledger."""
+        monthly = _group_sum(self.months, self.cents)
+        if not monthly: return {}
+        first, last = min(monthly), max(monthly)
+        totals = [monthly.get(m, 0) for m in range(first, last + 1)]
+        running, result = 0, {}
+        for i, cents in enumerate(totals):
+            running += cents
+            if i >= 12: running -= totals[i - 12]
+            result[month_key(first + i)] = running
+        return result
+
+    def benefit_usage(self):
+        """{card: {benefit: {period key: cents}}} for every period, like Rollups.benefit_spend."""
+        usage = {}
+        for card, card_benefits in self.benefits.items():
+            for benefit, details in card_benefits.items():
+                reset_cycle = details.get("reset_cycle", "annual")
+                if reset_cycle not in PERIODIC_CYCLES: continue
+                matching = [(card, benefit) in hits for hits in self.merchant_benefits]
+                if not any(matching): continue
+                if self.np is not None:
+                    select = self.np.array(matching, dtype=bool)[self.merchant_codes]
+                else:
+                    select = [matching[code] for code in self.merchant_codes]
+                sums = _group_sum(self._buckets(reset_cycle), self.cents, select)
+                if sums:
+                    usage.setdefault(card, {})[benefit] = {
+                        period_key(reset_cycle, _bucket_month(reset_cycle, b)): c for b, c in sorted(sums.items())
+                    }
+        return usage
@@ -0,0 +1,76 @@
+import time
+from datetime import date, datetime, timedelta
+
+from pkg.state import get_state
+
+DEFAULT_SHARD_DAYS = 30
+DEFAULT_WORKERS = 4
+
+def get_backfill_settings(config):
+    """Reads shard size and worker count from the "backfill" section of spend_tracker.json."""
+    settings = config.get("backfill", {})
+    shard_days = max(1, int(settings.get("shard_days", DEFAULT_SHARD_DAYS)))
+    workers = max(1, int(settings.get("workers", DEFAULT_WORKERS)))
+    return shard_days, workers
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def make_shards(since, until, shard_days):
+    """
+    Splits [since, until) into consecutive windows of shard_days, newest first, as
+    (after, before) pairs of YYYY-MM-DD strings. Windows are anchored at since, so every
+    run over the same start date gets the same shards and only the newest one grows.
+    """
+    shards = []
+    start = since
+    while start < until:
+        end = min(start + timedelta(days=shard_days), until)
+        shards.append((start.isoformat(), end.isoformat()))
+        start = end
+    return shards[::-1]
+
+def shard_query(query, shard):
+    after, before = shard
+    return f"{query} after:{after.replace('-', '/')} before:{before.replace('-', '/')}"
+
+class BackfillCheckpoint:
+    """
+    Progress of one backfill in paths.backfill_state, keyed by each shard's start date.
+    A shard is only marked done once its transactions and message IDs are saved, so a
+    killed backfill re-lists at most the shards that were in flight and fetches only the
+    messages those did not commit. Starting a backfill with a different range (or with
+    restart) forgets the old progress.
+    """
+
+    def __init__(self, path, since, until=None, shard_days=DEFAULT_SHARD_DAYS, restart=False):
+        self.state = get_state(path, indent=2)
+        scope = {"since": since, "until": until, "shard_days": shard_days}
+
+        def start(data):
+            if not restart and data.get("scope") == scope: return False
+            return {"scope": scope, "started_at": int(time.time()), "shards": {}}
+        self.state.update(start)
+
+    def is_done(self, shard):
+        entry = self.state.get()["shards"].get(shard[0])
+        # The newest shard of an open-ended backfill grows daily; its old record no longer covers it
+        return bool(entry) and entry.get("status") == "done" and entry.get("before") == shard[1]
+
+    def pending(self, shards):
+        return [shard for shard in shards if not self.is_done(shard)]
+
+    def record(self, shard, status, **counts):
+        def save(data):
+            data["shards"][shard[0]] = dict(counts, before=shard[1], status=status, updated_at=int(time.time()))
+        self.state.update(save)
+
+    def summary(self):
+        shards = self.state.get()["shards"].values()
+        done = sum(1 for s in shards if s["status"] == "done")
+        found = sum(s.get("transactions", 0) for s in shards)
+        return f"{done} shards done, {len(shards) - done} incomplete, {found} transactions found"
+
+def get_default_until():
+    # before: is exclusive, so tomorrow includes everything up to now
+    return date.today() + timedelta(days=1)
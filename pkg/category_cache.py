@@ -0,0 +1,105 @@
+import json
+import os
+import re
+from collections import OrderedDict
+
+from pkg.metrics import METRICS
+from pkg.state import file_lock, write_json_atomic
+
+DEFAULT_MAX_ENTRIES = 5000
+
+# Payment processors that put their own tag in front of the real merchant ("SQ *BLUE BOTTLE")
+PROCESSOR_PREFIX = re.compile(r"^(?:SQ|SQU|TST|SP|PP|PAYPAL|PY|CLV|IC)\s*\*\s*|^SQ\s+")
+WEB_AFFIXES = re.compile(r"^WWW[\s.]+|(?:\.|\s)(?:COM|NET|ORG)\b")
+STORE_NUMBER = re.compile(r"#\s*\d+")
+
+def normalize_merchant(merchant):
+    """
+    Reduces a merchant string to the part that identifies the business, so "AMAZON.COM",
+    "Amazon" and "AMAZON MKTPL*2K4TY7" share one cache entry. Processor prefixes, web
+    affixes, store numbers and reference codes (tokens mixing letters and digits) go.
+    """
+    name = PROCESSOR_PREFIX.sub("", merchant.upper().strip())
+    name = WEB_AFFIXES.sub(" ", name)
+    name = STORE_NUMBER.sub(" ", name).replace("'", "")
+    tokens = []
+    for token in re.split(r"[^A-Z0-9&-]+", name):
+        if not token: continue
+        # Store numbers and reference codes: "00023451", "5GL3XC", "8PM"
+        if any(c.isdigit() for c in token) and token.isalnum() and (len(token) >= 3 or not token.isdigit()):
+            continue
+        tokens.append(token)
+    return " ".join(tokens) or " ".join(merchant.upper().split())
+
+class CategoryCache:
+    """
+    Merchant -> category answers from Gemini, keyed by normalize_merchant() and bounded
+    to max_entries with least-recently-used eviction. Updates only mark the cache dirty;
+    flush() writes it once (atomically) at the end of a run, merged with whatever other
+    processes wrote since this one loaded it.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                try: data = json.load(f)
+                except: data = {}
+            # Older files are keyed by raw merchant strings; later entries win, as the newest
+            for merchant, category in data.items():
+                self._put(normalize_merchant(merchant), category)
+            self.dirty = False
+        return self
+
+    def _put(self, key, category):
+        self.entries[key] = category
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+            METRICS.inc("category_cache_evictions")
+
+    def get(self, merchant):
+        key = normalize_merchant(merchant)
+        category = self.entries.get(key)
+        if category is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Recency alone is not worth a write; it is saved with the next real change
+        self.entries.move_to_end(key)
+        return category
+
+    def set(self, merchant, category):
+        key = normalize_merchant(merchant)
+        if self.entries.get(key) != category:
+            self.dirty = True
+        self._put(key, category)
+
+    def flush(self):
+        """Writes the cache if anything changed, least recently used first."""
+        if not self.dirty: return False
+        with file_lock(self.path):
+            on_disk = CategoryCache(self.path, self.max_entries).load().entries
+            # Entries only the other writers know about count as older than ours; ours win conflicts
+            merged = OrderedDict((key, c) for key, c in on_disk.items() if key not in self.entries)
+            merged.update(self.entries)
+            while len(merged) > self.max_entries:
+                merged.popitem(last=False)
+            self.entries = merged
+            write_json_atomic(self.path, self.entries, separators=(",", ":"))
+        self.dirty = False
+        return True
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return f"Category cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {len(self.entries)} entries, {self.evictions} evicted"
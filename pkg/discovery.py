@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from pkg.state import file_lock
+
+DISCOVERY_URL = "https://{api}.googleapis.com/$discovery/rest?version={version}"
+# The APIs the tracker builds clients for, cached by `python pkg/discovery.py`
+APIS = (("gmail", "v1"), ("sheets", "v4"))
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+def get_cache_dir(config=None):
+    return os.path.join(root_dir, (config or {}).get("paths", {}).get("discovery_cache", "discovery_cache"))
+
+def _cache_path(config, api, version):
+    return os.path.join(get_cache_dir(config), f"{api}.{version}.json")
+
+def _bundled_document(api, version):
+    """The copy shipped with google-api-python-client 2.x, if this version has one."""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:
+        return None
+    return get_static_doc(api, version)
+
+def fetch_document(config, api, version):
+    """Downloads a discovery document and saves it to the cache directory."""
+    import urllib.request  # pulls in ssl and http.client, which only a cache miss needs
+    with urllib.request.urlopen(DISCOVERY_URL.format(api=api, version=version), timeout=30) as response:
+        text = response.read().decode("utf-8")
+    json.loads(text)  # never cache a truncated or error page
+    path = _cache_path(config, api, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    return text
+
+def get_document(config, api, version):
+    """
+    Returns the discovery document for an API as text, from the first of: this process's
+    memory, the cache directory, the copy bundled with googleapiclient, or the network
+    (which fills the cache). Every client built afterwards reuses the same text.
+    """
+    key = (get_cache_dir(config), api, version)
+    with _documents_lock:
+        text = _documents.get(key)
+        if text is not None: return text
+        path = _cache_path(config, api, version)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                text = f.read()
+        else:
+            text = _bundled_document(api, version) or fetch_document(config, api, version)
+        _documents[key] = text
+        return text
+
+def build_service(api, version, credentials, config=None):
+    """
+    build() without the discovery lookup: the client is built from the cached document.
+    If the document cannot be loaded or built from, it falls back to build(), which
+    resolves the document itself.
+    """
+    # googleapiclient.discovery pulls in httplib2, uritemplate and the auth transports,
+    # so it is only imported by runs that actually talk to Google
+    from googleapiclient.discovery import build, build_from_document
+    try:
+        return build_from_document(get_document(config, api, version), credentials=credentials)
+    except Exception as e:
+        print(f"Building the {api} {version} client from the cached discovery document failed ({e}), asking Google instead.")
+        with _documents_lock:
+            _documents.pop((get_cache_dir(config), api, version), None)
+        return build(api, version, credentials=credentials)
+
+def load_config():
+    config_path = os.path.join(root_dir, "config/spend_tracker.json")
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            return json.load(f)
+    return {}
+
+def main():
+    """Downloads (or refreshes) the cached discovery documents, e.g. once after installing on the Pi."""
+    argparse.ArgumentParser(description="Download the discovery documents the tracker uses into the cache").parse_args()
+    config = load_config()
+    for api, version in APIS:
+        fetch_document(config, api, version)
+        print(f"Cached {api} {version} in {_cache_path(config, api, version)}")
+
+if __name__ == "__main__":
+    main()
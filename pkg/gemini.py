@@ -0,0 +1,150 @@
+import json
+import os
+
+from pkg.metrics import METRICS
+from pkg.parsers import clean_merchant_name, html_to_text
+from pkg.rate_limit import TokenBucket
+from pkg.state import DailyCounter
+
+DEFAULT_MODEL = 'gemini-2.5-flash-lite'
+
+# Structured output for a multi-email request: one result object per email, tagged with its id
+PARSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "STRING"},
+            "amount": {"type": "STRING"},
+            "merchant": {"type": "STRING"},
+            "date": {"type": "STRING"},
+            "category": {"type": "STRING"},
+        },
+        "required": ["id", "amount", "merchant", "date"],
+    },
+}
+
+def get_usage_counter(config):
+    """The per-day Gemini request count, shared by every process that uses the same file."""
+    return DailyCounter(config["paths"]["gemini_usage"])
+
+class GeminiClient:
+    """
+    One genai.Client for the whole run. Every request goes through a token bucket sized to
+    the free-tier RPM limit and is counted against the daily limit. Nothing sleeps when no
+    request will be made (missing key or daily limit reached). The daily count is shared
+    with any other process using the same usage file and is reserved before each request,
+    so concurrent runs cannot overshoot the limit between them.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        settings = config.get("gemini", {})
+        self.model = settings.get("model", DEFAULT_MODEL)
+        self.bucket = TokenBucket(settings.get("rpm", 15), settings.get("burst", 1))
+        self.usage = get_usage_counter(config)
+        self._client = None
+        self._api_key = None
+
+    def get_api_key(self):
+        if self._api_key is None:
+            path = self.config["paths"]["gemini_key"]
+            if not os.path.exists(path): return None
+            with open(path, 'r') as f: self._api_key = f.read().strip()
+        return self._api_key
+
+    def available(self):
+        return bool(self.get_api_key()) and self.usage.count() < self.config["daily_limit"]
+
+    def generate_json(self, prompt, schema=None):
+        """Sends one rate-limited request and returns the decoded JSON response, or None."""
+        if not self.available(): return None
+        # google.genai (and pydantic under it) is the slowest import in the tracker, so it is
+        # loaded by the first request rather than by every run that might make one
+        from google import genai
+        from google.genai import types
+        if self._client is None:
+            self._client = genai.Client(api_key=self.get_api_key())
+        with METRICS.time("gemini_rate_limit_wait_seconds"):
+            self.bucket.acquire()
+        if not self.usage.try_acquire(self.config["daily_limit"]):
+            METRICS.inc("gemini_quota_exhausted")
+            return None
+        METRICS.inc("gemini_requests", kind="parse" if schema else "categorize")
+        try:
+            with METRICS.time("gemini_request_seconds"):
+                response = self._client.models.generate_content(
+                    model=self.model,
+                    contents=prompt,
+                    config=types.GenerateContentConfig(response_mime_type='application/json', response_schema=schema)
+                )
+        except Exception:
+            METRICS.inc("gemini_errors")
+            raise
+        if response.text:
+            return json.loads(response.text.strip())
+        return None
+
+class GeminiParseScheduler:
+    """
+    Queues emails the regex parsers could not handle and parses them several at a time
+    in one structured-output request per batch.
+    """
+
+    def __init__(self, gemini, categories, batch_size=None):
+        self.gemini = gemini
+        self.categories = categories
+        self.batch_size = batch_size or gemini.config.get("gemini", {}).get("batch_size", 5)
+        self.queue = []
+
+    def submit(self, key, body):
+        self.queue.append((key, html_to_text(body)[:4000]))
+
+    def build_prompt(self, batch):
+        categories_str = ", ".join(list(self.categories.keys()) + ["Other"])
+        emails = "\n\n".join(f"--- Email id: {key} ---\n{text}" for key, text in batch)
+        return (
+            f"Analyze each of the following emails from a credit card company or bank. "
+            f"Return ONLY a JSON array with one object per email containing these keys:\n"
+            f"- 'id': the email id given in the email's header line\n"
+            f"- 'amount': the transaction amount (string, e.g., '230.42')\n"
+            f"- 'merchant': the clean, friendly name of the merchant (string, e.g., 'Walmart' instead of 'on May. 14, 2026, at Walmart', 'Lowe's' instead of 'on May. 16, 2026, at Lowe's', 'Google' instead of 'Google *fi')\n"
+            f"- 'date': the date of the transaction in YYYY-MM-DD format (extract from email context)\n"
+            f"- 'category': classify the transaction into one of these exact categories: {categories_str}. Choose 'Other' if it doesn't fit any.\n\n"
+            f"{emails}"
+        )
+
+    def flush(self):
+        """
+        Parses everything queued so far. Returns (key -> transaction, keys Gemini never
+        answered for). A key in neither was read by Gemini and holds no transaction; the
+        unanswered ones (a failed request, the daily limit, no API key) should be retried.
+        """
+        results = {}
+        unparsed = []
+        queued, self.queue = self.queue, []
+        for start in range(0, len(queued), self.batch_size):
+            if not self.gemini.available():
+                print(f"Gemini unavailable; {len(queued) - start} emails left unparsed.")
+                unparsed.extend(key for key, _ in queued[start:])
+                break
+            batch = queued[start:start + self.batch_size]
+            try:
+                data = self.gemini.generate_json(self.build_prompt(batch), PARSE_SCHEMA)
+            except Exception as e:
+                print(f"Gemini parsing failed: {e}")
+                data = None
+            if data is None:
+                # generate_json also returns None when the daily limit ran out before the request
+                unparsed.extend(key for key, _ in batch)
+                continue
+            keys = {key for key, _ in batch}
+            for item in data or []:
+                if item.get("id") not in keys: continue
+                if all(item.get(k) for k in ['amount', 'merchant', 'date']):
+                    key = item.pop("id")
+                    item['amount'] = str(item['amount']).replace('$', '').replace(',', '')
+                    item['merchant'] = clean_merchant_name(item['merchant'])
+                    results[key] = item
+        METRICS.inc("gemini_emails_unparsed", len(unparsed))
+        return results, unparsed
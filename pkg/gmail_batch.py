@@ -0,0 +1,164 @@
+"""
+Gmail batch fetching sized to the per-user quota, and metadata-first fetching of alerts.
+The alert query also matches newsletters and offers that quote "new transaction", so
+fetch_alert_messages first gets each message's From, Subject and Date only, and downloads
+in full just the ones main.get_alert_classifier() takes for alerts. A metadata request
+costs the same quota as a full one, so mail from bank senders is listed by one extra search
+and downloaded straight away; only other senders cost two requests. Skipped messages are
+never parsed or sent to Gemini. The quota-bound backfill only does this with
+backfill.metadata_first.
+"""
+
+import time
+from googleapiclient.errors import HttpError
+
+from pkg.metrics import METRICS
+from pkg.rate_limit import TokenBucket
+
+# Gmail accepts at most 100 calls in one batch request, and every messages.get
+# costs 5 quota units out of the 250 units/second each user is allowed.
+MAX_BATCH_SIZE = 100
+MESSAGES_GET_COST = 5
+DEFAULT_QUOTA_UNITS_PER_SECOND = 250
+RETRYABLE_STATUSES = {403, 429, 500, 502, 503, 504}
+# Phase one of fetch_alert_messages: the headers a message is classified by, and nothing else
+METADATA_HEADERS = ["From", "Subject", "Date"]
+METADATA_FIELDS = "id,payload/headers"
+# Phase two: the MIME tree with only each part's type and inline data, MIME_DEPTH levels deep.
+# The API cannot return one part on its own, but this drops the full header list, sizes,
+# filenames, labels and snippet, and attachments never carry inline data.
+MIME_DEPTH = 8
+
+def _parts_mask(depth):
+    return "mimeType,body/data" + (f",parts({_parts_mask(depth - 1)})" if depth > 1 else "")
+
+BODY_FIELDS = f"id,payload({_parts_mask(MIME_DEPTH)})"
+# Messages from known bank senders skip phase one, so they are fetched with their headers
+KNOWN_FIELDS = f"id,payload(headers,{_parts_mask(MIME_DEPTH)})"
+
+def get_batch_size(config):
+    """Picks how many messages.get calls go in one batch based on the per-user quota."""
+    gmail_config = config.get("gmail", {})
+    if gmail_config.get("batch_size"):
+        return max(1, min(MAX_BATCH_SIZE, int(gmail_config["batch_size"])))
+    units = gmail_config.get("quota_units_per_second", DEFAULT_QUOTA_UNITS_PER_SECOND)
+    return max(1, min(MAX_BATCH_SIZE, units // MESSAGES_GET_COST))
+
+def _execute_batch(service, msg_ids, results, get_kwargs):
+    """Runs one batch request. Returns the IDs that failed with a retryable error."""
+    failed = []
+
+    def callback(request_id, response, exception):
+        if exception is None:
+            results[request_id] = response
+            return
+        status = getattr(getattr(exception, "resp", None), "status", None)
+        if isinstance(exception, HttpError) and status not in RETRYABLE_STATUSES:
+            print(f"Skipping message {request_id}: {exception}")
+        else:
+            failed.append(request_id)
+
+    batch = service.new_batch_http_request(callback=callback)
+    for msg_id in msg_ids:
+        batch.add(service.users().messages().get(userId="me", id=msg_id, **get_kwargs), request_id=msg_id)
+    try:
+        with METRICS.time("gmail_batch_seconds"):
+            batch.execute()
+    except Exception as e:
+        # The whole HTTP round trip failed, so nothing in the chunk was answered.
+        print(f"Batch request failed: {e}")
+        METRICS.inc("gmail_batch_errors")
+        return [m for m in msg_ids if m not in results]
+    METRICS.inc("gmail_messages_fetched", len(msg_ids) - len(failed))
+    if failed: METRICS.inc("gmail_get_retryable_errors", len(failed))
+    return failed
+
+def _has_inline_data(part):
+    if part.get("body", {}).get("data"): return True
+    return any(_has_inline_data(p) for p in part.get("parts", []))
+
+def fetch_alert_messages(service, msg_ids, config, is_candidate, max_retries=5, limiter=None, known=()):
+    """
+    Two-phase fetch_messages. Phase one gets only the From, Subject and Date headers of
+    every message, and is_candidate(headers) decides which ones are worth downloading.
+    Phase two gets the bodies of those through the BODY_FIELDS mask, and the headers from
+    phase one are put back on them. IDs in known (listed as coming from a bank sender)
+    skip phase one: they are downloaded with their headers straight away, which saves a
+    call per alert, and is_candidate still sees them. A body the mask cut off (a MIME tree
+    deeper than MIME_DEPTH) is fetched again without it. Returns (message ID -> message
+    resource, IDs that were skipped as not alerts); unfetchable IDs are in neither.
+    """
+    msg_ids = list(dict.fromkeys(msg_ids))
+    direct = [m for m in msg_ids if m in known]
+    probe = [m for m in msg_ids if m not in known]
+    metadata = fetch_messages(
+        service, probe, config, max_retries, limiter,
+        format="metadata", metadataHeaders=METADATA_HEADERS, fields=METADATA_FIELDS,
+    ) if probe else {}
+    headers = {m: msg.get("payload", {}).get("headers", []) for m, msg in metadata.items()}
+    candidates = [m for m in probe if m in headers and is_candidate(headers[m])]
+    results = fetch_messages(service, candidates, config, max_retries, limiter, format="full", fields=BODY_FIELDS) if candidates else {}
+    for msg_id, msg in results.items():
+        msg.setdefault("payload", {})["headers"] = headers[msg_id]
+    if direct:
+        fetched = fetch_messages(service, direct, config, max_retries, limiter, format="full", fields=KNOWN_FIELDS)
+        for msg_id, msg in fetched.items():
+            headers[msg_id] = msg.get("payload", {}).get("headers", [])
+            if is_candidate(headers[msg_id]): results[msg_id] = msg
+    skipped = [m for m in msg_ids if m in headers and m not in results]
+    METRICS.inc("gmail_messages_skipped", len(skipped))
+    truncated = [m for m, msg in results.items() if not _has_inline_data(msg.get("payload", {}))]
+    if truncated:
+        for msg_id, msg in fetch_messages(service, truncated, config, max_retries, limiter, format="full").items():
+            results[msg_id] = msg
+    return results, skipped
+
+def get_quota_limiter(config):
+    """
+    A token bucket holding the per-user quota in messages.get calls, for callers that run
+    several fetchers at once and must stay inside the quota between them.
+    """
+    units = config.get("gmail", {}).get("quota_units_per_second", DEFAULT_QUOTA_UNITS_PER_SECOND)
+    return TokenBucket(units / MESSAGES_GET_COST * 60, get_batch_size(config))
+
+def fetch_messages(service, msg_ids, config, max_retries=5, limiter=None, **get_kwargs):
+    """
+    Fetches messages using Gmail batch requests instead of one round trip per message.
+    Failed items are retried with exponential backoff; only the failures are resent.
+    With a shared limiter (see get_quota_limiter) every batch waits for its share of the
+    quota there; otherwise this caller paces its own batches to the per-second quota.
+    Returns a dict of message ID -> message resource (unfetchable IDs are left out).
+    """
+    get_kwargs.setdefault("format", "full")
+    units = config.get("gmail", {}).get("quota_units_per_second", DEFAULT_QUOTA_UNITS_PER_SECOND)
+    batch_size = get_batch_size(config)
+    results = {}
+    pending = list(dict.fromkeys(msg_ids))
+    attempt = 0
+    while pending:
+        failed = []
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            if limiter:
+                with METRICS.time("gmail_quota_wait_seconds"):
+                    limiter.acquire(len(chunk))
+                failed.extend(_execute_batch(service, chunk, results, get_kwargs))
+                continue
+            started = time.monotonic()
+            failed.extend(_execute_batch(service, chunk, results, get_kwargs))
+            # Pace the batches so a large catch-up stays inside the per-second quota
+            min_interval = len(chunk) * MESSAGES_GET_COST / units
+            elapsed = time.monotonic() - started
+            if start + batch_size < len(pending) and elapsed < min_interval:
+                time.sleep(min_interval - elapsed)
+        if not failed:
+            break
+        attempt += 1
+        if attempt > max_retries:
+            print(f"Giving up on {len(failed)} messages after {max_retries} retries.")
+            break
+        delay = min(2 ** attempt, 32)
+        print(f"Retrying {len(failed)} failed messages in {delay}s...")
+        time.sleep(delay)
+        pending = failed
+    return results
@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from googleapiclient.errors import HttpError
+
+from pkg.metrics import METRICS
+from pkg.state import get_state
+
+# Messages that only ever show up in these labels are never bank alerts
+SKIPPED_LABELS = {"SENT", "DRAFT", "SPAM", "TRASH"}
+# Alerts nothing could parse yet (Gemini failed or was unavailable) are fetched again by
+# every run for this long; the history checkpoint has already moved past them
+RETRY_SECONDS = 7 * 86400
+
+def get_sync_state_path(config):
+    return config["paths"].get("sync_state", "sync_state.json")
+
+def load_sync_state(config):
+    path = get_sync_state_path(config)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            try: return json.load(f)
+            except: return {}
+    return {}
+
+def save_sync_state(config, history_id):
+    """
+    Stores the mailbox historyId reached by this run as the next run's starting point.
+    If another run got further in the meantime, its checkpoint is kept.
+    """
+    def advance(state):
+        if state.get("history_id") and int(state["history_id"]) > int(history_id): return False
+        return dict(state, history_id=str(history_id), synced_at=int(time.time()))
+    get_state(get_sync_state_path(config)).update(advance)
+
+def get_retry_ids(sync_state):
+    """IDs of alerts an earlier run fetched but could not parse, oldest first."""
+    retry = sync_state.get("retry", {})
+    return sorted(retry, key=retry.get)
+
+def update_retry_ids(config, done=(), failed=()):
+    """
+    Forgets the retried IDs that are now done and adds the ones that failed to parse, so
+    the next run fetches them again. IDs older than RETRY_SECONDS are given up on.
+    """
+    now = int(time.time())
+
+    def change(state):
+        old = state.get("retry", {})
+        retry = {m: t for m, t in old.items() if m not in done and t >= now - RETRY_SECONDS}
+        for msg_id in failed: retry.setdefault(msg_id, now)
+        if retry == old: return False
+        return dict(state, retry=retry)
+    get_state(get_sync_state_path(config)).update(change)
+
+def get_current_history_id(service):
+    return service.users().getProfile(userId="me").execute()["historyId"]
+
+def list_added_message_ids(service, start_history_id):
+    """
+    Lists IDs of messages added to the mailbox since start_history_id using users.history.list.
+    Returns (message_ids, latest_history_id), or None when the checkpoint has expired
+    (Gmail only keeps about a week of history and answers 404 for older IDs).
+    """
+    message_ids = []
+    latest_history_id = start_history_id
+    page_token = None
+    while True:
+        try:
+            with METRICS.time("gmail_list_seconds", call="history"):
+                results = service.users().history().list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes="messageAdded",
+                    pageToken=page_token
+                ).execute()
+        except HttpError as e:
+            if getattr(e.resp, "status", None) == 404:
+                return None
+            raise
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message = added["message"]
+                labels = set(message.get("labelIds", []))
+                if labels and labels <= SKIPPED_LABELS: continue
+                message_ids.append(message["id"])
+        latest_history_id = results.get("historyId", latest_history_id)
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return list(dict.fromkeys(message_ids)), latest_history_id
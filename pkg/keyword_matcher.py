@@ -0,0 +1,135 @@
+"""
+Keyword matching for merchants: category_overrides.json, the keyword lists in categories.json
+and the benefit keywords in benefits.json are compiled into one automaton that finds every
+hit for a merchant in a single pass. Category keywords only match whole words, so "att" does
+not match "MATTRESS FIRM". They are consulted after the overrides and the category cache, and
+a merchant they match needs no Gemini lookup.
+"""
+
+import json
+import os
+from collections import deque
+
+def _is_word_at(text, start, end):
+    """Whether text[start:end + 1] is neither preceded nor followed by a letter or digit."""
+    return (start == 0 or not text[start - 1].isalnum()) and (end + 1 == len(text) or not text[end + 1].isalnum())
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over case-insensitive keywords. search() reports every
+    keyword contained in a string in a single pass over its characters. A keyword added
+    with whole_word only counts where it is not part of a longer word: "apple" is found
+    in "APPLE STORE" but not in "APPLEBEE'S".
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, keyword, payload, whole_word=False):
+        state = 0
+        for ch in keyword.lower():
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append((len(keyword), whole_word, payload))
+
+    def build(self):
+        """Computes failure links breadth-first. Call once after all keywords are added."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+        return self
+
+    def search(self, text):
+        hits = []
+        state = 0
+        text = text.lower()
+        for end, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length, whole_word, payload in self.output[state]:
+                if whole_word and not _is_word_at(text, end - length + 1, end): continue
+                hits.append(payload)
+        return hits
+
+class MerchantMatch:
+    """All local rule hits for one merchant."""
+    __slots__ = ("override", "category", "benefits")
+
+    def __init__(self, override, category, benefits):
+        self.override = override    # category from category_overrides.json, or None
+        self.category = category    # category from the categories.json keyword lists, or None
+        self.benefits = benefits    # [(card, benefit)] in benefits.json order, each at most once
+
+class MerchantMatcher:
+    """
+    One compiled automaton for category overrides, category keywords and benefit keywords.
+    Where several rules of the same kind match, the one listed first in its file wins,
+    as in the old sequential loops. Results are memoized per unique merchant string.
+    """
+
+    def __init__(self, overrides=None, categories=None, benefits=None):
+        self.automaton = KeywordAutomaton()
+        for rank, (pattern, cat) in enumerate((overrides or {}).items()):
+            self.automaton.add(pattern, ("override", rank, cat))
+        for rank, (cat, keywords) in enumerate((categories or {}).items()):
+            for keyword in keywords:
+                # The lists are short generic words ("att", "apple", "delta"), so they must match whole words
+                self.automaton.add(keyword, ("category", rank, cat), whole_word=True)
+        rank = 0
+        for card, card_benefits in (benefits or {}).items():
+            for benefit, details in card_benefits.items():
+                for keyword in details.get("keywords", []):
+                    self.automaton.add(keyword, ("benefit", rank, (card, benefit)))
+                rank += 1
+        self.automaton.build()
+        self.memo = {}
+
+    def match(self, merchant):
+        result = self.memo.get(merchant)
+        if result is None:
+            best = {}
+            benefit_hits = {}
+            for kind, rank, value in self.automaton.search(merchant):
+                if kind == "benefit":
+                    benefit_hits[rank] = value
+                elif kind not in best or rank < best[kind][0]:
+                    best[kind] = (rank, value)
+            result = MerchantMatch(
+                best["override"][1] if "override" in best else None,
+                best["category"][1] if "category" in best else None,
+                [benefit_hits[r] for r in sorted(benefit_hits)],
+            )
+            self.memo[merchant] = result
+        return result
+
+def _load_json(path):
+    if path and os.path.exists(path):
+        with open(path, "r") as f:
+            try: return json.load(f)
+            except: return {}
+    return {}
+
+def build_matcher(config, root_dir=""):
+    """Builds the matcher from the overrides, categories and benefits files named in the config."""
+    paths = config.get("paths", {})
+    return MerchantMatcher(
+        _load_json(os.path.join(root_dir, paths.get("category_overrides", "config/category_overrides.json"))),
+        _load_json(os.path.join(root_dir, paths.get("categories", "config/categories.json"))),
+        _load_json(os.path.join(root_dir, paths.get("benefits", "config/benefits.json"))),
+    )
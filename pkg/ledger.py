@@ -0,0 +1,202 @@
+import csv
+import os
+from array import array
+from datetime import date
+
+from pkg.state import temp_path
+from pkg.store import LEDGER_FIELDS
+
+# Rows whose date is not YYYY-MM-DD sort first, as they would as strings among ISO dates
+INVALID_DAY = 0
+CENTS_MASK = (1 << 48) - 1
+
+def parse_cents(amount):
+    return int(round(float(amount) * 100))
+
+def format_cents(cents):
+    return f"{cents / 100:.2f}"
+
+class CompactLedger:
+    """
+    The ledger as column arrays: dates as day ordinals, amounts as integer cents, and
+    merchants and categories as codes into per-ledger string tables. A row costs about
+    20 bytes instead of a dict of five strings, repeated merchants share one string, and
+    per-merchant work (cleanup, categorization, benefit matching) runs once per distinct
+    merchant through the tables.
+    """
+
+    def __init__(self):
+        self.days = array("i")
+        self.cents = array("q")
+        self.merchant_codes = array("I")
+        self.category_codes = array("I")
+        self.merchants = []
+        self.merchant_index = {}
+        self.categories = [""]
+        self.category_index = {"": 0}
+        self.day_index = {}
+        self.day_names = {}
+        self.invalid_dates = {}  # row -> original text, for the rare row without an ISO date
+
+    def __len__(self):
+        return len(self.days)
+
+    def intern_merchant(self, name):
+        code = self.merchant_index.get(name)
+        if code is None:
+            code = self.merchant_index[name] = len(self.merchants)
+            self.merchants.append(name)
+        return code
+
+    def intern_category(self, name):
+        code = self.category_index.get(name)
+        if code is None:
+            code = self.category_index[name] = len(self.categories)
+            self.categories.append(name)
+        return code
+
+    def _day(self, text):
+        day = self.day_index.get(text)
+        if day is None:
+            try:
+                day = date.fromisoformat(text).toordinal()
+                self.day_names[day] = text
+            except (TypeError, ValueError):
+                day = INVALID_DAY
+            self.day_index[text] = day
+        return day
+
+    def append(self, date_text, amount, merchant, category=""):
+        day = self._day(date_text)
+        if day == INVALID_DAY: self.invalid_dates[len(self.days)] = date_text
+        self.days.append(day)
+        self.cents.append(parse_cents(amount))
+        self.merchant_codes.append(self.intern_merchant(merchant))
+        self.category_codes.append(self.intern_category(category or ""))
+
+    @classmethod
+    def load_csv(cls, path):
+        ledger = cls()
+        with open(path, "r", newline="") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if not header: return ledger
+            cols = {name: i for i, name in enumerate(header)}
+            d, a, m = cols["date"], cols["amount"], cols["merchant"]
+            c = cols.get("category")
+            # The same dates, prices, merchants and categories recur all through a ledger,
+            # so each distinct string is converted once
+            day_index, cents_index = ledger.day_index, {}
+            merchant_index, category_index = ledger.merchant_index, ledger.category_index
+            days, cents, merchant_codes, category_codes = ledger.days, ledger.cents, ledger.merchant_codes, ledger.category_codes
+            for row in reader:
+                if not row: continue
+                day = day_index.get(row[d])
+                if day is None: day = ledger._day(row[d])
+                if day == INVALID_DAY: ledger.invalid_dates[len(days)] = row[d]
+                amount = cents_index.get(row[a])
+                if amount is None: amount = cents_index[row[a]] = parse_cents(row[a])
+                code = merchant_index.get(row[m])
+                if code is None: code = ledger.intern_merchant(row[m])
+                category = row[c] if c is not None and c < len(row) else ""
+                category_code = category_index.get(category)
+                if category_code is None: category_code = ledger.intern_category(category)
+                days.append(day)
+                cents.append(amount)
+                merchant_codes.append(code)
+                category_codes.append(category_code)
+        return ledger
+
+    def date_text(self, i):
+        day = self.days[i]
+        return self.invalid_dates.get(i, "") if day == INVALID_DAY else self.day_names[day]
+
+    def row(self, i):
+        return {
+            "date": self.date_text(i),
+            "amount": format_cents(self.cents[i]),
+            "merchant": self.merchants[self.merchant_codes[i]],
+            "category": self.categories[self.category_codes[i]],
+        }
+
+    def normalize(self, fix, first_new, start=0):
+        """
+        Passes the merchant of every row from start on through fix(name), which returns
+        (merchant, fixed cents or None, forced category or None, ignore). fix runs once per
+        distinct merchant. Rows are renamed, re-priced and re-categorized in place.
+        Returns (whether a row before first_new changed, [(merchant, old, new cents)],
+        the set of ignored rows).
+        """
+        fixes = {}
+        history_changed = False
+        adjusted = []
+        ignored = set()
+        codes, cents, category_codes = self.merchant_codes, self.cents, self.category_codes
+        for i in range(start, len(codes)):
+            old_code = codes[i]
+            fixed = fixes.get(old_code)
+            if fixed is None:
+                merchant, amount, category, ignore = fix(self.merchants[old_code])
+                fixed = fixes[old_code] = (
+                    self.intern_merchant(merchant), amount,
+                    None if category is None else self.intern_category(category), ignore,
+                )
+            code, amount, category_code, ignore = fixed
+            if ignore:
+                ignored.add(i)
+                if i < first_new: history_changed = True
+                continue
+            if code != old_code:
+                codes[i] = code
+                if i < first_new: history_changed = True
+            if amount is not None and cents[i] != amount:
+                adjusted.append((self.merchants[code], cents[i], amount))
+                cents[i] = amount
+                if i < first_new: history_changed = True
+            if category_code is not None and category_codes[i] != category_code:
+                category_codes[i] = category_code
+        return history_changed, adjusted, ignored
+
+    def dedup_sorted(self, skip=()):
+        """
+        Returns (kept row numbers ordered by date, duplicate row numbers), leaving out the
+        rows in skip. The first row of each (date, amount, merchant) is kept and rows of the
+        same day keep their order.
+        """
+        seen = set()
+        kept, duplicates = [], []
+        days, cents, codes = self.days, self.cents, self.merchant_codes
+        for i in range(len(days)):
+            if i in skip: continue
+            # One int per key instead of a tuple of strings
+            key = (((days[i] << 24) | codes[i]) << 48) | (cents[i] & CENTS_MASK)
+            if i in self.invalid_dates: key = (self.invalid_dates[i], key)
+            if key in seen:
+                duplicates.append(i)
+            else:
+                seen.add(key)
+                kept.append(i)
+        kept.sort(key=days.__getitem__)
+        return kept, duplicates
+
+    def write_csv(self, path, order):
+        """Atomically writes the rows in order with a running total, computed in cents."""
+        tmp_path = temp_path(path)
+        total = 0
+        merchants, categories = self.merchants, self.categories
+        days, cents, merchant_codes, category_codes = self.days, self.cents, self.merchant_codes, self.category_codes
+        day_names, amounts = self.day_names, {}
+        with open(tmp_path, "w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(LEDGER_FIELDS)
+            for i in order:
+                amount = cents[i]
+                text = amounts.get(amount)
+                if text is None: text = amounts[amount] = format_cents(amount)
+                total += amount
+                day = days[i]
+                writer.writerow((
+                    day_names[day] if day != INVALID_DAY else self.invalid_dates.get(i, ""), text,
+                    merchants[merchant_codes[i]], categories[category_codes[i]], round(total / 100, 2),
+                ))
+        os.replace(tmp_path, path)
@@ -3,9 +3,28 @@ import os
 import sys
 from datetime import datetime
 
-# Path to the data files
-MANUAL_CREDITS_PATH = os.path.join(os.path.dirname(__file__), 'manual_credits.json')
-BENEFITS_PATH = os.path.join(os.path.dirname(__file__), 'benefits.json')
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from pkg.state import get_state
+
+def load_config():
+    config_path = os.path.join(root_dir, "config/spend_tracker.json")
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, "r") as f:
+                return json.load(f)
+        except:
+            pass
+    return {}
+
+def get_data_path(config, key, default):
+    return os.path.join(root_dir, config.get("paths", {}).get(key, default))
+
+def get_manual_credits_state(config):
+    """Manual spend per card, benefit and period, shared with report.py."""
+    return get_state(get_data_path(config, "manual_credits", "config/manual_credits.json"), indent=2)
 
 def get_period_key(reset_cycle, date_obj):
     """Generates a unique key for the current period based on the reset cycle."""
@@ -18,13 +37,15 @@ def get_period_key(reset_cycle, date_obj):
         return f"{date_obj.year}-P{period}"
     return 'all'
 
-def add_manual_spend(amount, benefit_key):
+def add_manual_spend(amount, benefit_key, config=None):
     """Records manual spending for a specific benefit period."""
-    if not os.path.exists(BENEFITS_PATH):
+    config = config or load_config()
+    benefits_path = get_data_path(config, "benefits", "config/benefits.json")
+    if not os.path.exists(benefits_path):
         print("Error: benefits.json not found.")
         return
 
-    with open(BENEFITS_PATH, 'r') as f:
+    with open(benefits_path, 'r') as f:
         benefits_config = json.load(f)
 
     # Find the card for this benefit key
@@ -40,29 +61,15 @@ def add_manual_spend(amount, benefit_key):
         print(f"Error: Benefit key '{benefit_key}' not found.")
         return
 
-    # Load existing manual spend data
-    data = {}
-    if os.path.exists(MANUAL_CREDITS_PATH):
-        with open(MANUAL_CREDITS_PATH, 'r') as f:
-            try:
-                data = json.load(f)
-            except:
-                data = {}
+    period_key = get_period_key(reset_cycle, datetime.now())
 
-    now = datetime.now()
-    period_key = get_period_key(reset_cycle, now)
-    
-    if target_card not in data:
-        data[target_card] = {}
-    if benefit_key not in data[target_card]:
-        data[target_card][benefit_key] = {}
-    
-    # Add the spend to the current period's manual total
-    current_val = data[target_card][benefit_key].get(period_key, 0.0)
-    data[target_card][benefit_key][period_key] = round(current_val + float(amount), 2)
+    def add(data):
+        # Add the spend to the current period's manual total
+        periods = data.setdefault(target_card, {}).setdefault(benefit_key, {})
+        periods[period_key] = round(periods.get(period_key, 0.0) + float(amount), 2)
 
-    with open(MANUAL_CREDITS_PATH, 'w') as f:
-        json.dump(data, f, indent=2)
+    # Re-reads and writes under a lock, so entries made at the same time are all kept
+    get_manual_credits_state(config).update(add)
     
     print(f"Recorded ${amount} manual spend for {benefit_key} ({period_key}).")
 
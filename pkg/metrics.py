@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from pkg.state import temp_path
+
+PREFIX = "spend_tracker"
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+def _format_key(name, label_items, quote=False):
+    if not label_items: return name
+    if quote:
+        inner = ",".join(f'{k}="{v}"' for k, v in label_items)
+    else:
+        inner = ",".join(f"{k}={v}" for k, v in label_items)
+    return f"{name}{{{inner}}}"
+
+class Metrics:
+    """
+    Counters and timings for one sync run. Both are keyed by a name plus optional labels
+    (e.g. stage="fetch"); timings keep count, sum and max seconds. Recording takes a lock,
+    so fetch threads can share one instance; parse worker processes report through the
+    parse info that ParserRegistry.record() receives instead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timings = {}
+            self.started = time.time()
+
+    def inc(self, name, n=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            entry = self.timings.get(key)
+            if entry is None:
+                self.timings[key] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]: entry[2] = seconds
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Times the body of a with block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "timestamp": int(time.time()),
+                "run_seconds": round(time.time() - self.started, 3),
+                "counters": {_format_key(n, l): v for (n, l), v in sorted(self.counters.items())},
+                "timings": {
+                    _format_key(n, l): {"count": c, "sum": round(s, 6), "max": round(m, 6)}
+                    for (n, l), (c, s, m) in sorted(self.timings.items())
+                },
+            }
+
+    def to_prometheus(self):
+        """Renders the node_exporter textfile format. Values cover the last run only."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        typed = set()
+        for (name, labels), value in counters:
+            full = f"{PREFIX}_{name}"
+            if full not in typed:
+                lines.append(f"# TYPE {full} gauge")
+                typed.add(full)
+            lines.append(f"{_format_key(full, labels, quote=True)} {value}")
+        for (name, labels), (count, total, peak) in timings:
+            full = f"{PREFIX}_{name}"
+            if full not in typed:
+                lines.append(f"# TYPE {full} summary")
+                lines.append(f"# TYPE {full}_max gauge")
+                typed.add(full)
+            lines.append(f"{_format_key(full + '_count', labels, quote=True)} {count}")
+            lines.append(f"{_format_key(full + '_sum', labels, quote=True)} {total:.6f}")
+            lines.append(f"{_format_key(full + '_max', labels, quote=True)} {peak:.6f}")
+        lines.append(f"# TYPE {PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{PREFIX}_last_run_timestamp_seconds {int(time.time())}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """Records consecutive stages of a run as stage_seconds{stage=...} without nesting with blocks."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe("stage_seconds", now - self.last, stage=stage)
+        self.last = now
+
+# Shared by everything in this process, like PARSER_REGISTRY in main.py
+METRICS = Metrics()
+
+def _write_atomic(path, text):
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_snapshot(config, metrics=METRICS, root_dir=""):
+    """Writes the run's metrics to paths.metrics_prom (Prometheus textfile) and paths.metrics_json."""
+    paths = config.get("paths", {})
+    try:
+        _write_atomic(os.path.join(root_dir, paths.get("metrics_prom", "metrics.prom")), metrics.to_prometheus())
+        _write_atomic(os.path.join(root_dir, paths.get("metrics_json", "metrics.json")), json.dumps(metrics.to_dict(), indent=2))
+    except OSError as e:
+        print(f"Could not write metrics: {e}")
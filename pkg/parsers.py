@@ -0,0 +1,170 @@
+import re
+import time
+from html.parser import HTMLParser
+
+from pkg.metrics import METRICS
+
+# Alerts put the transaction near the top; never run the patterns over more text than this
+MAX_TEXT_CHARS = 20000
+
+class _TextExtractor(HTMLParser):
+    """Streams through the HTML collecting text nodes, without building a document tree."""
+    SKIPPED_TAGS = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS: self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self.skip_depth: self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth: self.chunks.append(data)
+
+def html_to_text(body):
+    """Returns the visible text of an HTML body with all whitespace collapsed to single spaces."""
+    extractor = _TextExtractor()
+    extractor.feed(body or "")
+    extractor.close()
+    return ' '.join(' '.join(extractor.chunks).split())
+
+def clean_merchant_name(name):
+    """Cleans up common formatting patterns in merchant names (e.g. 'on [date] at [merchant]')."""
+    if " at " in name:
+        name = name.split(" at ")[-1]
+    name = name.strip(" '\".,")
+    return name
+
+# The lazy gaps are bounded so a miss cannot backtrack across the whole body.
+PATTERNS = {
+    # Pattern A: "Amount: $X ... Where: Y" (Bank of America format)
+    "A": re.compile(r"Amount:\s+\$(?P<amount>[\d,.]+).{0,300}?Where:\s+(?P<merchant>[^.\n]+?)(?:\s+View|\s+Date|\.)", re.IGNORECASE),
+    # Pattern B: Amex Large Purchase format ("Merchant $Amount* Day, Month Date, Year")
+    "B": re.compile(r"(?P<merchant>[A-Za-z0-9\s#&-]{2,30}?)\s+\$(?P<amount>[\d,.]+)\*\s+[A-Za-z]{3},\s+[A-Za-z]{3}\s+\d", re.IGNORECASE),
+    # Pattern C: "Amount: $X ... Merchant: Y" (Amex/forwarded formats)
+    "C": re.compile(r"Amount:\s+\$(?P<amount>[\d,.]+).{0,300}?Merchant:\s+(?P<merchant>[^.\n]+)", re.DOTALL | re.IGNORECASE),
+    # Pattern D: "at Y, a pending ... amount of $X" (Capital One)
+    "D": re.compile(r"at\s+(?P<merchant>.{1,80}?),\s+a\s+pending.{0,200}?amount\s+of\s+\$(?P<amount>[\d,.]+)", re.IGNORECASE),
+    # Pattern E: Generic Fallback (Matches "$10.00 at Starbucks", "charged $88.18 at Lowe's")
+    "E": re.compile(r"\$(?P<amount>[\d,.]+)\s+at\s+(?P<merchant>[^.]{2,40}?)(?:\s+on|\.|\s+at|\s+ending|\s+card|\s+for|\s+date|\s+was|\s+approved)", re.IGNORECASE),
+    "E2": re.compile(r"\$(?P<amount>[\d,.]+).{0,200}?at\s+(?P<merchant>[^.]{2,40}?)(?:\s+on|\.|\s+at|\s+ending|\s+card|\s+for|\s+date|\s+was|\s+approved)", re.IGNORECASE),
+}
+
+class BankParser:
+    """A set of precompiled patterns for one bank, selected by sender domain or subject."""
+
+    def __init__(self, name, senders=(), subject=None, patterns=()):
+        self.name = name
+        self.senders = tuple(s.lower() for s in senders)
+        self.subject_re = re.compile(subject, re.IGNORECASE) if subject else None
+        self.patterns = [(label, PATTERNS[label]) for label in patterns]
+
+    def matches_sender(self, sender):
+        return any(domain in sender for domain in self.senders)
+
+    def matches_subject(self, subject):
+        return bool(self.subject_re and self.subject_re.search(subject))
+
+    def missed_labels(self, matched_label):
+        labels = [label for label, _ in self.patterns]
+        return labels[:labels.index(matched_label)] if matched_label in labels else labels
+
+    def parse_text(self, text):
+        """Returns (transaction, pattern label) for the first matching pattern, or (None, None)."""
+        for label, pattern in self.patterns:
+            match = pattern.search(text)
+            if match:
+                res = match.groupdict()
+                res['amount'] = res['amount'].replace(',', '')
+                res['merchant'] = clean_merchant_name(' '.join(res['merchant'].split()))
+                return res, label
+        return None, None
+
+class ParserRegistry:
+    """
+    Dispatches each email straight to its bank's parser using the From and Subject headers.
+    Unknown senders, and known senders whose template did not match, go through the
+    generic fallback cascade. Hit counts and time spent are tracked per parser.
+    """
+
+    def __init__(self, parsers, fallback):
+        self.parsers = list(parsers)
+        self.fallback = fallback
+        self.stats = {}
+
+    def classify(self, sender="", subject=""):
+        """Returns the bank parser for a message, or None for unknown senders."""
+        sender = sender.lower()
+        for parser in self.parsers:
+            if parser.matches_sender(sender):
+                return parser
+        for parser in self.parsers:
+            if parser.matches_subject(subject):
+                return parser
+        return None
+
+    def parse(self, body, sender="", subject=""):
+        """
+        Parses an HTML email body. Returns (transaction or None, info) where info describes
+        which parser ran and can be passed to record() in the process that keeps the stats.
+        """
+        started = time.perf_counter()
+        text = html_to_text(body)[:MAX_TEXT_CHARS]
+        html_seconds = time.perf_counter() - started
+        parser = self.classify(sender, subject)
+        transaction, label = parser.parse_text(text) if parser else (None, None)
+        used = parser
+        # Patterns are tried in order, so every one before the match (or all of them) missed
+        misses = [(parser.name, l) for l in parser.missed_labels(label)] if parser else []
+        if not transaction:
+            transaction, label = self.fallback.parse_text(text)
+            if transaction: used = self.fallback
+            misses += [(self.fallback.name, l) for l in self.fallback.missed_labels(label)]
+        info = {
+            "parser": (parser or self.fallback).name,
+            "matched_by": used.name if transaction else None,
+            "pattern": label,
+            "misses": misses,
+            "html_seconds": html_seconds,
+            "seconds": time.perf_counter() - started,
+        }
+        return transaction, info
+
+    def record(self, info):
+        entry = self.stats.setdefault(info["parser"], {"calls": 0, "hits": 0, "misses": 0, "seconds": 0.0, "patterns": {}})
+        entry["calls"] += 1
+        entry["seconds"] += info["seconds"]
+        if info["matched_by"] == info["parser"]:
+            entry["hits"] += 1
+        else:
+            entry["misses"] += 1
+        if info["pattern"]:
+            key = f"{info['matched_by']}:{info['pattern']}"
+            entry["patterns"][key] = entry["patterns"].get(key, 0) + 1
+            METRICS.inc("regex_pattern_hits", parser=info["matched_by"], pattern=info["pattern"])
+        for parser, pattern in info.get("misses", []):
+            METRICS.inc("regex_pattern_misses", parser=parser, pattern=pattern)
+        METRICS.inc("emails_parsed", parser=info["parser"], result="hit" if info["matched_by"] else "miss")
+        METRICS.observe("parse_seconds", info["seconds"], parser=info["parser"])
+        if "html_seconds" in info: METRICS.observe("html_to_text_seconds", info["html_seconds"])
+
+    def summary(self):
+        lines = []
+        for name, entry in sorted(self.stats.items()):
+            avg_ms = entry["seconds"] / entry["calls"] * 1000 if entry["calls"] else 0
+            lines.append(f"  {name}: {entry['hits']} hits, {entry['misses']} misses, {avg_ms:.1f} ms avg")
+        return "\n".join(lines)
+
+def build_default_registry():
+    parsers = [
+        BankParser("bank_of_america", senders=["bankofamerica.com"], subject=r"exceeds\s+(?:the\s+)?alert", patterns=["A"]),
+        BankParser("amex", senders=["americanexpress.com", "aexp.com"], subject=r"large\s+purchase\s+approved", patterns=["B", "C"]),
+        BankParser("capital_one", senders=["capitalone.com"], subject=r"new\s+transaction\s+(?:was\s+)?charged", patterns=["D", "E"]),
+        BankParser("us_bank", senders=["usbank.com"], patterns=["E", "E2"]),
+    ]
+    fallback = BankParser("generic", patterns=["A", "B", "C", "D", "E", "E2"])
+    return ParserRegistry(parsers, fallback)
@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from pkg.gmail_batch import fetch_alert_messages, fetch_messages, get_batch_size, get_quota_limiter
+
+_DONE = object()
+_SKIPPED = object()
+
+def get_pipeline_settings(config):
+    """Reads worker counts and queue size from the "pipeline" section of spend_tracker.json."""
+    settings = config.get("pipeline", {})
+    fetch_workers = max(1, int(settings.get("fetch_workers", 2)))
+    # 0 (the default) means one parse worker per CPU core
+    parse_workers = int(settings.get("parse_workers", 0)) or os.cpu_count() or 1
+    queue_size = max(1, int(settings.get("queue_size", 64)))
+    return fetch_workers, parse_workers, queue_size
+
+def _fetch_worker(config, service_factory, chunks, fetched, is_candidate, known, limiter):
+    """
+    Pulls chunks of IDs, fetches them with one batch request each and queues the results.
+    Every worker draws on the same limiter, so together they stay inside the per-user quota.
+    """
+    try:
+        service = service_factory()  # googleapiclient services are not thread-safe
+    except Exception as e:
+        print(f"Fetch worker could not build a Gmail client: {e}")
+        service = None
+    while True:
+        item = chunks.get()
+        if item is _DONE:
+            break
+        base, chunk = item
+        results, skipped = {}, ()
+        if service is not None:
+            try:
+                if is_candidate:
+                    results, skipped = fetch_alert_messages(service, chunk, config, is_candidate, limiter=limiter, known=known)
+                    skipped = set(skipped)
+                else:
+                    results = fetch_messages(service, chunk, config, limiter=limiter)
+            except Exception as e:
+                print(f"Fetch worker failed: {e}")
+        for offset, msg_id in enumerate(chunk):
+            fetched.put((base + offset, msg_id, _SKIPPED if msg_id in skipped else results.get(msg_id)))
+    fetched.put(_DONE)
+
+def run_pipeline(config, service_factory, msg_ids, parse_fn, commit_fn, pool=None, is_candidate=None, known=()):
+    """
+    Runs fetch -> decode/parse -> commit as concurrent stages connected by bounded queues.
+    Fetch workers are threads (network bound), parse_fn runs in a process pool (CPU bound),
+    and commit_fn(msg_id, parsed) is called on the calling thread in the order of msg_ids.
+    Messages that could not be fetched are committed with parsed=None.
+    With is_candidate(headers), messages are fetched metadata first (fetch_alert_messages)
+    and the ones it rejects are never downloaded, parsed or committed. IDs in known come
+    from bank senders and skip the metadata request.
+    A long-lived caller can pass its own pool; otherwise one is created for this run.
+    """
+    if not msg_ids:
+        return
+    fetch_workers, parse_workers, queue_size = get_pipeline_settings(config)
+    batch_size = get_batch_size(config)
+
+    chunks = queue.Queue()
+    for base in range(0, len(msg_ids), batch_size):
+        chunks.put((base, msg_ids[base:base + batch_size]))
+    fetch_workers = min(fetch_workers, chunks.qsize())
+    for _ in range(fetch_workers):
+        chunks.put(_DONE)
+
+    fetched = queue.Queue(maxsize=queue_size)
+    # Gmail's quota is per user; without a shared bucket each worker would pace itself to all of it
+    limiter = get_quota_limiter(config)
+    threads = [threading.Thread(target=_fetch_worker, args=(config, service_factory, chunks, fetched, is_candidate, known, limiter), daemon=True) for _ in range(fetch_workers)]
+    for t in threads:
+        t.start()
+
+    owns_pool = pool is None and parse_workers > 1
+    if owns_pool:
+        pool = ProcessPoolExecutor(max_workers=parse_workers)
+    pending = {}  # seq -> (msg_id, future, or the parsed result when running inline)
+    next_seq = 0
+    finished_workers = 0
+
+    def commit_ready(block):
+        nonlocal next_seq
+        while next_seq in pending:
+            msg_id, result = pending[next_seq]
+            if hasattr(result, "result"):
+                if not block and not result.done():
+                    return
+                result = result.result()
+            del pending[next_seq]
+            if result is not _SKIPPED: commit_fn(msg_id, result)
+            next_seq += 1
+            block = False
+
+    try:
+        while finished_workers < fetch_workers:
+            item = fetched.get()
+            if item is _DONE:
+                finished_workers += 1
+                continue
+            seq, msg_id, msg = item
+            if msg is None or msg is _SKIPPED:
+                pending[seq] = (msg_id, msg)
+            elif pool:
+                pending[seq] = (msg_id, pool.submit(parse_fn, msg))
+            else:
+                pending[seq] = (msg_id, parse_fn(msg))
+            # Keep at most queue_size parsed messages waiting for the committer
+            commit_ready(block=len(pending) >= queue_size)
+        while pending:
+            commit_ready(block=True)
+    finally:
+        if owns_pool:
+            pool.shutdown(cancel_futures=True)
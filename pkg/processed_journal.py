@@ -0,0 +1,183 @@
+import heapq
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+from pkg.state import file_lock
+
+SNAPSHOT_MAGIC = b"PMID1\n"
+# Gmail message IDs are 16 hex digits, which pack into one unsigned 64-bit integer
+GMAIL_ID = re.compile(r"[0-9a-f]{16}")
+MERGE_AFTER = 4096
+
+def _unique(sorted_values):
+    previous = None
+    for value in sorted_values:
+        if value != previous: yield value
+        previous = value
+
+class ProcessedIds:
+    """
+    Set of processed message IDs. Gmail IDs are kept as a sorted array of 8-byte integers
+    searched with bisect, plus a small set of IDs added since the last merge. Anything else
+    (the recurring-expense pseudo IDs) goes in an ordinary set.
+    """
+
+    def __init__(self):
+        self.packed = array("Q")
+        self.recent = set()
+        self.other = set()
+
+    def __contains__(self, msg_id):
+        if GMAIL_ID.fullmatch(msg_id):
+            n = int(msg_id, 16)
+            if n in self.recent: return True
+            i = bisect_left(self.packed, n)
+            return i < len(self.packed) and self.packed[i] == n
+        return msg_id in self.other
+
+    def __len__(self):
+        return len(self.packed) + len(self.recent) + len(self.other)
+
+    def add(self, msg_id):
+        """Adds msg_id. Returns False if it was already present."""
+        if msg_id in self: return False
+        if GMAIL_ID.fullmatch(msg_id):
+            self.recent.add(int(msg_id, 16))
+            if len(self.recent) >= MERGE_AFTER: self.merge()
+        else:
+            self.other.add(msg_id)
+        return True
+
+    def merge(self):
+        """Folds recently added IDs into the sorted array. Always builds a new array."""
+        if self.recent:
+            self.packed = array("Q", heapq.merge(self.packed, sorted(self.recent)))
+            self.recent = set()
+
+class ProcessedJournal:
+    """
+    Processed message IDs on disk: a binary snapshot plus the processed_messages.txt
+    journal, which only ever gets appended to and is fsync'd once per batch. When the
+    journal reaches processed_journal.compact_after lines it is rotated and a new snapshot
+    is written on a background thread. The snapshot is written to a temp file and renamed
+    into place, and the rotated journal is kept until that finishes, so a crash at any
+    point loses nothing. Loading, appends and compaction hold the journal's file lock, and the
+    snapshot is built from what is on disk, so IDs appended by another process that this
+    one never loaded are kept.
+    """
+
+    def __init__(self, config, root_dir=""):
+        paths = config["paths"]
+        self.journal_path = os.path.join(root_dir, paths["processed_messages"])
+        self.snapshot_path = os.path.join(root_dir, paths.get("processed_snapshot", "processed_messages.bin"))
+        self.rotated_path = self.journal_path + ".old"
+        self.compact_after = config.get("processed_journal", {}).get("compact_after", 5000)
+        self.ids = ProcessedIds()
+        self.journal_lines = 0
+        self.needs_newline = False
+        self.compactor = None
+        self.load()
+
+    def load(self):
+        # Under the lock so a compaction in another process can't rotate the journal between the reads
+        with file_lock(self.journal_path):
+            self._read_snapshot(self.ids)
+            self._read_journal(self.rotated_path, self.ids)
+            text = self._read_journal(self.journal_path, self.ids)
+        if text is not None:
+            self.journal_lines = sum(1 for i in text.splitlines() if i)
+            self.needs_newline = bool(text) and not text.endswith("\n")
+        self.ids.merge()
+
+    def _read_snapshot(self, ids):
+        if not os.path.exists(self.snapshot_path): return
+        with open(self.snapshot_path, "rb") as f:
+            data = f.read()
+        if not data.startswith(SNAPSHOT_MAGIC): return
+        offset = len(SNAPSHOT_MAGIC)
+        count, = struct.unpack_from("<Q", data, offset)
+        offset += 8
+        ids.packed.frombytes(data[offset:offset + count * 8])
+        if sys.byteorder != "little": ids.packed.byteswap()
+        offset += count * 8
+        ids.other.update(i for i in data[offset:].decode("utf-8").splitlines() if i)
+
+    @staticmethod
+    def _read_journal(path, ids):
+        """Adds the IDs in a journal file to ids and returns its text, or None if it does not exist."""
+        if not os.path.exists(path): return None
+        with open(path, "r") as f:
+            text = f.read()
+        for msg_id in text.splitlines():
+            if msg_id: ids.add(msg_id)
+        return text
+
+    def append(self, new_ids):
+        """Records committed message IDs in commit order with one write and one fsync."""
+        new_ids = [i for i in dict.fromkeys(new_ids) if i not in self.ids]
+        if not new_ids: return
+        # Holding the lock keeps the write from landing in a journal that is being rotated
+        with file_lock(self.journal_path), open(self.journal_path, "a") as f:
+            # A crash can leave a partial last line; don't glue the next ID onto it
+            if self.needs_newline: f.write("\n")
+            f.write("".join(f"{i}\n" for i in new_ids))
+            f.flush()
+            os.fsync(f.fileno())
+        self.needs_newline = False
+        for msg_id in new_ids: self.ids.add(msg_id)
+        self.journal_lines += len(new_ids)
+        if self.compact_after and self.journal_lines >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        """Rotates the journal and writes a fresh snapshot in the background."""
+        if self.compactor and self.compactor.is_alive(): return
+        self.journal_lines = 0
+        self.needs_newline = False
+        self.ids.merge()
+        # merge() never mutates an array in place, so the thread can use this one as is
+        self.compactor = threading.Thread(target=self._compact, args=(self.ids.packed, set(self.ids.other)))
+        self.compactor.start()
+
+    def _compact(self, packed, other):
+        """
+        Under the journal lock: rotates the journal, merges the snapshot and rotated journal
+        on disk (which include other processes' appends) with this process's IDs, writes the
+        new snapshot and only then deletes the rotated journal.
+        """
+        with file_lock(self.journal_path):
+            if not os.path.exists(self.rotated_path) and os.path.exists(self.journal_path):
+                os.replace(self.journal_path, self.rotated_path)
+            on_disk = ProcessedIds()
+            self._read_snapshot(on_disk)
+            self._read_journal(self.rotated_path, on_disk)
+            on_disk.merge()
+            packed = array("Q", _unique(heapq.merge(on_disk.packed, packed)))
+            self._write_snapshot(packed, sorted(on_disk.other | other))
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+    def _write_snapshot(self, packed, other):
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        if sys.byteorder != "little":
+            packed = array("Q", packed)
+            packed.byteswap()
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack("<Q", len(packed)))
+            f.write(packed.tobytes())
+            f.write("".join(f"{i}\n" for i in other).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def wait(self):
+        """Blocks until a running compaction has finished."""
+        if self.compactor:
+            self.compactor.join()
+            self.compactor = None
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bodies (
+    sha256 TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY,
+    msg_id TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    gemini TEXT,
+    ledger_row TEXT
+);
+"""
+
+# Only the headers the parsers and the date fallback look at are kept
+ARCHIVED_HEADERS = ("From", "Subject", "Date")
+
+def get_archive_path(config, root_dir=""):
+    return os.path.join(root_dir, config.get("paths", {}).get("raw_archive", "raw_archive.db"))
+
+class RawArchive:
+    """
+    Local copy of every fetched alert email, so parsing changes can be replayed over
+    history without Gmail. Bodies are zlib-compressed and stored once per SHA-256 of
+    their content (bank alerts repeat a lot); messages map a Gmail ID to a body, the
+    headers, the Gemini result if Gemini parsed it, and the row written to the ledger
+    (or {"duplicate_of": account} for an alert already booked from another mailbox).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, msg_id, headers, body):
+        data = body.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        kept = [h for h in headers if h["name"] in ARCHIVED_HEADERS]
+        self.conn.execute("INSERT OR IGNORE INTO bodies (sha256, data) VALUES (?, ?)", (digest, zlib.compress(data, 6)))
+        self.conn.execute(
+            "INSERT INTO messages (msg_id, sha256, headers) VALUES (?, ?, ?) "
+            "ON CONFLICT (msg_id) DO UPDATE SET sha256 = excluded.sha256, headers = excluded.headers",
+            (msg_id, digest, json.dumps(kept))
+        )
+
+    def set_result(self, msg_id, ledger_row, gemini=None):
+        """Records the row a message produced (None if none), and Gemini's answer if it was used."""
+        self.conn.execute(
+            "UPDATE messages SET ledger_row = ?, gemini = COALESCE(?, gemini) WHERE msg_id = ?",
+            (json.dumps(ledger_row) if ledger_row else None, json.dumps(gemini) if gemini else None, msg_id)
+        )
+
+    def mark_duplicate(self, msg_id, owner):
+        """Records that the message was a copy of an alert booked for account owner, so reparse leaves it out."""
+        self.conn.execute("UPDATE messages SET ledger_row = ? WHERE msg_id = ?", (json.dumps({"duplicate_of": owner}), msg_id))
+
+    def commit(self):
+        self.conn.commit()
+
+    def iter_messages(self):
+        """Yields (msg_id, headers, body, gemini result, previous ledger row) in archive order."""
+        cur = self.conn.execute(
+            "SELECT m.msg_id, m.headers, b.data, m.gemini, m.ledger_row FROM messages m "
+            "JOIN bodies b ON b.sha256 = m.sha256 ORDER BY m.seq"
+        )
+        for msg_id, headers, data, gemini, ledger_row in cur:
+            yield (msg_id, json.loads(headers), zlib.decompress(data).decode("utf-8"),
+                   json.loads(gemini) if gemini else None, json.loads(ledger_row) if ledger_row else None)
+
+def open_archive(config, root_dir=""):
+    """Returns the RawArchive if archive.enabled is set in spend_tracker.json, else None."""
+    if not config.get("archive", {}).get("enabled", False):
+        return None
+    return RawArchive(get_archive_path(config, root_dir))
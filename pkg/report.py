@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 
 import json
-import csv
 from datetime import datetime
 import os
+import sys
 
 # Get the directory of the current script and the root project directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
 root_dir = os.path.dirname(script_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from pkg.manual_transaction import get_manual_credits_state, get_period_key
+from pkg.aggregate import SpendingAggregates
+from pkg.rollups import get_rollups, load_benefits_file
+from pkg.store import iter_ledger_rows
 
 def load_config():
     config_path = os.path.join(root_dir, "config/spend_tracker.json")
@@ -19,129 +26,72 @@ def load_config():
             pass
     return {}
 
-def get_biannual_period(date_obj):
-    """Returns the biannual period (1 for Jan-Jun, 2 for Jul-Dec) for a given date."""
-    if 1 <= date_obj.month <= 6:
-        return 1
-    else:
-        return 2
-
-def calculate_spending():
+def calculate_spending(config=None, rollups=None):
     """
-    Calculates total spending and benefit progress on the fly from the transactions log.
+    Calculates total spending and benefit progress from the persisted rollups.
+    The rollups only need updating for rows added since their checkpoint, so this is a
+    lookup per benefit rather than a scan of the whole ledger. A long-running caller can
+    pass rollups it already holds when only the date or the manual credits changed.
     """
-    config = load_config()
-    
-    benefits_rel = config.get("paths", {}).get("benefits", "config/benefits.json")
-    benefits_path = os.path.join(root_dir, benefits_rel)
-    
-    transactions_rel = config.get("paths", {}).get("transactions_csv", "transactions.csv")
-    transactions_path = os.path.join(root_dir, transactions_rel)
-
-    # Load benefit rules
-    with open(benefits_path, 'r') as f:
-        benefits_config = json.load(f)
-    
-    # Load manual adjustments
-    manual_path = os.path.join(root_dir, 'config/manual_credits.json')
-    manual_adjustments = {}
-    if os.path.exists(manual_path):
-        try:
-            with open(manual_path, 'r') as f:
-                manual_adjustments = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            pass
+    config = config or load_config()
+    rollups = rollups or get_rollups(config, root_dir)
+    benefits_config = rollups.benefits
 
-    # Initialize report structure based on benefits config
-    report = {
-        'monthly_spending': 0,
-        'yearly_spending': 0,
-        'benefits': {card: {benefit: {'spent': 0, 'total': details['total'], 'remaining': details['total']} for benefit, details in card_benefits.items()} for card, card_benefits in benefits_config.items()}
-    }
+    # Load manual adjustments (only re-read when the file changed since the last report)
+    manual_adjustments = get_manual_credits_state(config).get()
 
     now = datetime.now()
     # When running in HA, the timezone might be UTC. For accurate date comparison, let's use naive datetimes.
     now = now.astimezone().replace(tzinfo=None)
 
-    # --- Apply Manual Adjustments First (so they are included in the base) ---
-    def get_period_key(reset_cycle, date_obj):
-        if reset_cycle == 'monthly':
-            return date_obj.strftime('%Y-%m')
-        elif reset_cycle == 'annual':
-            return date_obj.strftime('%Y')
-        elif reset_cycle == 'biannual_jan_jun':
-            period = 1 if 1 <= date_obj.month <= 6 else 2
-            return f"{date_obj.year}-P{period}"
-        return 'all'
+    report = {
+        'monthly_spending': round(rollups.monthly.get(now.strftime('%Y-%m'), 0) / 100, 2),
+        'yearly_spending': round(rollups.yearly.get(now.strftime('%Y'), 0) / 100, 2),
+        'benefits': {}
+    }
 
     for card, card_benefits in benefits_config.items():
+        report['benefits'][card] = {}
         for benefit, details in card_benefits.items():
             reset_cycle = details.get('reset_cycle', 'annual')
             period_key = get_period_key(reset_cycle, now)
+            # Manual adjustments are added on top of the spend found in the ledger
             adj = manual_adjustments.get(card, {}).get(benefit, {}).get(period_key, 0)
-            report['benefits'][card][benefit]['spent'] += adj
+            spent = round(adj + rollups.get_spent(card, benefit, period_key) / 100, 2)
+            total = details['total']
+            report['benefits'][card][benefit] = {'spent': spent, 'total': total, 'remaining': round(max(0, total - spent), 2)}
 
-    if not os.path.exists(transactions_path):
-        return report
-
-    with open(transactions_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                # --- General Spending Calculation ---
-                transaction_date_str = row['date']
-                # Parse the 'YYYY-MM-DD' date string
-                transaction_date = datetime.strptime(transaction_date_str, '%Y-%m-%d')
-
-                if transaction_date.year == now.year:
-                    report['yearly_spending'] += float(row['amount'])
-                    if transaction_date.month == now.month:
-                        report['monthly_spending'] += float(row['amount'])
-
-                # --- Benefit-Specific Calculation ---
-                for card, card_benefits in benefits_config.items():
-                    for benefit, details in card_benefits.items():
-                        for keyword in details['keywords']:
-                            if keyword.lower() in row['merchant'].lower():
-                                # Keyword matched, now check if it's in the current reset period
-                                reset_cycle = details.get('reset_cycle', 'annual')
-                                add_amount = False
+    return report
 
-                                if reset_cycle == 'monthly':
-                                    if transaction_date.month == now.month and transaction_date.year == now.year:
-                                        add_amount = True
-                                elif reset_cycle == 'biannual_jan_jun':
-                                    if get_biannual_period(transaction_date) == get_biannual_period(now) and transaction_date.year == now.year:
-                                        add_amount = True
-                                elif reset_cycle == 'annual':
-                                    if transaction_date.year == now.year:
-                                        add_amount = True
-                                
-                                if add_amount:
-                                    report['benefits'][card][benefit]['spent'] += float(row['amount'])
-                                    # Break keyword loop once a match is found for a benefit
-                                    break
-            
-            except (ValueError, KeyError) as e:
-                # Optional: log parsing errors
-                # print(f"Skipping row due to error: {e}")
-                continue
-    
-    # Round all final values for clean output
-    report['monthly_spending'] = round(report['monthly_spending'], 2)
-    report['yearly_spending'] = round(report['yearly_spending'], 2)
-    for card in report['benefits']:
-        for benefit in report['benefits'][card]:
-            spent = round(report['benefits'][card][benefit]['spent'], 2)
-            total = report['benefits'][card][benefit]['total']
-            report['benefits'][card][benefit]['spent'] = spent
-            report['benefits'][card][benefit]['remaining'] = round(max(0, total - spent), 2)
+def _dollars(cents_by_key):
+    return {key: round(cents / 100, 2) for key, cents in cents_by_key.items()}
 
-    return report
+def calculate_history(config=None):
+    """
+    Spending over every period in the ledger: totals per month and year, per category per
+    month, trailing 12 months, and each benefit's ledger spend per period (without manual
+    credits, which only exist for the periods they were entered in).
+    """
+    config = config or load_config()
+    benefits, _ = load_benefits_file(config, root_dir)
+    aggregates = SpendingAggregates.from_rows(iter_ledger_rows(config, root_dir), benefits)
+    return {
+        'monthly_spending': _dollars(aggregates.monthly_totals()),
+        'yearly_spending': _dollars(aggregates.yearly_totals()),
+        'trailing_12_months': _dollars(aggregates.trailing_12_months()),
+        'category_spending': {month: _dollars(c) for month, c in aggregates.category_by_month().items()},
+        'benefit_usage': {
+            card: {benefit: _dollars(periods) for benefit, periods in card_usage.items()}
+            for card, card_usage in aggregates.benefit_usage().items()
+        },
+    }
 
 def main():
     """Generates and prints a JSON report of spending and benefit progress."""
-    report_data = calculate_spending()
+    if '--history' in sys.argv[1:]:
+        report_data = calculate_history()
+    else:
+        report_data = calculate_spending()
     print(json.dumps(report_data, indent=2))
 
 if __name__ == '__main__':
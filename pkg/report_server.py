@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from pkg.report import calculate_history, calculate_spending, load_config
+from pkg.rollups import get_rollups
+from pkg.store import get_backend, get_db_path
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _encode(data):
+    body = json.dumps(data, indent=2).encode("utf-8")
+    return body, '"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+
+class ReportCache:
+    """
+    The report and its sub-resources, recomputed only when something they depend on changes.
+    Every request costs a few stat() calls: the ledger and benefits.json decide whether the
+    rollups must be brought up to date, while manual_credits.json and the date only need the
+    report re-read from the rollups already in memory. So a new day or month rolls the
+    periods over without touching the ledger. Each resource's ETag is a hash of its own
+    body, so a sensor only sees a change when its value changed, and all resources come
+    from one snapshot that is swapped under the lock.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        paths = config.get("paths", {})
+        if get_backend(config) == "sqlite":
+            self.ledger_path = get_db_path(config, root_dir)
+        else:
+            self.ledger_path = os.path.join(root_dir, paths.get("transactions_csv", "transactions.csv"))
+        self.benefits_path = os.path.join(root_dir, paths.get("benefits", "config/benefits.json"))
+        self.manual_path = os.path.join(root_dir, paths.get("manual_credits", "config/manual_credits.json"))
+        self.lock = threading.Lock()
+        self.rollups = None
+        self.inputs = None
+        self.report = None
+        self.history = None
+        self.encoded = {}
+        self.recomputes = 0
+
+    def _inputs(self):
+        return {
+            "ledger": (_stat(self.ledger_path), _stat(self.benefits_path)),
+            "report": (_stat(self.manual_path), datetime.now().strftime("%Y-%m-%d")),
+        }
+
+    def get_report(self):
+        with self.lock:
+            inputs = self._inputs()
+            if inputs == self.inputs: return self.report
+            if self.rollups is None or inputs["ledger"] != self.inputs["ledger"]:
+                self.rollups = get_rollups(self.config, root_dir)
+                self.history = None
+            self.report = calculate_spending(self.config, self.rollups)
+            self.inputs = inputs
+            self.encoded = {}
+            self.recomputes += 1
+            return self.report
+
+    def get_history(self):
+        """The all-periods history, computed on the first request after each ledger change."""
+        with self.lock:
+            if self.history is None:
+                self.history = calculate_history(self.config)
+            return self.history
+
+    def resolve(self, path):
+        """Returns (body, etag) for a resource path, or None if it does not exist."""
+        report = self.get_report()
+        parts = [unquote(p) for p in path.strip("/").split("/") if p]
+        if parts[:1] == ["report"]: parts = parts[1:]
+        key = "/".join(parts)
+        with self.lock:
+            if report is self.report and key in self.encoded: return self.encoded[key]
+        if not parts:
+            data = report
+        elif parts == ["spending"]:
+            data = {k: report[k] for k in ("monthly_spending", "yearly_spending")}
+        elif parts == ["history"]:
+            data = self.get_history()
+        elif parts[0] == "benefits" and len(parts) <= 3:
+            data = report["benefits"]
+            for part in parts[1:]:
+                data = data.get(part)
+                if data is None: return None
+        else:
+            return None
+        encoded = _encode(data)
+        with self.lock:
+            if report is self.report: self.encoded[key] = encoded
+        return encoded
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """
+    GET /                             the full report (same JSON as pkg/report.py)
+    GET /spending                     monthly and yearly spending
+    GET /history                      spending and benefit usage for every period
+    GET /benefits[/<card>[/<benefit>]] benefit progress
+    """
+    cache = None
+    quiet = True
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def respond(self, send_body):
+        try:
+            found = self.cache.resolve(urlsplit(self.path).path)
+        except Exception as e:
+            self.send_error(500, f"Report failed: {e}")
+            return
+        if found is None:
+            self.send_error(404)
+            return
+        body, etag = found
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        # Clients may keep the body but should ask again, which is cheap thanks to the ETag
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if send_body: self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet: super().log_message(format, *args)
+
+def make_server(config, host=None, port=None, quiet=True):
+    settings = config.get("report_server", {})
+    handler = type("Handler", (ReportHandler,), {"cache": ReportCache(config), "quiet": quiet})
+    server = ThreadingHTTPServer((host or settings.get("host", DEFAULT_HOST), port or settings.get("port", DEFAULT_PORT)), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the spending report over HTTP")
+    parser.add_argument("--host", help="address to bind (default: report_server.host)")
+    parser.add_argument("--port", type=int, help="port to listen on (default: report_server.port)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+    server = make_server(load_config(), args.host, args.port, quiet=not args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Serving the spending report on http://{host}:{port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
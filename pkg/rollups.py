@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+from pkg.aggregate import SpendingAggregates
+from pkg.keyword_matcher import MerchantMatcher
+from pkg.manual_transaction import get_period_key
+from pkg.state import write_json_atomic
+from pkg.store import get_backend, get_db_path, iter_ledger_rows
+
+ROLLUP_VERSION = 1
+
+def _path(config, root_dir, key, default):
+    return os.path.join(root_dir, config.get("paths", {}).get(key, default))
+
+def load_benefits_file(config, root_dir=""):
+    """Returns (benefits config, hash of the file) so rollups can tell when benefits.json changed."""
+    with open(_path(config, root_dir, "benefits", "config/benefits.json"), "rb") as f:
+        raw = f.read()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()
+
+def get_ledger_fingerprint(config, root_dir=""):
+    """Identifies the ledger's current contents without reading it."""
+    if get_backend(config) == "sqlite":
+        db_path = get_db_path(config, root_dir)
+        if not os.path.exists(db_path): return None
+        conn = sqlite3.connect(db_path)
+        try:
+            max_id, count = conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM transactions").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            conn.close()
+        return {"max_id": max_id, "count": count}
+    csv_path = _path(config, root_dir, "transactions_csv", "transactions.csv")
+    if not os.path.exists(csv_path): return None
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+class Rollups:
+    """
+    Spending totals per month ("%Y-%m") and year ("%Y"), and benefit spend per card, benefit
+    and period key (the keys of get_period_key), stored in integer cents.
+    """
+
+    def __init__(self, benefits, benefits_hash, data=None):
+        self.benefits = benefits
+        self.matcher = MerchantMatcher(benefits=benefits)
+        data = data or {}
+        self.benefits_hash = benefits_hash
+        self.ledger = data.get("ledger")
+        self.monthly = data.get("monthly", {})
+        self.yearly = data.get("yearly", {})
+        self.benefit_spend = data.get("benefits", {})
+
+    def add_row(self, row):
+        try:
+            date = datetime.strptime(row['date'], '%Y-%m-%d')
+            cents = int(round(float(row['amount']) * 100))
+        except (ValueError, KeyError, TypeError):
+            return
+        month_key, year_key = row['date'][:7], row['date'][:4]
+        self.monthly[month_key] = self.monthly.get(month_key, 0) + cents
+        self.yearly[year_key] = self.yearly.get(year_key, 0) + cents
+        for card, benefit in self.matcher.match(row.get('merchant', '')).benefits:
+            reset_cycle = self.benefits[card][benefit].get('reset_cycle', 'annual')
+            if reset_cycle not in ('monthly', 'annual', 'biannual_jan_jun'): continue
+            periods = self.benefit_spend.setdefault(card, {}).setdefault(benefit, {})
+            period_key = get_period_key(reset_cycle, date)
+            periods[period_key] = periods.get(period_key, 0) + cents
+
+    def get_spent(self, card, benefit, period_key):
+        return self.benefit_spend.get(card, {}).get(benefit, {}).get(period_key, 0)
+
+    def to_dict(self):
+        return {
+            "version": ROLLUP_VERSION,
+            "benefits_hash": self.benefits_hash,
+            "ledger": self.ledger,
+            "monthly": self.monthly,
+            "yearly": self.yearly,
+            "benefits": self.benefit_spend,
+        }
+
+def load_rollups(config, root_dir=""):
+    path = _path(config, root_dir, "rollups", "rollups.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            try:
+                data = json.load(f)
+                if data.get("version") == ROLLUP_VERSION: return data
+            except: pass
+    return None
+
+def save_rollups(config, rollups, root_dir=""):
+    # report.py, the report server and main.py all save rollups, so each uses its own temp file
+    write_json_atomic(_path(config, root_dir, "rollups", "rollups.json"), rollups.to_dict())
+
+def rebuild_rollups(config, root_dir="", benefits=None, benefits_hash=None):
+    """
+    Recomputes every rollup from the full ledger (needed when benefits.json or history changes).
+    The ledger is grouped as columns rather than fed through add_row() one row at a time.
+    """
+    if benefits is None:
+        benefits, benefits_hash = load_benefits_file(config, root_dir)
+    fingerprint = get_ledger_fingerprint(config, root_dir)
+    rollups = Rollups(benefits, benefits_hash)
+    aggregates = SpendingAggregates.from_rows(iter_ledger_rows(config, root_dir), benefits)
+    rollups.monthly = aggregates.monthly_totals()
+    rollups.yearly = aggregates.yearly_totals()
+    rollups.benefit_spend = aggregates.benefit_usage()
+    rollups.ledger = fingerprint
+    return rollups
+
+def _catch_up_sqlite(config, root_dir, rollups, fingerprint):
+    """Adds rows inserted since the checkpoint. Returns False if rows were deleted meanwhile."""
+    old = rollups.ledger or {}
+    conn = sqlite3.connect(get_db_path(config, root_dir))
+    try:
+        rows = conn.execute(
+            "SELECT date, amount, merchant FROM transactions WHERE id > ? ORDER BY id", (old.get("max_id", 0),)
+        ).fetchall()
+    finally:
+        conn.close()
+    if old.get("count", 0) + len(rows) != fingerprint["count"]:
+        return False
+    for date, amount, merchant in rows:
+        rollups.add_row({"date": date, "amount": amount, "merchant": merchant})
+    return True
+
+def get_rollups(config, root_dir=""):
+    """
+    Returns up-to-date rollups. Rows added to the SQLite store since the checkpoint are
+    folded in incrementally; a changed benefits.json, or a ledger changed by something
+    other than update_rollups(), triggers a full rebuild. The result is saved back.
+    """
+    benefits, benefits_hash = load_benefits_file(config, root_dir)
+    data = load_rollups(config, root_dir)
+    fingerprint = get_ledger_fingerprint(config, root_dir)
+    if data and data.get("benefits_hash") == benefits_hash:
+        rollups = Rollups(benefits, benefits_hash, data)
+        if rollups.ledger == fingerprint:
+            return rollups
+        if get_backend(config) == "sqlite" and fingerprint and rollups.ledger and "max_id" in rollups.ledger:
+            if _catch_up_sqlite(config, root_dir, rollups, fingerprint):
+                rollups.ledger = fingerprint
+                _try_save(config, rollups, root_dir)
+                return rollups
+    rollups = rebuild_rollups(config, root_dir, benefits, benefits_hash)
+    _try_save(config, rollups, root_dir)
+    return rollups
+
+def update_rollups(config, new_rows, previous_fingerprint, history_changed=False):
+    """
+    Called by main.py right after it writes the CSV ledger. new_rows are the rows that
+    were actually added; previous_fingerprint is the ledger fingerprint before the write.
+    """
+    benefits, benefits_hash = load_benefits_file(config)
+    data = load_rollups(config)
+    if history_changed or not data or data.get("benefits_hash") != benefits_hash or data.get("ledger") != previous_fingerprint:
+        rollups = rebuild_rollups(config, benefits=benefits, benefits_hash=benefits_hash)
+    else:
+        rollups = Rollups(benefits, benefits_hash, data)
+        for row in new_rows:
+            rollups.add_row(row)
+        rollups.ledger = get_ledger_fingerprint(config)
+    # The ledger is already written; a failed save only means the next reader rebuilds
+    _try_save(config, rollups, "")
+
+def _try_save(config, rollups, root_dir):
+    try:
+        save_rollups(config, rollups, root_dir)
+    except OSError as e:
+        print(f"Could not save rollups: {e}", file=sys.stderr)
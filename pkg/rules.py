@@ -0,0 +1,222 @@
+"""
+Per-merchant fixes from config/transaction_rules.json; TransactionRules documents the format.
+merchant_contains keywords are found with the same Aho-Corasick automaton as categories.
+rules_state.json records the version of the rules (a SHA-256 of the file) the history was last
+checked against, so a sync only runs the rules over its new transactions, and the whole ledger
+goes through them again only after the file changes or the ledger is edited outside the
+tracker. Splits only apply to new transactions; `python main.py reparse` splits archived ones.
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from pkg.keyword_matcher import KeywordAutomaton
+from pkg.ledger import format_cents, parse_cents
+from pkg.parsers import clean_merchant_name
+from pkg.state import get_state
+
+PREDICATES = ("merchant_contains", "merchant_equals", "merchant_regex")
+ACTIONS = ("rename", "set_amount", "category", "ignore", "split")
+
+def _path(config, root_dir, key, default):
+    return os.path.join(root_dir, config.get("paths", {}).get(key, default))
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+class RuleOutcome:
+    """What the rules do to every transaction of one merchant."""
+    __slots__ = ("merchant", "cents", "category", "ignore", "split", "rules")
+
+    def __init__(self, merchant):
+        self.merchant = merchant    # cleaned and possibly renamed merchant
+        self.cents = None           # fixed amount in cents, or None
+        self.category = None        # forced category, or None
+        self.ignore = False         # the transaction is left out of the ledger
+        self.split = None           # [(merchant, share, cents, category)] parts, or None
+        self.rules = []             # names of the rules that matched
+
+class TransactionRules:
+    """
+    The rules in config/transaction_rules.json, compiled once. Each rule has merchant
+    predicates, all of which must hold, and actions:
+
+        {"name": "gym dues", "merchant_contains": "BAY CLUB", "set_amount": "160.00"}
+        {"merchant_regex": "^AMZN MKTP", "rename": "AMAZON"}
+        {"merchant_equals": "PAYMENT THANK YOU", "ignore": true}
+        {"merchant_contains": ["WHOLEFDS", "TRADER JOE"], "category": "Groceries"}
+        {"merchant_equals": "COSTCO WHSE", "split": [
+            {"share": 0.7}, {"merchant": "COSTCO HOUSEHOLD", "category": "Household"}]}
+
+    Predicates see the merchant after clean_merchant_name. Where several matching rules
+    set the same action, the one listed first wins. Predicates only look at the merchant,
+    so the outcome is computed once per distinct merchant string and memoized for this
+    version of the rules (a hash of the file). Splits only happen to new transactions;
+    the other actions are also re-applied to the history when the rules change.
+    """
+
+    def __init__(self, rules=(), version="none"):
+        self.version = version
+        self.rules = []
+        self.automaton = KeywordAutomaton()
+        self.unindexed = []  # rules without a merchant_contains predicate are checked one by one
+        for index, rule in enumerate(rules):
+            compiled = self._compile(index, rule)
+            self.rules.append(compiled)
+            if rule.get("merchant_contains"):
+                for keyword in _as_list(rule["merchant_contains"]):
+                    self.automaton.add(keyword, index)
+            else:
+                self.unindexed.append(index)
+        self.automaton.build()
+        self.memo = {}
+
+    @staticmethod
+    def _compile(index, rule):
+        name = rule.get("name", f"rule {index + 1}")
+        if not any(rule.get(p) for p in PREDICATES):
+            raise ValueError(f"{name}: needs one of {', '.join(PREDICATES)}")
+        if not any(a in rule for a in ACTIONS):
+            raise ValueError(f"{name}: needs one of {', '.join(ACTIONS)}")
+        unknown = set(rule) - set(PREDICATES) - set(ACTIONS) - {"name"}
+        if unknown:
+            raise ValueError(f"{name}: unknown keys {', '.join(sorted(unknown))}")
+        split = None
+        if rule.get("split"):
+            split = []
+            for part in rule["split"]:
+                share = part.get("share")
+                cents = parse_cents(part["amount"]) if "amount" in part else None
+                split.append((part.get("merchant"), share, cents, part.get("category")))
+            if sum(1 for _, share, cents, _ in split if share is None and cents is None) > 1:
+                raise ValueError(f"{name}: only one split part can take the remainder")
+            if sum(share or 0 for _, share, _, _ in split) > 1:
+                raise ValueError(f"{name}: split shares add up to more than 1")
+            # Parts become separate rows, which the ledger would drop as duplicates if they shared a merchant
+            if len({merchant for merchant, _, _, _ in split}) < len(split):
+                raise ValueError(f"{name}: split parts need distinct merchants (at most one may keep the original)")
+        return {
+            "name": name,
+            "equals": {m.upper() for m in _as_list(rule.get("merchant_equals") or [])},
+            "regex": re.compile(rule["merchant_regex"], re.IGNORECASE) if rule.get("merchant_regex") else None,
+            "rename": rule.get("rename"),
+            "cents": parse_cents(rule["set_amount"]) if rule.get("set_amount") is not None else None,
+            "category": rule.get("category"),
+            "ignore": bool(rule.get("ignore")),
+            "split": split,
+        }
+
+    @classmethod
+    def from_json(cls, raw, version):
+        data = json.loads(raw)
+        return cls(data.get("rules", []) if isinstance(data, dict) else data, version)
+
+    def _matches(self, index, cleaned):
+        rule = self.rules[index]
+        if rule["equals"] and cleaned.upper() not in rule["equals"]: return False
+        if rule["regex"] and not rule["regex"].search(cleaned): return False
+        return True
+
+    def outcome(self, merchant):
+        """The RuleOutcome for a merchant as it appears in an alert or in the ledger."""
+        result = self.memo.get(merchant)
+        if result is None:
+            cleaned = clean_merchant_name(merchant)
+            result = RuleOutcome(cleaned)
+            candidates = set(self.automaton.search(cleaned)) | set(self.unindexed)
+            renamed = False
+            for index in sorted(candidates):
+                if not self._matches(index, cleaned): continue
+                rule = self.rules[index]
+                result.rules.append(rule["name"])
+                if rule["rename"] and not renamed:
+                    result.merchant, renamed = rule["rename"], True
+                if rule["cents"] is not None and result.cents is None: result.cents = rule["cents"]
+                if rule["category"] and result.category is None: result.category = rule["category"]
+                if rule["split"] and result.split is None: result.split = rule["split"]
+                result.ignore = result.ignore or rule["ignore"]
+            self.memo[merchant] = result
+        return result
+
+    def history_fix(self, merchant):
+        """
+        (merchant, cents or None, category or None, ignore) for a row already in the ledger.
+        A split rule's amount is left alone there, since its rows already hold the parts.
+        """
+        result = self.outcome(merchant)
+        return result.merchant, None if result.split else result.cents, result.category, result.ignore
+
+    def apply(self, transaction):
+        """
+        Applies the rules to a new transaction. Returns its ledger rows: none when a rule
+        ignores it, one per part when a rule splits it, else the transaction itself.
+        """
+        result = self.outcome(transaction["merchant"])
+        if result.ignore:
+            print(f"  -> Applied rule: Ignored {result.merchant} ${transaction['amount']} ({', '.join(result.rules)})")
+            return []
+        transaction["merchant"] = result.merchant
+        if result.cents is not None and parse_cents(transaction["amount"]) != result.cents:
+            fixed = format_cents(result.cents)
+            print(f"  -> Applied rule: Adjusted {result.merchant} amount from ${transaction['amount']} to ${fixed}")
+            transaction["amount"] = fixed
+        if result.category: transaction["category"] = result.category
+        if not result.split: return [transaction]
+        total = parse_cents(transaction["amount"])
+        amounts = [cents if cents is not None else round(total * share) if share is not None else None for _, share, cents, _ in result.split]
+        rest = total - sum(a for a in amounts if a is not None)
+        if None in amounts:
+            amounts[amounts.index(None)] = rest
+        elif sum(share or 0 for _, share, _, _ in result.split) == 1:
+            amounts[-1] += rest  # shares that add up to 1 keep the exact total
+        parts = []
+        for (merchant, _, _, category), cents in zip(result.split, amounts):
+            part = dict(transaction, merchant=merchant or result.merchant, amount=format_cents(cents))
+            if category: part["category"] = category
+            parts.append(part)
+        print(f"  -> Applied rule: Split {result.merchant} ${transaction['amount']} into " + ", ".join(f"{p['merchant']} ${p['amount']}" for p in parts))
+        return parts
+
+_loaded = {}
+
+def load_transaction_rules(config, root_dir=""):
+    """
+    Returns the compiled rules, reusing the loaded ones (and their memo) while the file's
+    contents are unchanged. A file that cannot be read or compiled is reported, and the
+    tracker carries on without rules until it is fixed.
+    """
+    path = _path(config, root_dir, "transaction_rules", "config/transaction_rules.json")
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError:
+        raw = None
+    version = hashlib.sha256(raw).hexdigest() if raw is not None else "none"
+    if _loaded.get("path") == path and _loaded.get("version") == version:
+        return _loaded["rules"]
+    try:
+        rules = TransactionRules.from_json(raw, version) if raw is not None else TransactionRules()
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring invalid transaction rules in {path}: {e}")
+        rules = TransactionRules(version=f"invalid:{version}")
+    _loaded.update(path=path, version=version, rules=rules)
+    return rules
+
+def get_rules_state(config, root_dir=""):
+    """Which rules version the ledger history was last brought in line with, and the ledger it produced."""
+    return get_state(_path(config, root_dir, "rules_state", "rules_state.json"), {})
+
+def needs_history_pass(config, rules, fingerprint=None, root_dir=""):
+    """
+    Whether the whole ledger has to go through the rules again: the rules changed since
+    the last pass, or (when a fingerprint is given) the ledger was edited by something
+    other than the tracker since its last write.
+    """
+    state = get_rules_state(config, root_dir).get()
+    if state.get("version") != rules.version: return True
+    return fingerprint is not None and state.get("ledger") != fingerprint
+
+def record_history_pass(config, rules, fingerprint=None, root_dir=""):
+    get_rules_state(config, root_dir).update(lambda data: {"version": rules.version, "ledger": fingerprint})
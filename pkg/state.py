@@ -0,0 +1,123 @@
+import copy
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+_states = {}
+_states_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock shared by every process that writes path (held on path + ".lock")."""
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def temp_path(path):
+    """A temp file next to path that no other process or thread writing path will use."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Writes to a temp file next to path, fsyncs it and renames it over path."""
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class JsonState:
+    """
+    A JSON state file shared between processes. get() serves the parsed data from memory
+    and only re-reads the file when its inode, mtime or size changed (one stat call).
+    update() re-reads under the file lock, applies the change and atomically replaces
+    the file, so concurrent writers never lose each other's changes or leave half a file.
+    """
+
+    def __init__(self, path, default=None, indent=None):
+        self.path = path
+        self.default = {} if default is None else default
+        self.indent = indent
+        self.lock = threading.Lock()
+        self.data = None
+        self.signature = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        signature = self._signature()
+        data = None
+        if signature is not None:
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            except (ValueError, OSError):
+                pass
+        self.data = copy.deepcopy(self.default) if data is None else data
+        self.signature = signature
+
+    def get(self):
+        """Returns the current data. Treat it as read-only; change it through update()."""
+        with self.lock:
+            if self.data is None or self._signature() != self.signature:
+                self._read()
+            return self.data
+
+    def update(self, fn):
+        """
+        Calls fn(data) with the freshest data while holding the file lock. fn either mutates
+        data in place (returns None) or returns a replacement; returning False skips the write.
+        """
+        with self.lock, file_lock(self.path):
+            self._read()
+            result = fn(self.data)
+            if result is False:
+                return self.data
+            if result is not None:
+                self.data = result
+            write_json_atomic(self.path, self.data, indent=self.indent)
+            self.signature = self._signature()
+            return self.data
+
+def get_state(path, default=None, indent=None):
+    """Returns the process-wide JsonState for path, so each file is loaded once per process."""
+    path = os.path.abspath(path)
+    with _states_lock:
+        state = _states.get(path)
+        if state is None:
+            state = _states[path] = JsonState(path, default, indent)
+        return state
+
+class DailyCounter:
+    """A per-day quota counter stored as {"date": "YYYY-MM-DD", "count": n}, safe across processes."""
+
+    def __init__(self, path):
+        self.state = get_state(path)
+
+    def count(self):
+        data = self.state.get()
+        return data.get("count", 0) if data.get("date") == datetime.now().strftime("%Y-%m-%d") else 0
+
+    def try_acquire(self, limit, n=1):
+        """Adds n to today's count unless that would exceed limit. Returns whether it did."""
+        acquired = []
+
+        def consume(data):
+            today = datetime.now().strftime("%Y-%m-%d")
+            count = data.get("count", 0) if data.get("date") == today else 0
+            if count + n > limit: return False
+            acquired.append(True)
+            return {"date": today, "count": count + n}
+        self.state.update(consume)
+        return bool(acquired)
@@ -0,0 +1,154 @@
+import csv
+import os
+import sqlite3
+
+from pkg.state import temp_path
+
+LEDGER_FIELDS = ["date", "amount", "merchant", "category", "cumulative_amount"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    merchant TEXT NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    msg_id TEXT NOT NULL DEFAULT '',
+    UNIQUE (date, amount, merchant, msg_id)
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS idx_transactions_merchant ON transactions (merchant);
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions (category);
+"""
+
+def get_backend(config):
+    """Returns "csv" (default) or "sqlite" from the "storage" section of spend_tracker.json."""
+    return config.get("storage", {}).get("backend", "csv")
+
+def get_db_path(config, root_dir=""):
+    return os.path.join(root_dir, config.get("paths", {}).get("transactions_db", "transactions.db"))
+
+class SqliteStore:
+    """
+    Transaction ledger in SQLite. Appends are O(new rows) inside one transaction, and
+    duplicates are rejected by the unique key instead of a full dedup pass.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def is_empty(self):
+        return self.conn.execute("SELECT NOT EXISTS (SELECT 1 FROM transactions)").fetchone()[0] == 1
+
+    def add_transactions(self, rows):
+        """Inserts rows, skipping ones already stored. Returns the rows actually inserted."""
+        with self.conn:
+            return self._insert(rows)
+
+    def replace_transactions(self, msg_ids, rows):
+        """Deletes the rows of msg_ids and inserts rows in one transaction. Returns the rows inserted."""
+        with self.conn:
+            self.conn.executemany("DELETE FROM transactions WHERE msg_id = ?", [(m,) for m in msg_ids])
+            return self._insert(rows)
+
+    def _insert(self, rows):
+        inserted = []
+        for row in rows:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO transactions (date, amount, merchant, category, msg_id) VALUES (?, ?, ?, ?, ?)",
+                (row["date"], str(row["amount"]), row["merchant"], row.get("category") or "", row.get("msg_id") or "")
+            )
+            if cur.rowcount: inserted.append(row)
+        return inserted
+
+    def import_csv(self, csv_path):
+        """One-time migration of an existing transactions.csv into the database."""
+        with open(csv_path, "r", newline="") as csvfile:
+            rows = [r for r in csv.DictReader(csvfile) if r.get("date")]
+        return len(self.add_transactions(rows))
+
+    def get_latest_date(self):
+        return self.conn.execute("SELECT MAX(date) FROM transactions").fetchone()[0]
+
+    def get_uncategorized_merchants(self):
+        return [r[0] for r in self.conn.execute("SELECT DISTINCT merchant FROM transactions WHERE category IN ('', 'Other')")]
+
+    def set_categories(self, categories):
+        """Fills in categories for merchants that have none (or only 'Other'). Returns the rows changed."""
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET category = ? WHERE merchant = ? AND category IN ('', 'Other') AND category != ?",
+                [(cat, merchant, cat) for merchant, cat in categories.items() if cat]
+            )
+        return self.conn.total_changes - before
+
+    def apply_fixes(self, fix):
+        """
+        Passes every distinct merchant through fix(name), which returns (merchant, amount
+        or None, category or None, ignore), and updates or deletes its rows to match.
+        Returns the number of rows changed.
+        """
+        before = self.conn.total_changes
+        with self.conn:
+            for (old,) in self.conn.execute("SELECT DISTINCT merchant FROM transactions").fetchall():
+                merchant, amount, category, ignore = fix(old)
+                if ignore:
+                    self.conn.execute("DELETE FROM transactions WHERE merchant = ?", (old,))
+                elif merchant != old or amount is not None or category is not None:
+                    # A renamed row that now equals a stored one replaces it rather than failing the unique key
+                    self.conn.execute(
+                        "UPDATE OR REPLACE transactions SET merchant = :new, amount = COALESCE(:amount, amount), "
+                        "category = COALESCE(:category, category) WHERE merchant = :old AND (merchant != :new "
+                        "OR amount != COALESCE(:amount, amount) OR category != COALESCE(:category, category))",
+                        {"old": old, "new": merchant, "amount": amount, "category": category},
+                    )
+        return self.conn.total_changes - before
+
+    def iter_rows(self):
+        """Yields ledger rows in date order with the running cumulative_amount."""
+        cur = self.conn.execute(
+            "SELECT date, amount, merchant, category, msg_id FROM transactions ORDER BY date, id"
+        )
+        total = 0.0
+        for date, amount, merchant, category, msg_id in cur:
+            total += float(amount)
+            yield {"date": date, "amount": amount, "merchant": merchant, "category": category,
+                   "cumulative_amount": round(total, 2), "msg_id": msg_id}
+
+    def export_csv(self, csv_path):
+        """Writes the ledger in the transactions.csv layout used by the uploader and older tools."""
+        tmp_path = temp_path(csv_path)
+        with open(tmp_path, "w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=LEDGER_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.iter_rows())
+        os.replace(tmp_path, csv_path)
+
+def open_store(config, root_dir=""):
+    """Opens the SQLite store, importing transactions.csv the first time it is used."""
+    store = SqliteStore(get_db_path(config, root_dir))
+    csv_path = os.path.join(root_dir, config["paths"]["transactions_csv"])
+    if store.is_empty() and os.path.exists(csv_path):
+        print(f"Imported {store.import_csv(csv_path)} rows from {csv_path} into {store.path}.")
+    return store
+
+def iter_ledger_rows(config, root_dir=""):
+    """Yields ledger rows as dicts from whichever storage backend is configured."""
+    if get_backend(config) == "sqlite" and os.path.exists(get_db_path(config, root_dir)):
+        store = SqliteStore(get_db_path(config, root_dir))
+        try:
+            yield from store.iter_rows()
+        finally:
+            store.close()
+        return
+    csv_path = os.path.join(root_dir, config.get("paths", {}).get("transactions_csv", "transactions.csv"))
+    if not os.path.exists(csv_path):
+        return
+    with open(csv_path, "r", newline="") as csvfile:
+        yield from csv.DictReader(csvfile)
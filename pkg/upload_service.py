@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import os
+import select
+import signal
+import sys
+import time
+from datetime import datetime
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from google.auth.exceptions import GoogleAuthError
+from googleapiclient.errors import HttpError
+
+from pkg.discovery import build_service
+from pkg.rollups import get_ledger_fingerprint
+from pkg.upload_signal import get_socket_path, open_listener
+from pkg.upload_to_sheets import get_credentials, load_config, sync_sheet
+
+def log(message):
+    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {message}", flush=True)
+
+class UploadService:
+    """
+    Long-running uploader. main.py signals it over a UNIX datagram socket whenever the
+    ledger changes; bursts of signals are debounced into a single delta upload. A cheap
+    stat() of the ledger every poll_seconds catches edits made by other tools.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        settings = config.get("upload_service", {})
+        self.debounce_seconds = settings.get("debounce_seconds", 5)
+        self.max_delay_seconds = settings.get("max_delay_seconds", 60)
+        self.poll_seconds = settings.get("poll_seconds", 900)
+        self.retry_seconds = settings.get("retry_seconds", 300)
+        self.sheet = build_service("sheets", "v4", get_credentials(), config).spreadsheets()
+        self.sock = open_listener(config, root_dir)
+        self.fingerprint = None
+
+    def upload(self):
+        self.config = load_config()
+        fingerprint = get_ledger_fingerprint(self.config, root_dir)
+        try:
+            sync_sheet(self.sheet, self.config)
+        except (HttpError, OSError, GoogleAuthError) as err:
+            # Timeouts, dropped connections and failed token refreshes are retried like API errors
+            log(f"Upload failed: {type(err).__name__}: {err}")
+            return False
+        self.fingerprint = fingerprint
+        return True
+
+    def get_timeout(self, now, first_event, last_event, next_poll):
+        if first_event is not None:
+            due = min(last_event + self.debounce_seconds, first_event + self.max_delay_seconds)
+        elif self.poll_seconds:
+            due = next_poll
+        else:
+            return None
+        return max(0, due - now)
+
+    def run(self):
+        log("Upload service started.")
+        # Catch up on anything that changed while the service was not running
+        first_event = last_event = time.monotonic()
+        next_poll = first_event + self.poll_seconds
+        while True:
+            now = time.monotonic()
+            readable, _, _ = select.select([self.sock], [], [], self.get_timeout(now, first_event, last_event, next_poll))
+            now = time.monotonic()
+            if readable:
+                reason = self.sock.recv(1024).decode("utf-8", "replace")
+                log(f"Change signalled: {reason}")
+                if first_event is None: first_event = now
+                last_event = now
+            elif first_event is None and self.poll_seconds and now >= next_poll:
+                next_poll = now + self.poll_seconds
+                if get_ledger_fingerprint(self.config, root_dir) != self.fingerprint:
+                    log("Ledger changed on disk.")
+                    first_event = last_event = now
+
+            if first_event is not None and (now - last_event >= self.debounce_seconds or now - first_event >= self.max_delay_seconds):
+                if self.upload():
+                    first_event = last_event = None
+                else:
+                    # Shift both timestamps so the next attempt comes retry_seconds from now
+                    first_event = last_event = now + self.retry_seconds - self.debounce_seconds
+
+    def close(self):
+        self.sock.close()
+        path = get_socket_path(self.config, root_dir)
+        if os.path.exists(path):
+            os.remove(path)
+
+def main():
+    def request_stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    service = UploadService(load_config())
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        log("Upload service stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import socket
+
+def get_socket_path(config, root_dir=""):
+    settings = config.get("upload_service", {})
+    return os.path.abspath(os.path.join(root_dir, settings.get("socket", "upload_service.sock")))
+
+def notify_upload_service(config, reason="ledger updated"):
+    """Tells a running upload service that the ledger changed. Does nothing if none is listening."""
+    path = get_socket_path(config)
+    if not os.path.exists(path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(reason.encode("utf-8"), path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+def open_listener(config, root_dir=""):
+    """Binds the datagram socket the upload service waits on, replacing a stale one."""
+    path = get_socket_path(config, root_dir)
+    if os.path.exists(path):
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    return sock
@@ -1,11 +1,18 @@
 import os.path
-import csv
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import argparse
+import hashlib
+import sys
+import json
 from googleapiclient.errors import HttpError
 
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from pkg.discovery import build_service
+from pkg.state import write_json_atomic
+from pkg.store import iter_ledger_rows
+
 # Combined scopes for Gmail (to reuse existing credentials) and Sheets
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
@@ -16,16 +23,21 @@ SCOPES = [
 # Replace this with the ID you copied from the URL.
 SPREADSHEET_ID = "14upQxkTP0ZI3cfJTKzH0DcFnerBBvSy2RPy6Posgdow"
 RANGE_NAME = "Transactions!A1"  # Start at the top-left of the Transactions sheet
+# Rows per hash in the upload state; only the rows after the first changed block are resent
+BLOCK_SIZE = 256
 
 def get_credentials():
     """Gets valid user credentials from storage or initiates the OAuth flow."""
+    from google.oauth2.credentials import Credentials
     creds = None
     if os.path.exists("token.json"):
         creds = Credentials.from_authorized_user_file("token.json", SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
+            from google.auth.transport.requests import Request
             creds.refresh(Request())
         else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
             flow = InstalledAppFlow.from_client_secrets_file(
                 "credentials.json", SCOPES
             )
@@ -34,70 +46,169 @@ def get_credentials():
             token.write(creds.to_json())
     return creds
 
-def main():
-    """Reads transaction data from a CSV and uploads it to a Google Sheet."""
-    creds = get_credentials()
-    
-    try:
-        service = build("sheets", "v4", credentials=creds)
-        sheet = service.spreadsheets()
-
-        # --- Read data from CSV ---
-        transactions_path = 'transactions.csv'
-        if not os.path.exists(transactions_path):
-            print("transactions.csv not found. Nothing to upload.")
-            return
-
-        values_to_upload = []
-        with open(transactions_path, 'r') as f:
-            reader = csv.DictReader(f)
-            header = reader.fieldnames
-            rows = list(reader)
-            
-            # Sort rows by date
-            rows.sort(key=lambda x: x['date'])
-            
-            # Recalculate cumulative amount to ensure consistency
-            running_total = 0.0
-            for row in rows:
-                running_total += float(row['amount'])
-                row['cumulative_amount'] = round(running_total, 2)
-            
-            # Explicitly define headers to ensure they appear in Sheets
-            display_headers = ["Date", "Amount", "Merchant", "Category", "Cumulative Amount"]
-            values_to_upload.append(display_headers)
-            
-            # Use original keys to extract values from dicts
-            data_keys = ["date", "amount", "merchant", "category", "cumulative_amount"]
-            for row in rows:
-                values_to_upload.append([row.get(k, '') for k in data_keys])
-
-        if len(values_to_upload) <= 1:
-            print("No transaction data to upload.")
-            return
-
-        # --- Clear the existing sheet data ---
-        print("Clearing existing data from Transactions sheet...")
-        sheet.values().clear(
-            spreadsheetId=SPREADSHEET_ID, range="Transactions!A1:Z"
-        ).execute()
+def load_config():
+    config_path = os.path.join(root_dir, "config/spend_tracker.json")
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            return json.load(f)
+    return {}
 
-        # --- Write the new data to the sheet ---
-        body = {"values": values_to_upload}
-        print(f"Uploading {len(values_to_upload)} rows to Google Sheet...")
-        result = (
-            sheet.values()
-            .update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=RANGE_NAME,
-                valueInputOption="USER_ENTERED",
-                body=body,
-            )
-            .execute()
+def build_sheet_values(config):
+    """Returns the rows for the Transactions sheet (header first), sorted with cumulative totals."""
+    values_to_upload = []
+    rows = list(iter_ledger_rows(config, root_dir))
+    if not rows:
+        return values_to_upload
+
+    # Sort rows by date
+    rows.sort(key=lambda x: x['date'])
+
+    # Recalculate cumulative amount to ensure consistency
+    running_total = 0.0
+    for row in rows:
+        running_total += float(row['amount'])
+        row['cumulative_amount'] = round(running_total, 2)
+
+    # Explicitly define headers to ensure they appear in Sheets
+    display_headers = ["Date", "Amount", "Merchant", "Category", "Cumulative Amount"]
+    values_to_upload.append(display_headers)
+
+    # Use original keys to extract values from dicts
+    data_keys = ["date", "amount", "merchant", "category", "cumulative_amount"]
+    for row in rows:
+        values_to_upload.append([row.get(k, '') for k in data_keys])
+    return values_to_upload
+
+def get_state_path(config):
+    return os.path.join(root_dir, config.get("paths", {}).get("sheets_upload_state", "sheets_upload_state.json"))
+
+def load_upload_state(config):
+    path = get_state_path(config)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            try: return json.load(f)
+            except: pass
+    return {}
+
+def save_upload_state(config, state):
+    write_json_atomic(get_state_path(config), state)
+
+def hash_rows(rows):
+    return hashlib.sha1(json.dumps(rows).encode("utf-8")).hexdigest()[:16]
+
+def build_upload_state(values):
+    """Summarizes what is on the sheet: one hash per full block of rows plus per-row hashes for the tail."""
+    full_blocks = len(values) // BLOCK_SIZE
+    return {
+        "spreadsheet_id": SPREADSHEET_ID,
+        "header": values[0],
+        "row_count": len(values),
+        "block_hashes": [hash_rows(values[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]) for i in range(full_blocks)],
+        "tail_hashes": [hash_rows(row) for row in values[full_blocks * BLOCK_SIZE:]],
+    }
+
+def find_first_changed_row(state, values):
+    """Returns the index of the first row that differs from the last upload, or None if unknown."""
+    if state.get("spreadsheet_id") != SPREADSHEET_ID or "row_count" not in state:
+        return None
+    for i, block_hash in enumerate(state["block_hashes"]):
+        if hash_rows(values[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]) != block_hash:
+            return i * BLOCK_SIZE
+    start = len(state["block_hashes"]) * BLOCK_SIZE
+    for offset, row_hash in enumerate(state["tail_hashes"]):
+        index = start + offset
+        if index >= len(values) or hash_rows(values[index]) != row_hash:
+            return index
+    return state["row_count"]
+
+def upload_full(sheet, values):
+    # --- Clear the existing sheet data ---
+    print("Clearing existing data from Transactions sheet...")
+    sheet.values().clear(
+        spreadsheetId=SPREADSHEET_ID, range="Transactions!A1:Z"
+    ).execute()
+
+    # --- Write the new data to the sheet ---
+    body = {"values": values}
+    print(f"Uploading {len(values)} rows to Google Sheet...")
+    result = (
+        sheet.values()
+        .update(
+            spreadsheetId=SPREADSHEET_ID,
+            range=RANGE_NAME,
+            valueInputOption="USER_ENTERED",
+            body=body,
         )
+        .execute()
+    )
+    print(f"{result.get('updatedCells')} cells updated.")
+
+def sync_sheet(sheet, config, full=False):
+    """
+    Brings the Transactions sheet up to date with the ledger, sending only what changed
+    since the last upload: new rows are written after the last uploaded row, rows changed
+    after an unchanged prefix are rewritten in place, and only a changed header (or missing
+    upload state) means clearing and rewriting everything. Every write goes to a fixed
+    range and the state is saved right after it, so a run that dies in between is simply
+    repeated by the next one instead of adding the same rows twice.
+    """
+    values = build_sheet_values(config)
+    if len(values) <= 1:
+        print("No transaction data to upload.")
+        return
+
+    state = {} if full else load_upload_state(config)
+    first_changed = find_first_changed_row(state, values)
+    old_count = state.get("row_count", 0)
+
+    if first_changed is None or values[0] != state.get("header"):
+        upload_full(sheet, values)
+    elif first_changed == old_count == len(values):
+        print("Transactions sheet is already up to date.")
+        return
+    elif first_changed == old_count:
+        new_rows = values[old_count:]
+        print(f"Appending {len(new_rows)} new rows to Google Sheet...")
+        # values.append would add the rows again if the state below never got saved
+        result = sheet.values().update(
+            spreadsheetId=SPREADSHEET_ID,
+            range=f"Transactions!A{old_count + 1}",
+            valueInputOption="USER_ENTERED",
+            body={"values": new_rows},
+        ).execute()
         print(f"{result.get('updatedCells')} cells updated.")
-        print("Upload complete.")
+    else:
+        if len(values) < old_count:
+            # The ledger shrank (e.g. after a dedup), so drop the rows that are no longer there
+            sheet.values().clear(
+                spreadsheetId=SPREADSHEET_ID, range=f"Transactions!A{len(values) + 1}:Z"
+            ).execute()
+        changed_rows = values[first_changed:]
+        if changed_rows:
+            print(f"Rewriting {len(changed_rows)} rows from row {first_changed + 1} onwards...")
+            result = sheet.values().batchUpdate(
+                spreadsheetId=SPREADSHEET_ID,
+                body={
+                    "valueInputOption": "USER_ENTERED",
+                    "data": [{"range": f"Transactions!A{first_changed + 1}", "values": changed_rows}],
+                },
+            ).execute()
+            print(f"{result.get('totalUpdatedCells')} cells updated.")
 
+    save_upload_state(config, build_upload_state(values))
+    print("Upload complete.")
+
+def main():
+    """Reads transaction data from the ledger and uploads what changed to a Google Sheet."""
+    parser = argparse.ArgumentParser(description="Upload transactions to Google Sheets")
+    parser.add_argument("--full", action="store_true", help="clear the sheet and rewrite every row")
+    args = parser.parse_args()
+    creds = get_credentials()
+
+    try:
+        config = load_config()
+        service = build_service("sheets", "v4", creds, config)
+        sync_sheet(service.spreadsheets(), config, full=args.full)
     except HttpError as err:
         print(err)
 
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# Navigate to the script's directory
+cd "$(dirname "$0")/.."
+
+# Serves the report JSON to Home Assistant; this loop only restarts it if it ever exits.
+while true; do
+    echo "$(date): Starting report server." >> report_server.log
+    ./venv/bin/python -u pkg/report_server.py >> report_server.log 2>> report_server.err
+    echo "$(date): Report server exited with status $?. Restarting in 60 seconds." >> report_server.err
+    sleep 60
+done
@@ -3,11 +3,11 @@
 # Navigate to the script's directory
 cd "$(dirname "$0")/.."
 
-# Loop to run the script periodically
+# main.py's daemon mode keeps the Gmail client, parsers and caches in memory and
+# schedules its own sync cycles; this loop only restarts it if it ever exits.
 while true; do
-    echo "Running Gmail Spending Tracker..."
-    # Activate virtual environment and run the script
-    ./venv/bin/python main.py >> spending_tracker.log 2>> spending_tracker.err
-    echo "Script finished. Sleeping for 1 hour."
-    sleep 3600
+    echo "Starting Gmail Spending Tracker daemon..."
+    ./venv/bin/python -u main.py daemon >> spending_tracker.log 2>> spending_tracker.err
+    echo "Daemon exited. Restarting in 60 seconds."
+    sleep 60
 done